@@ -0,0 +1,139 @@
+"""
+Upstream Circuit Breaker
+
+Stops the reverse proxy from tying up Flask threads on a remote server
+that is down. After enough consecutive failures (or slow connects) the
+circuit opens and proxied calls fail at once; a background probe checks
+the server and closes the circuit when it answers again.
+"""
+
+import threading
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a background half-open probe"""
+
+    def __init__(self, probe, failure_threshold=5, slow_connect_ms=3000, slow_threshold=3,
+                 open_seconds=5.0, max_open_seconds=60.0, max_transitions=20):
+        """
+        Args:
+            probe: Callable that raises (or returns False) if the server is still down
+            failure_threshold: Consecutive failed calls that open the circuit
+            slow_connect_ms: A TCP/TLS connect slower than this counts as slow
+            slow_threshold: Consecutive slow connects that open the circuit
+            open_seconds: First wait before probing; doubles up to max_open_seconds
+        """
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.slow_connect_ms = slow_connect_ms
+        self.slow_threshold = slow_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+
+        self.state = CLOSED
+        self.since = time.time()
+        self.failures = 0
+        self.slow_connects = 0
+        self.last_error = None
+        self.last_connect_ms = None
+        self.next_probe_at = None
+        self.rejected = 0
+        self.transitions = deque(maxlen=max_transitions)
+
+        self._lock = threading.Lock()
+        self._delay = open_seconds
+        self._prober = None
+
+    def allow(self):
+        """False while the circuit is open: fail fast"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            if self.state == CLOSED and self.failures >= self.failure_threshold:
+                self._trip(f"{self.failures} consecutive failures: {error}")
+
+    def record_connect(self, elapsed_ms):
+        """Called by the pool's connection class after every new connect"""
+        with self._lock:
+            self.last_connect_ms = round(elapsed_ms, 1)
+            if elapsed_ms < self.slow_connect_ms:
+                self.slow_connects = 0
+                return
+            self.slow_connects += 1
+            if self.state == CLOSED and self.slow_connects >= self.slow_threshold:
+                self._trip(f"{self.slow_connects} slow connects ({elapsed_ms:.0f} ms)")
+
+    def _set_state(self, state, reason):
+        # Called with self._lock held
+        now = time.time()
+        self.transitions.append({"from": self.state, "to": state, "reason": reason, "at": now})
+        print(f"🔌 Upstream circuit: {self.state} → {state} ({reason})")
+        self.state = state
+        self.since = now
+
+    def _trip(self, reason):
+        # Called with self._lock held
+        self._set_state(OPEN, reason)
+        self._delay = self.open_seconds
+        self.next_probe_at = time.time() + self._delay
+        if self._prober is None or not self._prober.is_alive():
+            self._prober = threading.Thread(target=self._probe_loop, name="upstream-probe", daemon=True)
+            self._prober.start()
+
+    def _probe_loop(self):
+        while True:
+            with self._lock:
+                wait = max(0.0, self.next_probe_at - time.time())
+            time.sleep(wait)
+
+            with self._lock:
+                self._set_state(HALF_OPEN, "probing")
+            try:
+                ok = self.probe() is not False
+                error = None
+            except Exception as e:
+                ok = False
+                error = e
+
+            with self._lock:
+                if ok:
+                    self.failures = 0
+                    self.slow_connects = 0
+                    self.next_probe_at = None
+                    self._set_state(CLOSED, "probe succeeded")
+                    return
+                self.last_error = str(error) if error else "probe failed"
+                self._delay = min(self.max_open_seconds, self._delay * 2)
+                self.next_probe_at = time.time() + self._delay
+                self._set_state(OPEN, f"probe failed, next in {self._delay:.0f}s")
+
+    def get_status(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "since": self.since,
+                "consecutive_failures": self.failures,
+                "slow_connects": self.slow_connects,
+                "last_connect_ms": self.last_connect_ms,
+                "last_error": self.last_error,
+                "rejected": self.rejected,
+                "next_probe_in": round(max(0.0, self.next_probe_at - time.time()), 1) if self.next_probe_at else None,
+                "transitions": list(self.transitions),
+            }
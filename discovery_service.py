@@ -0,0 +1,268 @@
+"""
+Background Printer Discovery Service
+
+Keeps a cache of known printers on disk (printer_cache.json next to
+config.json) and refreshes it at low priority in the background. The
+settings scan is answered from the cache right away; stale transports are
+re-scanned behind the response (stale-while-revalidate).
+
+It also watches the configured LAN printer: when it stops answering and
+its MAC address shows up under a new IP in the ARP table (DHCP renewal),
+the address is fixed without a full rescan.
+"""
+
+import ipaddress
+import json
+import os
+import threading
+import time
+
+from printer_discovery import DiscoverySession, default_scan_concurrency, read_neighbor_table, scan_hosts
+from printer_manager import RAW_PRINT_PORT
+
+
+def _lower_thread_priority():
+    # Linux schedules threads as tasks, so one thread can be niced on its own
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except (AttributeError, OSError):
+        pass
+
+
+class DiscoveryService:
+    """Long-lived printer discovery with a persistent device cache"""
+
+    BACKGROUND_TRANSPORTS = ("lan", "usb")
+    # How long a scan waits on an empty cache (a Bluetooth inquiry takes ~6 s)
+    COLD_WAIT = {"lan": 3.0, "usb": 3.0, "bluetooth": 10.0}
+
+    def __init__(self, cache_path, get_settings, is_connected=None, on_address_changed=None,
+                 refresh_interval=600.0, stale_after=120.0, check_interval=30.0,
+                 max_age=7 * 24 * 3600):
+        """
+        Args:
+            cache_path: JSON cache file (kept next to config.json)
+            get_settings: Callable returning the printer config dict
+            is_connected: Callable telling whether the printer is connected
+            on_address_changed: Callback(old_address, new_address) after a DHCP move
+            refresh_interval: Background refresh period per transport in seconds
+            stale_after: Age after which a scan request triggers a refresh
+            check_interval: How often the configured printer is checked
+            max_age: Printers not seen for this long are dropped from the cache
+        """
+        self.cache_path = cache_path
+        self.get_settings = get_settings
+        self.is_connected = is_connected or (lambda: True)
+        self.on_address_changed = on_address_changed
+        self.refresh_interval = refresh_interval
+        self.stale_after = stale_after
+        self.check_interval = check_interval
+        self.max_age = max_age
+
+        self._lock = threading.Lock()
+        self._entries = {}      # "transport:address" -> entry
+        self._refreshed = {}    # transport -> time of the last finished refresh
+        self._refreshing = {}   # transport -> threading.Event set when it finishes
+        self._wake = threading.Event()
+        self._stats = {"hits": 0, "stale_hits": 0, "cold_misses": 0, "refreshes": 0, "address_fixes": 0}
+        self._load()
+
+    # ----------------------------------------------------------- persistence
+
+    def _load(self):
+        try:
+            with open(self.cache_path, "r") as f:
+                data = json.load(f)
+            self._entries = data.get("printers", {})
+            self._refreshed = data.get("refreshed", {})
+            print(f"📂 Printer cache: {len(self._entries)} known printer(s)")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Printer cache unreadable, starting empty: {e}")
+
+    def _save(self):
+        with self._lock:
+            data = {"printers": dict(self._entries), "refreshed": dict(self._refreshed)}
+        tmp_path = self.cache_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"⚠️ Could not save printer cache: {e}")
+
+    # ----------------------------------------------------------------- cache
+
+    def _upsert(self, event):
+        key = f"{event['transport']}:{event['address']}"
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key, {"first_seen": now})
+            entry.update({
+                "transport": event["transport"],
+                "address": event["address"],
+                "label": event.get("label") or event["address"],
+                "name": event.get("name") or entry.get("name"),
+                "brand": event.get("brand") or entry.get("brand"),
+                "mac": event.get("mac") or entry.get("mac"),
+                "rtt_ms": event.get("rtt_ms", entry.get("rtt_ms")),
+                "last_seen": now,
+            })
+            self._entries[key] = entry
+
+    def _prune(self):
+        cutoff = time.time() - self.max_age
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e.get("last_seen", 0) < cutoff]:
+                del self._entries[key]
+
+    def printers(self, transport):
+        """
+        Cached printers for one transport, most recently seen first.
+
+        Returns immediately; a stale transport is refreshed in the
+        background. Only an empty cache waits (see ``COLD_WAIT``).
+        """
+        with self._lock:
+            age = time.time() - self._refreshed.get(transport, 0)
+            cold = not any(e["transport"] == transport for e in self._entries.values())
+
+        if cold:
+            self._stats["cold_misses"] += 1
+            self.refresh(transport).wait(self.COLD_WAIT.get(transport, 3.0))
+        elif age > self.stale_after:
+            self._stats["stale_hits"] += 1
+            self.refresh(transport)
+        else:
+            self._stats["hits"] += 1
+
+        with self._lock:
+            entries = [e for e in self._entries.values() if e["transport"] == transport]
+        entries.sort(key=lambda e: (e.get("brand") is None, -e.get("last_seen", 0)))
+        return entries
+
+    # --------------------------------------------------------------- refresh
+
+    def refresh(self, transport, low_priority=False):
+        """Start refreshing one transport; returns an Event set when done"""
+        with self._lock:
+            done = self._refreshing.get(transport)
+            if done is not None:
+                return done
+            done = self._refreshing[transport] = threading.Event()
+        threading.Thread(
+            target=self._refresh, args=(transport, done, low_priority),
+            name=f"discovery-refresh-{transport}", daemon=True
+        ).start()
+        return done
+
+    def _refresh(self, transport, done, low_priority):
+        if low_priority:
+            _lower_thread_priority()
+        started = time.monotonic()
+        found = 0
+        # Fewer sockets in flight for background sweeps
+        session = DiscoverySession([transport], concurrency=min(64, default_scan_concurrency()) if low_priority else None).start()
+        try:
+            for event in session.iter_events():
+                if event and event["type"] == "printer":
+                    self._upsert(event)
+                    found += 1
+                elif event and event["type"] == "error":
+                    print(f"⚠️ Discovery refresh ({transport}): {event['error']}")
+            with self._lock:
+                self._refreshed[transport] = time.time()
+                self._stats["refreshes"] += 1
+            self._prune()
+            self._save()
+            print(f"🗂️ Printer cache: {transport} refreshed, {found} printer(s) "
+                  f"in {time.monotonic() - started:.1f}s")
+        finally:
+            with self._lock:
+                self._refreshing.pop(transport, None)
+            done.set()
+
+    # ------------------------------------------------------------ DHCP moves
+
+    def _configured_mac(self, address, neighbors):
+        mac = neighbors.get(address)
+        with self._lock:
+            entry = self._entries.get(f"lan:{address}")
+            if entry is not None and mac and entry.get("mac") != mac:
+                entry["mac"] = mac
+            return mac or (entry.get("mac") if entry else None)
+
+    def check_configured_printer(self):
+        """
+        Follow the configured LAN printer to a new IP via its MAC address.
+
+        Returns the new address, or None if nothing changed.
+        """
+        settings = self.get_settings() or {}
+        address = settings.get("address")
+        if settings.get("type") != "lan" or not address:
+            return None
+        try:
+            ipaddress.IPv4Address(address)
+        except ValueError:
+            return None
+
+        neighbors = dict(read_neighbor_table())
+        mac = self._configured_mac(address, neighbors)
+        if not mac or self.is_connected():
+            return None
+
+        moved_to = [ip for ip, m in neighbors.items() if m == mac and ip != address]
+        if not moved_to:
+            return None
+        new_address = moved_to[0]
+        if not scan_hosts([new_address], [RAW_PRINT_PORT], timeout=1.0):
+            return None
+
+        print(f"🔁 Printer {mac} moved: {address} → {new_address} (DHCP)")
+        with self._lock:
+            entry = self._entries.pop(f"lan:{address}", None)
+            if entry is not None:
+                entry.update({"address": new_address, "label": entry["label"].replace(address, new_address, 1),
+                              "last_seen": time.time()})
+                self._entries[f"lan:{new_address}"] = entry
+            self._stats["address_fixes"] += 1
+        self._save()
+        if self.on_address_changed:
+            self.on_address_changed(address, new_address)
+        return new_address
+
+    # ------------------------------------------------------------------- run
+
+    def start(self):
+        threading.Thread(target=self._run, name="discovery-service", daemon=True).start()
+        return self
+
+    def _run(self):
+        _lower_thread_priority()
+        while True:
+            try:
+                self.check_configured_printer()
+            except Exception as e:
+                print(f"⚠️ Printer address check failed: {e}")
+
+            now = time.time()
+            for transport in self.BACKGROUND_TRANSPORTS:
+                if now - self._refreshed.get(transport, 0) > self.refresh_interval:
+                    self.refresh(transport, low_priority=True)
+
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+
+    def wake(self):
+        """Run the address check now (e.g. after a print failure)"""
+        self._wake.set()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["printers"] = len(self._entries)
+            stats["refreshed"] = {t: round(time.time() - at) for t, at in self._refreshed.items()}
+            stats["refreshing"] = list(self._refreshing)
+        return stats
@@ -0,0 +1,357 @@
+"""
+Compiled ESC/POS Text Encoder
+
+One ``EscPosEncoder`` per (brand, codepage, width), built once and
+reused for every job:
+
+- a ``str.translate`` table maps emoji and typographic symbols to
+  printable text; characters the printer codepage cannot show get a
+  fallback (accents stripped, "EUR", "?") that is computed on first use
+  and then memoized in the table
+- the table is compiled into a 256-byte ``bytes.translate`` map for the
+  Latin-1 range, so typical receipts (ASCII plus å/ä/ö) are encoded with
+  two C passes instead of the much slower charmap codec; runs of wider
+  characters (emoji, "…", "€") go through the translate table, and
+  their bytes are memoized per run
+- the init / charset / codepage preamble and the feed / cut trailer are
+  built once
+- a job is assembled with a single allocation
+- runs of characters the pinned codepage lacks (Turkish, Greek, Polish,
+  Cyrillic ...) switch with ``ESC t n`` to a codepage from the brand's
+  ``CODEPAGE_SUPPORT`` table that prints them exactly, and back; the
+  choice is memoized per run
+- lines with characters that have no printable fallback (Persian,
+  Arabic, Greek, ...) are sent as raster images (``raster_text``) when
+  Pillow and NumPy are installed
+"""
+
+import codecs
+import threading
+import unicodedata
+
+from raster_text import get_rasterizer
+
+ESC = b'\x1b'
+GS = b'\x1d'
+
+SUPPORTED_CODEPAGES = {
+    "default": b'\x12',   # CP858
+    "epson": b'\x02',     # CP850
+    "star": b'\x12',      # CP858
+    "hprt": b'\x12',      # CP858 (tested OK)
+    "xprinter": b'\x12',  # CP858
+    "bixolon": b'\x02',   # CP850
+}
+
+# ESC t n -> Python codec
+CODEPAGE_CODECS = {
+    b'\x12': "cp858",
+    b'\x02': "cp850",
+    b'\x00': "cp437",
+    b'\x10': "cp1252",
+}
+
+# ESC t n -> codec per brand, cheapest first. Runs the pinned codepage
+# cannot print exactly switch to the first of these that can. "default"
+# covers brands without their own entry: ESC t numbering differs between
+# vendors, so it only has the pinned page; other brands' tables come from
+# "printer_codepages" in config.json.
+CODEPAGE_SUPPORT = {
+    "default": (
+        (b'\x12', "cp858"),
+    ),
+    "epson": (
+        (b'\x02', "cp850"), (b'\x13', "cp858"), (b'\x10', "cp1252"), (b'\x12', "cp852"),
+        (b'\x0d', "cp857"), (b'\x0e', "cp737"), (b'\x2d', "cp1250"), (b'\x2e', "cp1251"),
+        (b'\x2f', "cp1253"), (b'\x30', "cp1254"), (b'\x11', "cp866"), (b'\x05', "cp865"),
+        (b'\x03', "cp860"), (b'\x00', "cp437"),
+    ),
+    "bixolon": (
+        (b'\x02', "cp850"), (b'\x13', "cp858"), (b'\x10', "cp1252"), (b'\x12', "cp852"),
+        (b'\x11', "cp866"), (b'\x05', "cp865"), (b'\x03', "cp860"), (b'\x00', "cp437"),
+    ),
+}
+
+# Emoji and symbols on the order page that receipts should not show as "?"
+SYMBOL_MAP = {
+    '🚚': '', '✔': 'OK', '\ufe0f': '', '🍕': '*', '🎊': '', '🧾': '',
+    '━': '-', '¨': '~', '…': '...',
+}
+
+# Tried before giving up on a character the codepage lacks
+FALLBACK_MAP = {
+    '‘': "'", '’': "'", '‚': "'", '“': '"', '”': '"', '„': '"',
+    '–': '-', '—': '-', '―': '-', '−': '-', '•': '*', '·': '.',
+    '\u00a0': ' ', '\u2009': ' ', '\u200b': '', '\u200c': '', '\u200d': '',
+    '€': 'EUR', '™': 'TM', '×': 'x', '→': '->', '←': '<-',
+}
+
+FEED_LINES = 4
+
+# Characters per line at Font A
+COLUMNS = {58: 32, 80: 48}
+
+MAX_CACHED_RUNS = 4096
+MAX_CACHED_CHARS = 4096
+
+_WIDE_RUNS = threading.local()
+
+
+def _record_wide_run(exc):
+    """Encode error handler: note a run of non-Latin-1 characters and skip it"""
+    _WIDE_RUNS.runs.append((exc.start, exc.end))
+    return "", exc.end
+
+
+codecs.register_error("escpos.wide_runs", _record_wide_run)
+
+
+class _TranslationTable(dict):
+    """Code point -> printable replacement, filled in on first lookup"""
+
+    def __init__(self, codec):
+        super().__init__({ord(k): v for k, v in SYMBOL_MAP.items()})
+        self.codec = codec
+
+    def _printable(self, text):
+        try:
+            text.encode(self.codec)
+            return True
+        except UnicodeEncodeError:
+            return False
+
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        if self._printable(char):
+            value = char
+        elif char in FALLBACK_MAP and self._printable(FALLBACK_MAP[char]):
+            value = FALLBACK_MAP[char]
+        else:
+            # "ł" -> "l", "ő" -> "o", ligatures and full-width forms -> ASCII
+            stripped = "".join(c for c in unicodedata.normalize("NFKD", char) if not unicodedata.combining(c))
+            value = stripped if stripped and self._printable(stripped) else "?"
+        self[codepoint] = value
+        return value
+
+
+class EscPosEncoder:
+    """Encodes receipt text into a complete ESC/POS job"""
+
+    def __init__(self, brand, codepage=b'\x12', width=80):
+        self.brand = brand
+        self.codepage = codepage
+        self.width = width
+        self.columns = COLUMNS.get(width, 48)
+        self.codec = CODEPAGE_CODECS.get(codepage, "cp858")
+        self.table = _TranslationTable(self.codec)
+        self._runs = {}
+        self._pages_for = {}
+        self._rasterizer = None
+        self._compile()
+        # Pinned codepage first, then the brand's other codepages
+        support = CODEPAGE_SUPPORT.get(brand, CODEPAGE_SUPPORT["default"])
+        self.pages = ((codepage, self.codec),) + tuple(p for p in support if p[0] != codepage)
+        self.switches = tuple(ESC + b't' + n for n, _ in self.pages)
+        charset_sweden = ESC + b'R' + b'\x06'
+        self.preamble = ESC + b'@' + charset_sweden + self.switches[0]
+        self.trailer = b'\n' * FEED_LINES + GS + b'V' + b'\x00'
+
+    def _compile(self):
+        """256-byte map for the Latin-1 range, or None if a character there needs more than one byte"""
+        latin1 = bytearray(256)
+        for codepoint in range(256):
+            encoded = self.table[codepoint].encode(self.codec)
+            if len(encoded) != 1:
+                self._latin1 = None
+                return
+            latin1[codepoint] = encoded[0]
+        self._latin1 = bytes(latin1)
+
+    def _exact_pages(self, char):
+        """Indexes into ``pages`` that print ``char`` as itself; () keeps the table's replacement"""
+        pages = self._pages_for.get(char)
+        if pages is None:
+            if char in SYMBOL_MAP:
+                pages = ()  # emoji and decorations are always replaced
+            else:
+                # FALLBACK_MAP characters ("€", "–") too: printing them exactly beats "EUR"
+                pages = []
+                for i, (_, codec) in enumerate(self.pages):
+                    try:
+                        char.encode(codec)
+                        pages.append(i)
+                    except UnicodeEncodeError:
+                        pass
+                pages = tuple(pages)
+            if len(self._pages_for) >= MAX_CACHED_CHARS:
+                self._pages_for.clear()
+            self._pages_for[char] = pages
+        return pages
+
+    def _plan_run(self, run):
+        """
+        Split a run into (page index, bytes) segments: stay on the current
+        codepage while it fits, otherwise take the one that covers the
+        longest stretch (ties go to the cheaper page). Characters no
+        codepage has are translated on the pinned one.
+        """
+        segments = []
+        lossy = False
+        current = 0
+        i = 0
+        while i < len(run):
+            pages = self._exact_pages(run[i])
+            j = i + 1
+            if not pages:
+                while j < len(run) and not self._exact_pages(run[j]):
+                    j += 1
+                translated = run[i:j].translate(self.table)
+                lossy = lossy or translated.count("?") > run[i:j].count("?")
+                page, data = 0, translated.encode(self.codec)
+            else:
+                best, best_end = None, i
+                for page in ((current,) if current in pages else ()) + pages:
+                    end = i + 1
+                    while end < len(run) and page in self._exact_pages(run[end]):
+                        end += 1
+                    if end > best_end:
+                        best, best_end = page, end
+                    if page == current:
+                        break  # no switch needed: cheapest by definition
+                page, j = best, best_end
+                data = run[i:j].encode(self.pages[page][1])
+            if segments and segments[-1][0] == page:
+                segments[-1] = (page, segments[-1][1] + data)
+            else:
+                segments.append((page, data))
+            current = page
+            i = j
+        return tuple(segments), lossy
+
+    def _encode_run(self, run):
+        """((page index, bytes) segments, lossy) for a run of non-Latin-1 characters, memoized"""
+        entry = self._runs.get(run)
+        if entry is None:
+            entry = self._plan_run(run)
+            if len(self._runs) >= MAX_CACHED_RUNS:
+                self._runs.clear()
+            self._runs[run] = entry
+        return entry
+
+    def _encode_text(self, text):
+        """(codepage bytes, lossy) - lossy if a character had no printable fallback"""
+        if text.isascii():
+            return text.encode("ascii"), False
+        if self._latin1 is None:
+            translated = text.translate(self.table)
+            return translated.encode(self.codec), translated.count("?") > text.count("?")
+
+        # One C pass; wider characters are skipped and their positions recorded
+        runs = _WIDE_RUNS.runs = []
+        body = text.encode("latin-1", "escpos.wide_runs").translate(self._latin1)
+        if not runs:
+            return body, False
+        parts = []
+        lossy = False
+        current = 0
+        pos = 0
+        skipped = 0
+        for start, end in runs:
+            cut = start - skipped
+            gap = body[pos:cut]
+            if current and not gap.isascii():
+                parts.append(self.switches[0])  # ASCII is the same on every codepage
+                current = 0
+            parts.append(gap)
+            segments, run_lossy = self._encode_run(text[start:end])
+            for page, data in segments:
+                if page != current:
+                    parts.append(self.switches[page])
+                    current = page
+                parts.append(data)
+            lossy = lossy or run_lossy
+            pos = cut
+            skipped += end - start
+        gap = body[pos:]
+        if current and not gap.isascii():
+            parts.append(self.switches[0])
+            current = 0
+        parts.append(gap)
+        if current:
+            parts.append(self.switches[0])  # callers expect the pinned codepage afterwards
+        return b"".join(parts), lossy
+
+    def rasterizer(self):
+        """Raster fallback for this paper width, resolved on first need (None if unavailable)"""
+        if self._rasterizer is None:
+            self._rasterizer = get_rasterizer(self.width) or False
+        return self._rasterizer or None
+
+    def encode_body(self, text):
+        """Text -> codepage bytes, without preamble or trailer; lines the codepage cannot show become raster images"""
+        body, lossy = self._encode_text(text)
+        if lossy:
+            rasterizer = self.rasterizer()
+            if rasterizer is not None:
+                return self._encode_mixed(text, rasterizer)
+        return body
+
+    def _encode_mixed(self, text, rasterizer):
+        """Text lines stay text; consecutive lossy lines go out as one raster block"""
+        parts = []
+        text_lines = []
+        raster_lines = []
+        lines = text.split("\n")
+        last = len(lines) - 1
+        for i, line in enumerate(lines):
+            encoded, lossy = self._encode_text(line)
+            if lossy:
+                if text_lines:
+                    parts.append(b"".join(text_lines))
+                    text_lines = []
+                raster_lines.append(line)  # the image feeds the paper itself
+                continue
+            if raster_lines:
+                parts.append(rasterizer.raster(raster_lines))
+                raster_lines = []
+            text_lines.append(encoded if i == last else encoded + b"\n")
+        if text_lines:
+            parts.append(b"".join(text_lines))
+        if raster_lines:
+            parts.append(rasterizer.raster(raster_lines))
+        return b"".join(parts)
+
+    def encode(self, text):
+        """Text -> preamble + body + feed + cut, assembled in one allocation"""
+        return b"".join((self.preamble, self.encode_body(text), self.trailer))
+
+
+_ENCODERS = {}
+_ENCODERS_LOCK = threading.Lock()
+
+
+def register_codepages(brand, pages):
+    """
+    Add or replace a brand's codepage table, e.g. from config.json
+    (``{"19": "cp858", "48": "cp1254"}``); call before the first print
+    """
+    table = []
+    for n, codec in pages.items():
+        codecs.lookup(codec)  # unknown codec names fail here, not mid-job
+        table.append((bytes([int(n)]), codec))
+    CODEPAGE_SUPPORT[brand.lower()] = tuple(table)
+    with _ENCODERS_LOCK:
+        for key in [k for k in _ENCODERS if k[0] == brand.lower()]:
+            del _ENCODERS[key]
+
+
+def get_encoder(brand, codepage=b'\x12', width=80):
+    """Shared encoder for (brand, codepage, width)"""
+    key = (brand, codepage, width)
+    encoder = _ENCODERS.get(key)
+    if encoder is None:
+        with _ENCODERS_LOCK:
+            encoder = _ENCODERS.get(key)
+            if encoder is None:
+                encoder = _ENCODERS[key] = EscPosEncoder(brand, codepage, width)
+    return encoder
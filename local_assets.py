@@ -0,0 +1,190 @@
+"""
+Local UI and Sound Assets in Memory
+
+``ui/*.html``, ``universal_bridge.js`` and ``sounds/*`` are read once
+at startup and served from memory with a strong ETag, a pre-compressed
+gzip copy for text files, ``Cache-Control`` and ``304 Not Modified``.
+Alert sounds are handed to pygame as in-memory files.
+
+In dev mode a background watcher polls the files' modification times
+and reloads only what changed, so edits show up without a restart and
+without touching the disk on every request.
+"""
+
+import fnmatch
+import gzip
+import hashlib
+import io
+import mimetypes
+import os
+import threading
+import time
+
+from flask import Response
+
+# (directory, pattern) pairs relative to the resource root
+DEFAULT_ASSETS = (("ui", "*.html"), ("", "universal_bridge.js"), ("sounds", "*.mp3"), ("sounds", "*.wav"), ("sounds", "*.ogg"))
+
+# Gzip only pays off for text; mp3/ogg are already compressed
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json")
+MIN_GZIP_BYTES = 512
+
+
+class Asset:
+    """One file held in memory"""
+
+    def __init__(self, name, path, body, mtime):
+        self.name = name
+        self.path = path
+        self.body = body
+        self.mtime = mtime
+        self.content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if self.content_type.startswith("text/"):
+            self.content_type += "; charset=utf-8"
+        self.etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+        self.gzipped = None
+        if self.content_type.startswith(COMPRESSIBLE_TYPES) and len(body) >= MIN_GZIP_BYTES:
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.gzipped = compressed
+        # Strong validators differ per representation
+        self.gzip_etag = self.etag[:-1] + '-gz"'
+
+
+class LocalAssets:
+    """In-memory store for the app's bundled files"""
+
+    def __init__(self, root, patterns=DEFAULT_ASSETS, watch=False, poll_interval=1.0,
+                 max_age=3600):
+        """
+        Args:
+            root: Resource directory (``resource_path('')``)
+            patterns: (directory, glob) pairs to load
+            watch: Dev mode: poll for changed files in the background
+            max_age: ``Cache-Control`` max-age for scripts and sounds;
+                HTML is always revalidated (``no-cache``) so the ETag decides
+        """
+        self.root = root
+        self.patterns = tuple(patterns)
+        self.watch = watch
+        self.poll_interval = poll_interval
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._assets = {}
+        self._stats = {"served": 0, "not_modified": 0, "gzip": 0, "reloads": 0}
+        self._load_all()
+        if watch:
+            threading.Thread(target=self._watch_loop, name="asset-watcher", daemon=True).start()
+
+    def _scan(self):
+        """name -> (path, mtime) for every file matching the patterns"""
+        found = {}
+        for directory, pattern in self.patterns:
+            folder = os.path.join(self.root, directory)
+            try:
+                names = os.listdir(folder)
+            except OSError:
+                continue
+            for filename in fnmatch.filter(names, pattern):
+                path = os.path.join(folder, filename)
+                try:
+                    found[f"{directory}/{filename}" if directory else filename] = (path, os.path.getmtime(path))
+                except OSError:
+                    pass
+        return found
+
+    def _read(self, name, path, mtime):
+        try:
+            with open(path, "rb") as f:
+                return Asset(name, path, f.read(), mtime)
+        except OSError as e:
+            print(f"⚠️ Local asset {name} could not be read: {e}")
+            return None
+
+    def _load_all(self):
+        started = time.time()
+        assets = {}
+        for name, (path, mtime) in self._scan().items():
+            asset = self._read(name, path, mtime)
+            if asset is not None:
+                assets[name] = asset
+        with self._lock:
+            self._assets = assets
+        total = sum(len(a.body) for a in assets.values())
+        print(f"📦 Local assets: {len(assets)} files, {total // 1024} KB in memory "
+              f"({(time.time() - started) * 1000:.0f} ms)" + (" - watching for changes" if self.watch else ""))
+
+    def _watch_loop(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self._reload_changed()
+            except Exception as e:
+                print(f"⚠️ Asset watcher error: {e}")
+
+    def _reload_changed(self):
+        found = self._scan()
+        with self._lock:
+            current = dict(self._assets)
+        for name in set(current) - set(found):
+            with self._lock:
+                self._assets.pop(name, None)
+            print(f"📦 Local asset removed: {name}")
+        for name, (path, mtime) in found.items():
+            if name in current and current[name].mtime == mtime:
+                continue
+            asset = self._read(name, path, mtime)
+            if asset is None:
+                continue
+            with self._lock:
+                self._assets[name] = asset
+                self._stats["reloads"] += 1
+            print(f"📦 Local asset reloaded: {name}")
+
+    def get(self, name):
+        with self._lock:
+            return self._assets.get(name)
+
+    def open(self, name):
+        """In-memory file object for ``name`` (e.g. for pygame), or None"""
+        asset = self.get(name)
+        return io.BytesIO(asset.body) if asset is not None else None
+
+    def response(self, name, request_headers):
+        """Flask Response for ``name`` (200, 304 or 404)"""
+        asset = self.get(name)
+        if asset is None:
+            return Response("Not found", 404, mimetype="text/plain")
+
+        cache_control = "no-cache" if self.watch or asset.content_type.startswith("text/html") \
+            else f"public, max-age={self.max_age}"
+        accepted = [e.split(";")[0].strip().lower() for e in request_headers.get("Accept-Encoding", "").split(",")]
+        use_gzip = asset.gzipped is not None and "gzip" in accepted
+        etag = asset.gzip_etag if use_gzip else asset.etag
+        headers = [("ETag", etag), ("Cache-Control", cache_control)]
+        if asset.gzipped is not None:
+            headers.append(("Vary", "Accept-Encoding"))
+
+        if_none_match = request_headers.get("If-None-Match", "")
+        if if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]:
+            with self._lock:
+                self._stats["not_modified"] += 1
+            return Response(status=304, headers=headers)
+
+        body = asset.body
+        if use_gzip:
+            body = asset.gzipped
+            headers.append(("Content-Encoding", "gzip"))
+            with self._lock:
+                self._stats["gzip"] += 1
+        with self._lock:
+            self._stats["served"] += 1
+        return Response(body, 200, headers, content_type=asset.content_type)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["files"] = len(self._assets)
+            stats["bytes"] = sum(len(a.body) for a in self._assets.values())
+        stats["watching"] = self.watch
+        return stats
@@ -0,0 +1,322 @@
+"""
+Local API Server
+
+Serves the Flask app on LOCAL_API_PORT with a backend chosen in
+config.json ("server"):
+
+- "threadpool" (default): werkzeug HTTP/1.1 server with a fixed number of
+  worker threads and a bounded accept queue; connections beyond the queue
+  get an immediate 503. Connections are routed on their first request
+  line: /api/print and /api/jobs go to their own workers, which general
+  traffic (and its keep-alive connections) can never hold
+- "waitress": waitress with the same worker count, if installed
+- "development": Flask's app.run(threaded=True), one thread per connection
+
+Every backend runs behind ``AdmissionMiddleware``, which keeps part of
+the capacity free for /api/print and /api/jobs so proxy traffic cannot
+starve printing.
+"""
+
+import queue
+import selectors
+import socket
+import threading
+import time
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from werkzeug.wsgi import ClosingIterator
+
+DEFAULT_SERVER_CONFIG = {
+    "backend": "threadpool",
+    "workers": 32,
+    "queue_limit": 64,
+    "reserved_print_workers": 4,
+    "keepalive_timeout": 15,
+}
+
+PRIORITY_PATHS = ("/api/print", "/api/jobs")
+
+_BUSY_RESPONSE = (
+    b"HTTP/1.1 503 Service Unavailable\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Length: 12\r\n"
+    b"Retry-After: 1\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+    b"Server busy\n"
+)
+
+# Bytes peeked to read the request line ("POST /api/print HTTP/1.1")
+_PEEK_BYTES = 512
+
+
+class AdmissionMiddleware:
+    """
+    Caps concurrent requests outside ``PRIORITY_PATHS``.
+
+    General requests may use ``capacity - reserved`` workers; the rest
+    stay free for printing. A request over the cap gets 503 at once, with
+    ``Connection: close`` so the rejected client does not keep a worker
+    busy on an idle keep-alive connection.
+    """
+
+    def __init__(self, app, capacity, reserved, priority_paths=PRIORITY_PATHS):
+        self.app = app
+        self.general_limit = max(1, capacity - reserved)
+        self.priority_paths = tuple(priority_paths)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {"general": 0, "priority": 0, "rejected": 0}
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO", "").startswith(self.priority_paths):
+            with self._lock:
+                self._stats["priority"] += 1
+            return self.app(environ, start_response)
+
+        with self._lock:
+            if self._in_flight >= self.general_limit:
+                self._stats["rejected"] += 1
+                rejected = True
+            else:
+                self._in_flight += 1
+                self._stats["general"] += 1
+                rejected = False
+        if rejected:
+            start_response("503 Service Unavailable", [
+                ("Content-Type", "text/plain"), ("Retry-After", "1"), ("Content-Length", "12"),
+                ("Connection", "close")  # the server closes the socket after this response
+            ])
+            return [b"Server busy\n"]
+
+        try:
+            # The slot is held until the (possibly streamed) body is done
+            return ClosingIterator(self.app(environ, start_response), self._release)
+        except BaseException:
+            self._release()
+            raise
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = self._in_flight
+            stats["general_limit"] = self.general_limit
+        return stats
+
+
+class _KeepAliveHandler(WSGIRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+
+class _PriorityHandler(_KeepAliveHandler):
+    """One request per connection, so a reused connection never ties up a print worker"""
+
+    def handle_one_request(self):
+        super().handle_one_request()
+        self.close_connection = True
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    werkzeug server with fixed worker pools and a bounded connection queue.
+
+    New connections wait in a selector until their request line arrives
+    and are then queued for the priority or the general workers.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, workers=32, queue_limit=64, keepalive_timeout=15,
+                 priority_workers=4, priority_paths=PRIORITY_PATHS):
+        # Idle keep-alive connections give their worker back after this long
+        handler = type("KeepAliveHandler", (_KeepAliveHandler,), {"timeout": keepalive_timeout})
+        super().__init__(host, port, app, handler=handler)
+        self.priority_handler = type("PriorityHandler", (_PriorityHandler,), {"timeout": keepalive_timeout})
+        self.workers = workers
+        self.priority_workers = max(1, priority_workers)
+        self.priority_paths = tuple(priority_paths)
+        self.keepalive_timeout = keepalive_timeout
+        self.max_waiting = workers + queue_limit
+        self._queue = queue.Queue(maxsize=queue_limit)
+        self._priority_queue = queue.Queue(maxsize=queue_limit)
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._priority_busy = 0
+        self._new = []
+        self._waiting = 0
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_send.setblocking(False)
+        self._stats = {"accepted": 0, "priority": 0, "rejected": 0, "timed_out": 0}
+        threading.Thread(target=self._dispatch, name="http-dispatch", daemon=True).start()
+        for i in range(workers):
+            threading.Thread(target=self._worker, args=(self._queue, self.RequestHandlerClass, "_busy"),
+                             name=f"http-worker-{i}", daemon=True).start()
+        for i in range(self.priority_workers):
+            threading.Thread(target=self._worker, args=(self._priority_queue, self.priority_handler, "_priority_busy"),
+                             name=f"http-print-worker-{i}", daemon=True).start()
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            full = self._waiting + len(self._new) >= self.max_waiting
+            if not full:
+                self._new.append((request, client_address))
+        if full:
+            self._reject(request)
+            return
+        try:
+            self._wakeup_send.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass  # a wakeup is already pending
+
+    def _reject(self, request):
+        with self._lock:
+            self._stats["rejected"] += 1
+        try:
+            request.sendall(_BUSY_RESPONSE)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def _dispatch(self):
+        """Routes each connection once its request line has arrived"""
+        selector = selectors.DefaultSelector()
+        selector.register(self._wakeup_recv, selectors.EVENT_READ)
+        deadlines = {}
+        while True:
+            for key, _ in selector.select(timeout=1.0):
+                if key.fileobj is self._wakeup_recv:
+                    try:
+                        self._wakeup_recv.recv(4096)
+                    except OSError:
+                        pass
+                    with self._lock:
+                        new, self._new = self._new, []
+                        self._waiting += len(new)
+                    deadline = time.monotonic() + self.keepalive_timeout
+                    for request, client_address in new:
+                        selector.register(request, selectors.EVENT_READ, client_address)
+                        deadlines[request] = deadline
+                    continue
+                selector.unregister(key.fileobj)
+                del deadlines[key.fileobj]
+                with self._lock:
+                    self._waiting -= 1
+                self._route(key.fileobj, key.data)
+
+            now = time.monotonic()
+            expired = [request for request, deadline in deadlines.items() if deadline <= now]
+            for request in expired:
+                # Preconnected but never used
+                selector.unregister(request)
+                del deadlines[request]
+                with self._lock:
+                    self._waiting -= 1
+                    self._stats["timed_out"] += 1
+                self.shutdown_request(request)
+
+    def _route(self, request, client_address):
+        try:
+            head = request.recv(_PEEK_BYTES, socket.MSG_PEEK)
+        except OSError:
+            head = b""
+        if not head:
+            self.shutdown_request(request)
+            return
+        parts = head.split(b" ", 2)
+        path = parts[1].decode("latin-1") if len(parts) > 1 else ""
+        priority = path.startswith(self.priority_paths)
+        try:
+            (self._priority_queue if priority else self._queue).put_nowait((request, client_address))
+        except queue.Full:
+            self._reject(request)
+            return
+        with self._lock:
+            self._stats["priority" if priority else "accepted"] += 1
+
+    def _worker(self, jobs, handler, busy):
+        while True:
+            request, client_address = jobs.get()
+            with self._lock:
+                setattr(self, busy, getattr(self, busy) + 1)
+            try:
+                handler(request, client_address, self)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                with self._lock:
+                    setattr(self, busy, getattr(self, busy) - 1)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["busy_workers"] = self._busy
+            stats["busy_print_workers"] = self._priority_busy
+            stats["waiting"] = self._waiting
+        stats["workers"] = self.workers
+        stats["print_workers"] = self.priority_workers
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+
+class LocalServer:
+    """Runs the Flask app with the backend selected in config.json"""
+
+    def __init__(self, app, host, port, server_config=None):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.config = dict(DEFAULT_SERVER_CONFIG, **(server_config or {}))
+        self.backend = self.config["backend"]
+        self.server = None
+        self.admission = AdmissionMiddleware(
+            app.wsgi_app, self.config["workers"], self.config["reserved_print_workers"]
+        )
+        app.wsgi_app = self.admission
+
+    def serve_forever(self):
+        cfg = self.config
+        if self.backend == "waitress":
+            try:
+                from waitress import create_server
+            except ImportError:
+                print("⚠️ waitress not installed - using the threadpool server")
+                self.backend = "threadpool"
+            else:
+                print(f"🌐 Starting API server (waitress, {cfg['workers']} threads) on http://localhost:{self.port}")
+                self.server = create_server(
+                    self.app, host=self.host, port=self.port, threads=cfg["workers"],
+                    connection_limit=cfg["workers"] + cfg["queue_limit"],
+                    channel_timeout=cfg["keepalive_timeout"]
+                )
+                self.server.run()
+                return
+
+        if self.backend == "development":
+            print(f"🌐 Starting API server (development) on http://localhost:{self.port}")
+            self.app.run(host=self.host, port=self.port, debug=False, threaded=True)
+            return
+
+        if self.backend != "threadpool":
+            print(f"⚠️ Unknown server backend '{self.backend}' - using threadpool")
+            self.backend = "threadpool"
+        print(f"🌐 Starting API server (threadpool, {cfg['workers']} workers, "
+              f"{cfg['reserved_print_workers']} for printing, queue {cfg['queue_limit']}) on http://localhost:{self.port}")
+        self.server = PooledWSGIServer(
+            self.host, self.port, self.app, workers=cfg["workers"],
+            queue_limit=cfg["queue_limit"], keepalive_timeout=cfg["keepalive_timeout"],
+            priority_workers=cfg["reserved_print_workers"], priority_paths=self.admission.priority_paths
+        )
+        # Printing has its own workers here, so general requests may use the whole pool
+        self.admission.general_limit = max(1, cfg["workers"])
+        self.server.serve_forever()
+
+    def get_stats(self):
+        stats = {"backend": self.backend, "admission": self.admission.get_stats()}
+        if isinstance(self.server, PooledWSGIServer):
+            stats["pool"] = self.server.get_stats()
+        return stats
@@ -11,12 +11,23 @@ import urllib3
 import pygame
 import sys
 import subprocess
-from printer_manager import (
-    discover_lan_printers,
-    discover_bluetooth_printers,
-    PrinterManager
-)
+from printer_manager import PrinterManager, LAN_POOL
 from printer_drivers.universal_manager import UniversalPrinterManager
+from print_queue import PrintJobQueue
+from print_spool import PrintSpool
+from printer_supervisor import ConnectionSupervisor
+from discovery_service import DiscoveryService
+from upstream_proxy import UpstreamClient, ReverseProxy
+from proxy_cache import ProxyCache
+from circuit_breaker import CircuitBreaker
+from local_server import LocalServer, DEFAULT_SERVER_CONFIG
+from ws_tunnel import WebSocketTunnel, SocketIOMonitor
+from proxy_warmup import WarmUp, PrefetchBuffer
+from local_assets import LocalAssets
+import raster_text
+from escpos_encoder import register_codepages
+from receipt_layout import validate_receipt
+from printer_discovery import DISCOVERY_SESSIONS, DiscoverySession, register_usb_printer, register_printer_oui
 
 from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
@@ -90,6 +101,9 @@ def load_config():
 # Load config
 config = load_config()
 CONFIG_PATH = get_config_path()
+SPOOL_PATH = os.path.join(os.path.dirname(CONFIG_PATH), 'print_spool.bin')
+PRINTER_CACHE_PATH = os.path.join(os.path.dirname(CONFIG_PATH), 'printer_cache.json')
+PROXY_CACHE_DIR = os.path.join(os.path.dirname(CONFIG_PATH), 'proxy_cache')
 
 # Extract configuration values
 APP_URL = config.get("app_url", "http://localhost:3001/order-reception.html")
@@ -102,13 +116,76 @@ BASE_URL = base_url_match.group(1) if base_url_match else "http://localhost:3001
 API_HEARTBEAT = f"{BASE_URL}/api/heartbeat"
 APP_VERSION = config.get("version", "1.0.0")
 
-pygame.mixer.init()
+# Startup phases are logged with their duration and time since launch
+STARTUP_STARTED = time.time()
+
+def log_startup_phase(name, started):
+    now = time.time()
+    print(f"⏱️ Startup phase '{name}': {(now - started) * 1000:.0f} ms (t+{(now - STARTUP_STARTED) * 1000:.0f} ms)")
 
 # Flask API Server for Java WebView
 app = Flask(__name__)
 CORS(app)
 LOCAL_API_PORT = 8080
 
+SERVER_CONFIG = config.get("server", {})
+
+# Shared keep-alive pool for reverse_proxy (one connection per Flask worker thread)
+PROXY_CONFIG = config.get("proxy", {})
+PROXY_TIMEOUT = (PROXY_CONFIG.get("connect_timeout", 5), PROXY_CONFIG.get("read_timeout", 60))
+
+def probe_upstream():
+    """Half-open probe: any HTTP answer from the server closes the circuit"""
+    UPSTREAM.session.head(f"{BASE_URL}{PROXY_CONFIG.get('probe_path', '/')}",
+                          timeout=PROXY_TIMEOUT, allow_redirects=False).close()
+
+# وقتی سرور اصلی قطع است، proxy فوراً 503 (یا نسخه کش‌شده) برمی‌گرداند و thread ها گیر نمی‌کنند
+UPSTREAM_BREAKER = CircuitBreaker(
+    probe_upstream,
+    failure_threshold=PROXY_CONFIG.get("failure_threshold", 5),
+    slow_connect_ms=PROXY_CONFIG.get("slow_connect_ms", 3000)
+)
+UPSTREAM = UpstreamClient(
+    pool_size=PROXY_CONFIG.get("pool_size", SERVER_CONFIG.get("workers", DEFAULT_SERVER_CONFIG["workers"])),
+    breaker=UPSTREAM_BREAKER
+)
+
+# کش دیسکی برای فایل‌های سرور اصلی، تا reload صفحه از دیسک محلی بیاید
+PROXY_CACHE = ProxyCache(
+    PROXY_CACHE_DIR,
+    max_bytes=PROXY_CONFIG.get("cache_mb", 200) * 1024 * 1024,
+    stale_while_revalidate=PROXY_CONFIG.get("stale_while_revalidate", 0),
+    stale_if_error=PROXY_CONFIG.get("stale_if_error", 0)
+) if PROXY_CONFIG.get("cache", True) else None
+# Socket.IO از طریق سرور محلی: WebSocket تونل می‌شود (waitress سوکت خام نمی‌دهد، پس همان rewrite قبلی)
+WS_TUNNEL_ENABLED = (PROXY_CONFIG.get("websocket_tunnel", True)
+                     and SERVER_CONFIG.get("backend", DEFAULT_SERVER_CONFIG["backend"]) != "waitress")
+SOCKETIO_MONITOR = SocketIOMonitor()
+# پاسخ‌های warm-up در حافظه، برای اولین بارگذاری WebView
+PREFETCH = PrefetchBuffer(ttl=PROXY_CONFIG.get("warmup_ttl", 120)) if PROXY_CONFIG.get("warmup", True) else None
+
+# GETهای هم‌زمان و یکسان یک درخواست به سرور می‌فرستند، به جز مسیرهای no_coalesce
+REVERSE_PROXY = ReverseProxy(
+    UPSTREAM, BASE_URL, cache=PROXY_CACHE, timeout=PROXY_TIMEOUT,
+    no_coalesce=["/socket.io/"] + PROXY_CONFIG.get("no_coalesce", []),
+    rewrite_socketio=not WS_TUNNEL_ENABLED, socketio_monitor=SOCKETIO_MONITOR, prefetch=PREFETCH
+)
+
+# خط‌هایی که codepage پرینتر ندارد (فارسی، عربی، یونانی...) به صورت تصویر چاپ می‌شوند
+raster_text.configure(**config.get("raster_text", {}))
+
+# فایل‌های ui، universal_bridge.js و صداها یک بار در حافظه بارگذاری می‌شوند؛ در حالت dev تغییرات خودکار بارگذاری می‌شوند
+DEV_MODE = config.get("dev_mode", not hasattr(sys, "_MEIPASS"))
+LOCAL_ASSETS = LocalAssets(resource_path(""), watch=DEV_MODE)
+
+def load_sound(sound_file):
+    """Load a sound into pygame.mixer.music from memory (disk if not preloaded)"""
+    data = LOCAL_ASSETS.open(f"sounds/{sound_file}")
+    if data is not None:
+        pygame.mixer.music.load(data, sound_file)
+    else:
+        pygame.mixer.music.load(resource_path(f"sounds/{sound_file}"))
+
 # Alarm control
 alarm_playing = False
 
@@ -117,45 +194,77 @@ internet_connected = True
 webview_healthy = True
 monitoring_active = True
 
+# Longest a caller may block on /api/print or /api/jobs/<id> with "wait"
+MAX_JOB_WAIT = 60
+
+def _job_wait_seconds(value):
+    try:
+        return max(0.0, min(float(value or 0), MAX_JOB_WAIT))
+    except (TypeError, ValueError):
+        return 0.0
+
 # [Configuration]
 @app.route('/api/print', methods=['POST'])
 def api_print():
-    """Function description"""
+    """Queue a print job and return its job ID immediately"""
     try:
-        data = request.get_json()
-        if not data or 'text' not in data:
+        data = request.get_json(silent=True)
+        if data is not None and not isinstance(data, dict):
+            return jsonify({"success": False, "error": "Request body must be a JSON object"}), 400
+        if data and 'receipt' in data:
+            # Structured receipt: laid out locally for the printer's paper width
+            receipt = data['receipt']
+            error = validate_receipt(receipt)
+            if error:
+                return jsonify({"success": False, "error": f"Invalid receipt: {error}"}), 400
+            print(f"📄 Receipt print request: {len(receipt.get('items') or [])} items "
+                  f"({receipt.get('template', 'receipt')})")
+            job = print_queue.submit(receipt, source="api")
+        elif not data or 'text' not in data:
             return jsonify({"success": False, "error": "No text provided"}), 400
-        
-        text = data['text']
-        print("📄 Print request from Java")
-        print("📋 Full API print text content:")
-        print("=" * 50)
-        print(text)
-        print("=" * 50)
-        
-        # [Configuration]
-        print("🚀 API using SAME METHOD as successful Bridge.print_text...")
-        
-        # [Configuration]
-        api_bridge = Bridge()
-        result = api_bridge.print_text(text)
-        
-        if "OK" in str(result):
-            return jsonify({
-                "success": True,
-                "message": "Print job sent successfully",
-                "device_id": get_device_id()
-            })
         else:
+            text = data['text']
+            print("📄 Print request from Java")
+            print("📋 Full API print text content:")
+            print("=" * 50)
+            print(text)
+            print("=" * 50)
+
+            job = print_queue.submit(text, source="api")
+
+        # Optional: block until printed (old synchronous behaviour)
+        wait = _job_wait_seconds(data.get('wait'))
+        if wait:
+            job.wait(wait)
+
+        if job.status == "failed":
             return jsonify({
-                "success": False, 
-                "error": f"Print failed: {result}"
+                "success": False,
+                "error": f"Print failed: {job.result}",
+                "job": job.to_dict()
             }), 500
+
+        messages = {"done": "Print job printed", "spooled": "Print job spooled for retry"}
+        return jsonify({
+            "success": True,
+            "message": messages.get(job.status, "Print job queued"),
+            "job_id": job.id,
+            "job": job.to_dict(),
+            "device_id": get_device_id()
+        }), 200 if job.status == "done" else 202
         
     except Exception as e:
         print(f"❌ Print API error: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_job_status(job_id):
+    """Print job status; ?wait=<seconds> blocks until the job finishes"""
+    job = print_queue.wait(job_id, _job_wait_seconds(request.args.get('wait')))
+    if job is None:
+        return jsonify({"success": False, "error": "Unknown job"}), 404
+    return jsonify({"success": True, "job": job.to_dict()})
+
 @app.route('/api/alarm/start', methods=['POST'])
 def api_alarm_start():
     """Function description"""
@@ -171,8 +280,7 @@ def api_alarm_start():
         print("🔔 Starting alarm from Java API...")
         # Use new_order sound as default alarm
         sound_file = config["sounds"].get("new_order", "neworder.mp3")
-        alarm_sound_path = resource_path(f"sounds/{sound_file}")
-        pygame.mixer.music.load(alarm_sound_path)
+        load_sound(sound_file)
         pygame.mixer.music.play(loops=loops)
         alarm_playing = True
         
@@ -210,8 +318,22 @@ def api_status():
     return jsonify({
         "success": True,
         "device_id": get_device_id(),
-        "printer_connected": printer.prn is not None,
+        "printer_connected": printer_supervisor.connected,
+        "printer_connection": printer_supervisor.get_status(),
         "printer_config": config["printer"],
+        "printer_pool": LAN_POOL.get_stats(),
+        "print_queue": print_queue.get_stats(),
+        "print_spool": printer.spool.get_stats(),
+        "printer_discovery": discovery_service.get_stats(),
+        "proxy_pool": UPSTREAM.get_stats(),
+        "proxy_cache": PROXY_CACHE.get_stats() if PROXY_CACHE else None,
+        "proxy_coalescing": REVERSE_PROXY.flights.get_stats(),
+        "proxy_circuit": UPSTREAM_BREAKER.get_status(),
+        "server": LOCAL_SERVER.get_stats(),
+        "local_assets": LOCAL_ASSETS.get_stats(),
+        "raster_text": raster_text.get_stats(),
+        "warmup": dict(WARMUP.get_status(), prefetch=PREFETCH.get_stats()) if WARMUP else None,
+        "socketio": dict(SOCKETIO_MONITOR.get_stats(), websocket_tunnel=WS_TUNNEL_ENABLED),
         "alarm_playing": alarm_playing,
         "internet_connected": internet_connected,
         "webview_healthy": webview_healthy,
@@ -320,15 +442,52 @@ def api_battery_alert():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@app.route('/api/printers/discover/stream', methods=['GET'])
+def api_discover_stream():
+    """Stream discovered printers as Server-Sent Events; ?types=lan,usb,bluetooth"""
+    types = [t.strip() for t in request.args.get('types', 'lan,usb,bluetooth').split(',') if t.strip()]
+    session = DiscoverySession(types, subnet=request.args.get('subnet') or None).start()
+    print(f"📡 Discovery stream {session.id} started: {', '.join(session.transports)}")
+
+    def generate():
+        yield f"event: session\ndata: {json.dumps({'session_id': session.id, 'transports': session.transports})}\n\n"
+        try:
+            for event in session.iter_events():
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            # Client closed the EventSource: stop probing
+            session.cancel()
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/api/printers/discover/<session_id>/cancel', methods=['POST'])
+def api_discover_cancel(session_id):
+    """Cancel a running discovery stream"""
+    session = DISCOVERY_SESSIONS.get(session_id)
+    if session is None:
+        return jsonify({"success": False, "error": "Unknown or finished session"}), 404
+    session.cancel()
+    return jsonify({"success": True, "session_id": session_id})
+
+
 @app.route('/settings')
 def settings_page():
     """Serve the settings HTML page"""
-    try:
-        settings_html_path = resource_path("ui/settings.html")
-        with open(settings_html_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    except Exception as e:
-        return f"<h1>Error loading settings page</h1><p>{str(e)}</p>", 500
+    if LOCAL_ASSETS.get("ui/settings.html") is None:
+        return "<h1>Error loading settings page</h1><p>ui/settings.html not found</p>", 500
+    return LOCAL_ASSETS.response("ui/settings.html", request.headers)
+
+
+@app.route('/local-assets/<path:name>')
+def local_asset(name):
+    """Serve ui/*.html, universal_bridge.js and sounds from memory"""
+    return LOCAL_ASSETS.response(name, request.headers)
 
 
 # Reverse proxy: strips HSTS and CSP upgrade-insecure-requests from remote server
@@ -336,44 +495,8 @@ def settings_page():
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS'])
 def reverse_proxy(path):
-    remote_url = f"{BASE_URL}/{path}"
-    qs = request.query_string.decode()
-    if qs:
-        remote_url += f"?{qs}"
-
-    fwd_headers = {}
-    for key, value in request.headers:
-        if key.lower() not in ('host', 'content-length'):
-            fwd_headers[key] = value
-
     try:
-        resp = requests.request(
-            method=request.method,
-            url=remote_url,
-            headers=fwd_headers,
-            data=request.get_data(),
-            allow_redirects=False,
-            timeout=120
-        )
-
-        skip_headers = {
-            'content-encoding', 'content-length', 'transfer-encoding',
-            'connection', 'strict-transport-security', 'content-security-policy'
-        }
-        resp_headers = {}
-        for key, value in resp.headers.items():
-            if key.lower() not in skip_headers:
-                resp_headers[key] = value
-
-        content = resp.content
-
-        if 'text/html' in resp.headers.get('Content-Type', ''):
-            content = content.replace(
-                b'io(window.location.origin',
-                f'io("{BASE_URL}"'.encode()
-            )
-
-        return Response(content, resp.status_code, resp_headers)
+        return REVERSE_PROXY.handle(request, path)
     except Exception as e:
         print(f"\u274c Proxy error for /{path}: {e}")
         return f"Proxy error: {e}", 502
@@ -514,11 +637,17 @@ def webview_health_monitor():
             print(f"❌ WebView health monitor error: {e}")
             time.sleep(15)
 
+if WS_TUNNEL_ENABLED:
+    app.wsgi_app = WebSocketTunnel(app.wsgi_app, BASE_URL, monitor=SOCKETIO_MONITOR,
+                                   connect_timeout=PROXY_TIMEOUT[0])
+
+# سرور API: تعداد worker ثابت، صف محدود (503 هنگام شلوغی) و ظرفیت رزرو برای چاپ
+LOCAL_SERVER = LocalServer(app, '0.0.0.0', LOCAL_API_PORT, SERVER_CONFIG)
+
 def start_flask_server():
     """Function description"""
     try:
-        print(f"🌐 Starting API server on http://localhost:{LOCAL_API_PORT}")
-        app.run(host='0.0.0.0', port=LOCAL_API_PORT, debug=False, threaded=True)
+        LOCAL_SERVER.serve_forever()
     except Exception as e:
         print(f"❌ Flask server error: {e}")
 
@@ -558,43 +687,24 @@ if config_updated:
     with open(CONFIG_PATH, "w") as f:
         json.dump(config, f, indent=2)
 
-# [Configuration] Universal Printer Manager (Multi-brand ESC/POS)
-printer = PrinterManager()
-connected = printer.auto_connect(
-    preferred_type=config["printer"].get("type", "auto"),
-    address=config["printer"].get("address", None),
-    width=config["printer"].get("paper_width", 80)
-)
-
-# پرینت خوش‌آمدگویی بعد از اتصال موفق
-if connected:
+# مدل‌های USB اضافه از config.json: "usb_printers": [{"vid": "0x1fc9", "pid": "0x2016", "name": "..."}]
+for usb_model in config.get("usb_printers", []):
     try:
-        welcome_text = """
-================================
-   DineSysPro Connected!
-================================
-Printer: {mode} - {addr}
-Version: {ver}
-Time: {time}
-================================
+        register_usb_printer(int(str(usb_model["vid"]), 0), int(str(usb_model["pid"]), 0), usb_model.get("name", "USB Printer"))
+    except (KeyError, ValueError) as e:
+        print(f"⚠️ Invalid usb_printers entry {usb_model}: {e}")
 
-Ready to receive orders!
+# پیشوندهای MAC پرینترها برای رتبه‌بندی همسایه‌های ARP: "printer_ouis": {"hprt": ["aa:bb:cc"]}
+for vendor, prefixes in config.get("printer_ouis", {}).items():
+    for prefix in prefixes:
+        register_printer_oui(vendor, prefix)
 
-""".format(
-            mode=printer.mode.upper(),
-            addr=printer.address if printer.address else printer.usb_device[2] if printer.usb_device else "Auto",
-            ver=APP_VERSION,
-            time=time.strftime("%Y-%m-%d %H:%M:%S")
-        )
-        result = printer.print_text(welcome_text)
-        if result == "OK":
-            print("✅ Welcome receipt printed successfully")
-        else:
-            print(f"⚠️ Welcome receipt failed: {result}")
-    except Exception as e:
-        print(f"⚠️ Welcome print error: {e}")
-else:
-    print("⚠️ Printer not connected - skipping welcome print")
+# جدول codepage های هر برند برای تعویض خودکار codepage: "printer_codepages": {"xprinter": {"18": "cp858", "13": "cp857"}}
+for brand, pages in config.get("printer_codepages", {}).items():
+    try:
+        register_codepages(brand, pages)
+    except (LookupError, ValueError, TypeError) as e:
+        print(f"⚠️ Invalid printer_codepages entry for {brand}: {e}")
 
 # [Configuration]
 def get_device_id():
@@ -639,6 +749,99 @@ def get_device_id():
     
     return device_id
 
+# Load page through local proxy to strip HSTS/CSP headers that force HTTPS
+device_id = get_device_id()
+app_path = APP_URL.replace(BASE_URL, '')
+final_url = f"http://localhost:{LOCAL_API_PORT}{app_path}?device_id={device_id}"
+
+# گرم کردن صفحه سفارش‌ها و فایل‌هایش در پس‌زمینه، هم‌زمان با pygame و اتصال پرینتر
+WARMUP = WarmUp(
+    REVERSE_PROXY, f"{app_path}?device_id={device_id}",
+    concurrency=PROXY_CONFIG.get("warmup_concurrency", 6)
+).start() if PREFETCH is not None else None
+
+phase_started = time.time()
+pygame.mixer.init()
+log_startup_phase("pygame init", phase_started)
+
+# [Configuration] Universal Printer Manager (Multi-brand ESC/POS)
+phase_started = time.time()
+printer = PrinterManager(spool=PrintSpool(SPOOL_PATH))
+connected = printer.auto_connect(
+    preferred_type=config["printer"].get("type", "auto"),
+    address=config["printer"].get("address", None),
+    width=config["printer"].get("paper_width", 80)
+)
+log_startup_phase("printer connect", phase_started)
+
+# چاپ سفارش‌هایی که قبل از ری‌استارت در spool مانده‌اند
+if connected and printer.spool.pending_count():
+    replayed, error = printer.replay_spool()
+    print(f"📤 Spool replay at startup: {replayed} sent" + (f", stopped: {error}" if error else ""))
+
+# پرینت خوش‌آمدگویی بعد از اتصال موفق
+if connected:
+    try:
+        welcome_text = """
+================================
+   DineSysPro Connected!
+================================
+Printer: {mode} - {addr}
+Version: {ver}
+Time: {time}
+================================
+
+Ready to receive orders!
+
+""".format(
+            mode=printer.mode.upper(),
+            addr=printer.address if printer.address else printer.usb_device[2] if printer.usb_device else "Auto",
+            ver=APP_VERSION,
+            time=time.strftime("%Y-%m-%d %H:%M:%S")
+        )
+        result = printer.print_text(welcome_text, spool=False)
+        if result == "OK":
+            print("✅ Welcome receipt printed successfully")
+        else:
+            print(f"⚠️ Welcome receipt failed: {result}")
+    except Exception as e:
+        print(f"⚠️ Welcome print error: {e}")
+else:
+    print("⚠️ Printer not connected - skipping welcome print")
+
+# Supervisor: اتصال مجدد پرینتر در پس‌زمینه با backoff، نه در مسیر چاپ
+printer_supervisor = ConnectionSupervisor(printer, lambda: config["printer"])
+printer_supervisor.start(connected=connected)
+
+# صف چاپ: یک worker برای هر پرینتر، تا Flask و WebView منتظر پرینتر نمانند
+print_queue = PrintJobQueue()
+print_queue.register_printer("default", lambda: printer)
+# job های spool شده بعد از چاپ در اتصال مجدد به done می‌روند
+printer.spool.on_done = print_queue.spool_done
+
+def on_printer_address_changed(old_address, new_address):
+    """DHCP گیرنده IP پرینتر را عوض کرده: آدرس جدید را ذخیره و دوباره وصل شو"""
+    try:
+        with open(CONFIG_PATH, "r") as f:
+            full_config = json.load(f)
+        full_config["printer"]["address"] = new_address
+        with open(CONFIG_PATH, "w") as f:
+            json.dump(full_config, f, indent=2)
+    except Exception as e:
+        print(f"⚠️ Could not save new printer address: {e}")
+    config["printer"]["address"] = new_address
+    printer_supervisor.request_reconnect(f"address changed {old_address} → {new_address}")
+
+# کش پرینترها روی دیسک: اسکن تنظیمات فوراً از کش جواب می‌دهد و در پس‌زمینه به‌روز می‌شود
+discovery_service = DiscoveryService(
+    PRINTER_CACHE_PATH,
+    lambda: config["printer"],
+    is_connected=lambda: printer_supervisor.connected,
+    on_address_changed=on_printer_address_changed
+).start()
+# چاپ یا اتصال مجدد ناموفق: آدرس پرینتر شبکه را همان لحظه در جدول ARP چک کن
+printer_supervisor.on_failure = discovery_service.wake
+
 def get_device_info():
     return {
         "device_id": get_device_id(),
@@ -697,26 +900,11 @@ class SettingsBridge:
     def scan_printers(self, conn_type):
         print(f"🧩 scan_printers called with type={conn_type}")
         try:
-            if conn_type == "lan":
-                return discover_lan_printers() or ["No LAN printers found"]
-            elif conn_type == "bluetooth":
-                return discover_bluetooth_printers() or ["No Bluetooth printers found"]
-            elif conn_type == "usb":
-                try:
-                    import usb.core
-                    found_devices = []
-                    common_printers = [
-                        (0x20d1, 0x7009, "HPRT TP808"),
-                        (0x04b8, 0x0005, "Epson TM-T20II"),
-                        (0x0519, 0x0001, "Star TSP100"),
-                    ]
-                    for vid, pid, name in common_printers:
-                        device = usb.core.find(idVendor=vid, idProduct=pid)
-                        if device:
-                            found_devices.append(f"{hex(vid)}:{hex(pid)} - {name}")
-                    return found_devices or ["No USB printers found"]
-                except Exception as e:
-                    return [f"USB scan error: {str(e)}"]
+            # از کش جواب بده؛ کش کهنه در پس‌زمینه تازه می‌شود
+            if conn_type in ("lan", "usb", "bluetooth"):
+                found = [entry["label"] for entry in discovery_service.printers(conn_type)]
+                names = {"lan": "LAN", "usb": "USB", "bluetooth": "Bluetooth"}
+                return found or [f"No {names[conn_type]} printers found"]
             else:
                 return ["Unknown printer type"]
         except Exception as e:
@@ -733,17 +921,8 @@ class SettingsBridge:
                 json.dump(full_config, f, indent=2)
             config["printer"] = new_cfg
             
-            # قطع اتصال پرینتر قبلی
-            global printer
-            if printer:
-                printer.disconnect()
-            
-            # اتصال مجدد با تنظیمات جدید
-            printer.auto_connect(
-                preferred_type=new_cfg.get("type", "auto"),
-                address=new_cfg.get("address", None),
-                width=new_cfg.get("paper_width", 80)
-            )
+            # قطع اتصال قبلی و اتصال مجدد با تنظیمات جدید (در پس‌زمینه)
+            printer_supervisor.request_reconnect("settings changed")
             
             print(f"💾 Printer settings updated: {new_cfg}")
             return "OK"
@@ -814,8 +993,7 @@ class Bridge:
         global alarm_playing
         try:
             sound_file = config["sounds"].get(sound_type, "neworder.mp3")
-            sound_path = resource_path(f"sounds/{sound_file}")
-            pygame.mixer.music.load(sound_path)
+            load_sound(sound_file)
             pygame.mixer.music.play(-1)
             alarm_playing = True
             print(f"🔔 Alert started: {sound_type} ({sound_file})")
@@ -857,8 +1035,8 @@ class Bridge:
     def print_text(self, text):
         try:
             print("🖨️ Print command received")
-            result = printer.print_text(text)
-            return "OK" if result == "OK" else f"ERROR: {result}"
+            job = print_queue.submit(text, source="webview")
+            return job.id  # /api/jobs/<id> برای پیگیری وضعیت
         except Exception as e:
             print(f"❌ Print error: {e}")
             return f"ERROR: {e}"
@@ -867,6 +1045,19 @@ class Bridge:
         """Alias for print_text - برای سازگاری با universal_bridge.js"""
         return self.print_text(text)
 
+    def print_receipt(self, receipt):
+        """Structured receipt from the page (see receipt_layout.py)"""
+        try:
+            print("🖨️ Receipt print command received")
+            error = validate_receipt(receipt)
+            if error:
+                return f"ERROR: Invalid receipt: {error}"
+            job = print_queue.submit(receipt, source="webview")
+            return job.id  # /api/jobs/<id> برای پیگیری وضعیت
+        except Exception as e:
+            print(f"❌ Print error: {e}")
+            return f"ERROR: {e}"
+
     def test_print(self):
         """Triggered from settings.html Test Print button"""
         try:
@@ -907,8 +1098,7 @@ class Bridge:
     def test_sound(self, sound_type, sound_file):
         """Function description"""
         try:
-            sound_path = resource_path(f"sounds/{sound_file}")
-            pygame.mixer.music.load(sound_path)
+            load_sound(sound_file)
             pygame.mixer.music.play()
             print(f"🔊 Testing sound: {sound_type} = {sound_file}")
             return "OK"
@@ -927,11 +1117,6 @@ class Bridge:
             return f"ERROR: {e}"
 
 
-# Load page through local proxy to strip HSTS/CSP headers that force HTTPS
-device_id = get_device_id()
-app_path = APP_URL.replace(BASE_URL, '')
-final_url = f"http://localhost:{LOCAL_API_PORT}{app_path}?device_id={device_id}"
-
 def on_loaded():
     print("✅ WebView loaded — injecting settings button")
     js = """
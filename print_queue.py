@@ -0,0 +1,186 @@
+"""
+Print Job Queue
+
+Runs print jobs on one background worker per printer so that HTTP and
+WebView callers get a job ID right away instead of waiting for the
+socket/USB write to finish.
+"""
+
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# PrinterManager results for jobs kept in the print spool: they print on
+# their own once the printer is back, so callers must not resubmit them
+SPOOLED_SUFFIX = "(spooled for retry)"
+
+
+class PrintJob:
+    """A single queued print job and its lifecycle"""
+
+    def __init__(self, text, printer_key="default", source="api"):
+        self.id = uuid.uuid4().hex[:12]
+        self.text = text  # str, or a structured receipt dict
+        self.kind = "receipt" if isinstance(text, dict) else "text"
+        self.printer_key = printer_key
+        self.source = source
+        self.status = "queued"  # queued -> printing -> done / spooled (-> done) / failed
+        self.result = None
+        self.spool_seq = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.printed_at = None
+        self._done = threading.Event()
+
+    @property
+    def finished(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the job has finished; returns False on timeout"""
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "printer": self.printer_key,
+            "source": self.source,
+            "kind": self.kind,
+            "status": self.status,
+            "result": self.result,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "printed_at": self.printed_at,
+        }
+
+
+class PrintJobQueue:
+    """
+    Job queue with one worker thread per registered printer.
+
+    Printers are registered as callables returning the current
+    ``PrinterManager`` so that settings reloads can swap the instance.
+    """
+
+    def __init__(self, max_history=500):
+        self.max_history = max_history
+        self._printers = {}
+        self._queues = {}
+        self._workers = {}
+        self._jobs = OrderedDict()
+        self._spooled = {}  # spool seq -> job still waiting in the spool
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "done": 0, "spooled": 0, "failed": 0, "replayed": 0}
+
+    def register_printer(self, key, get_printer):
+        """Register a printer and start its worker"""
+        with self._lock:
+            self._printers[key] = get_printer
+            if key not in self._queues:
+                self._queues[key] = queue.Queue()
+                worker = threading.Thread(
+                    target=self._worker, args=(key,), name=f"print-worker-{key}", daemon=True
+                )
+                self._workers[key] = worker
+                worker.start()
+
+    def submit(self, text, printer_key="default", source="api"):
+        """Queue a print job (text or receipt dict) and return it immediately"""
+        if printer_key not in self._queues:
+            raise KeyError(f"Unknown printer: {printer_key}")
+
+        job = PrintJob(text, printer_key, source)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._stats["submitted"] += 1
+            self._trim_history()
+        self._queues[printer_key].put(job)
+        print(f"📥 Print job {job.id} queued for '{printer_key}' ({source})")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id, timeout=None):
+        """Wait for a job to finish; returns the job or None if unknown"""
+        job = self.get(job_id)
+        if job:
+            job.wait(timeout)
+        return job
+
+    def spool_done(self, seq):
+        """PrintSpool.on_done: a spooled job was printed after a reconnect"""
+        with self._lock:
+            job = self._spooled.pop(seq, None)
+            if job is None:
+                return  # spooled before a restart, or printed by its own job
+            job.status = "done"
+            job.result = "OK"
+            job.printed_at = time.time()
+            self._stats["replayed"] += 1
+        print(f"✅ Print job {job.id} printed from the spool")
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["pending"] = {key: q.qsize() for key, q in self._queues.items()}
+        return stats
+
+    def _trim_history(self):
+        # Called with self._lock held; only finished jobs are forgotten
+        excess = len(self._jobs) - self.max_history
+        if excess <= 0:
+            return
+        for job_id in [j.id for j in self._jobs.values() if j.finished][:excess]:
+            del self._jobs[job_id]
+
+    def _worker(self, key):
+        q = self._queues[key]
+        while True:
+            job = q.get()
+            job.status = "printing"
+            job.started_at = time.time()
+            try:
+                printer = self._printers[key]()
+                if not printer:
+                    result = "ERROR: No printer configured"
+                elif job.kind == "receipt":
+                    result = printer.print_receipt(job.text)
+                else:
+                    result = printer.print_text(job.text)
+            except Exception as e:
+                print(f"❌ Print job {job.id} crashed: {e}")
+                result = f"ERROR: {e}"
+
+            spooled = isinstance(result, str) and result.endswith(SPOOLED_SUFFIX)
+            seq = getattr(printer, "last_spooled_seq", lambda: None)() if spooled else None
+            with self._lock:
+                job.result = result
+                if result == "OK":
+                    job.status = "done"
+                    job.printed_at = time.time()
+                elif seq is not None and not printer.spool.is_pending(seq):
+                    # Replayed by the supervisor before the job was registered
+                    job.status = "done"
+                    job.result = "OK"
+                    job.printed_at = time.time()
+                elif spooled:
+                    job.status = "spooled"
+                    job.spool_seq = seq
+                    if seq is not None:
+                        self._spooled[seq] = job  # spool_done() finishes it
+                else:
+                    job.status = "failed"
+                job.finished_at = time.time()
+                self._stats[job.status] += 1
+            job._done.set()
+            q.task_done()
+
+            took = (job.finished_at - job.started_at) * 1000
+            icon = {"done": "✅", "spooled": "📥"}.get(job.status, "❌")
+            print(f"{icon} Print job {job.id} {job.status} in {took:.0f} ms")
@@ -0,0 +1,255 @@
+"""
+Crash-safe Print Spool
+
+Append-only on-disk log of encoded ESC/POS jobs. A job is written once
+(fsyncs are batched across concurrent writers), marked done when the
+printer accepted it, and anything still pending is replayed in order at
+startup or after a reconnect. Compaction rewrites only the pending jobs so
+the spool file stays bounded.
+
+Record layout: <type:u8><seq:u64><length:u32><crc32:u32><payload>
+"""
+
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+_HEADER = struct.Struct("<BQII")
+_JOB = 1
+_DONE = 2
+
+
+class SpoolFullError(Exception):
+    """The pending jobs already fill ``max_bytes``; the new job was not spooled"""
+
+
+class PrintSpool:
+    """Append-only spool of raw printer payloads"""
+
+    def __init__(self, path, fsync_interval=0.05, compact_bytes=1024 * 1024,
+                 max_bytes=8 * 1024 * 1024):
+        """
+        Args:
+            path: Spool file path (kept next to config.json)
+            fsync_interval: Delay used to batch fsyncs of done markers
+            compact_bytes: Compact once the file grows past this size
+            max_bytes: Hard cap; new jobs are refused while pending jobs fill it
+        """
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.compact_bytes = compact_bytes
+        self.max_bytes = max_bytes
+
+        self._lock = threading.RLock()
+        self._sync_cond = threading.Condition()
+        self._syncing = False
+        self._written = 0   # records written to the OS
+        self._synced = 0    # records known to be on disk
+        self._sync_timer = None
+
+        self._pending = OrderedDict()  # seq -> (payload offset, length)
+        self._next_seq = 1
+        self._size = 0
+        self._live = 0  # bytes still needed for pending jobs
+        self._rejected = 0  # jobs refused because the spool was full
+        # Called with the seq of each job the printer accepted (e.g. to update its print job)
+        self.on_done = None
+        self._load()
+        self._file = open(self.path, "ab")
+
+    # ------------------------------------------------------------------ load
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        valid_end = 0
+        with open(self.path, "rb") as f:
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                rtype, seq, length, crc = _HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc or rtype not in (_JOB, _DONE):
+                    break
+                if rtype == _JOB:
+                    self._pending[seq] = (valid_end + _HEADER.size, length)
+                else:
+                    self._pending.pop(seq, None)
+                self._next_seq = max(self._next_seq, seq + 1)
+                valid_end = f.tell()
+
+        # Drop a torn record left by a crash mid-write
+        if valid_end < os.path.getsize(self.path):
+            print(f"⚠️ Print spool: truncating torn tail at byte {valid_end}")
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_end)
+        self._size = valid_end
+        self._live = sum(_HEADER.size + length for _, length in self._pending.values())
+
+        if self._pending:
+            print(f"📂 Print spool: {len(self._pending)} pending job(s) to replay")
+
+    # ----------------------------------------------------------------- write
+
+    def _write_record(self, rtype, seq, payload=b""):
+        # Called with self._lock held
+        offset = self._size
+        self._file.write(_HEADER.pack(rtype, seq, len(payload), zlib.crc32(payload)) + payload)
+        self._size += _HEADER.size + len(payload)
+        self._written += 1
+        return offset + _HEADER.size
+
+    def append(self, payload, durable=True):
+        """
+        Spool an encoded job.
+
+        Returns the job sequence number. With ``durable`` the call returns
+        only once the record is fsynced; concurrent callers share one fsync.
+        """
+        with self._lock:
+            needed = _HEADER.size + len(payload)
+            if self._size + needed > self.max_bytes:
+                self._compact()
+                if self._size + needed > self.max_bytes:
+                    # Pending jobs were promised to the caller: never drop them for a new one
+                    self._rejected += 1
+                    raise SpoolFullError(f"Print spool full ({len(self._pending)} jobs pending)")
+            seq = self._next_seq
+            self._next_seq += 1
+            self._pending[seq] = (self._write_record(_JOB, seq, payload), len(payload))
+            self._live += _HEADER.size + len(payload)
+            record = self._written
+        if durable:
+            self._sync_upto(record)
+        return seq
+
+    def mark_done(self, seq):
+        """Mark a job as acknowledged by the printer"""
+        with self._lock:
+            entry = self._pending.pop(seq, None)
+            if entry is None:
+                return
+            self._live -= _HEADER.size + entry[1]
+            self._write_record(_DONE, seq)
+            # Only worth rewriting once most of the file is finished jobs
+            if self._size > self.compact_bytes and self._live < self._size // 2:
+                self._compact()
+        self._schedule_sync()
+        if self.on_done is not None:
+            try:
+                self.on_done(seq)
+            except Exception as e:
+                print(f"⚠️ Print spool done callback failed: {e}")
+
+    def _sync_upto(self, record):
+        with self._sync_cond:
+            while self._synced < record:
+                if not self._syncing:
+                    break
+                self._sync_cond.wait()
+            else:
+                return
+            self._syncing = True
+
+        # This thread is the leader: one fsync covers every record written so far
+        target = 0
+        try:
+            with self._lock:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                target = self._written
+        finally:
+            with self._sync_cond:
+                self._synced = max(self._synced, target)
+                self._syncing = False
+                self._sync_cond.notify_all()
+
+    def _schedule_sync(self):
+        with self._sync_cond:
+            if self._sync_timer is not None:
+                return
+            self._sync_timer = threading.Timer(self.fsync_interval, self._deferred_sync)
+            self._sync_timer.daemon = True
+            self._sync_timer.start()
+
+    def _deferred_sync(self):
+        with self._sync_cond:
+            self._sync_timer = None
+        try:
+            self._sync_upto(self._written)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Print spool fsync failed: {e}")
+
+    # ------------------------------------------------------------------ read
+
+    def is_pending(self, seq):
+        with self._lock:
+            return seq in self._pending
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def pending_jobs(self):
+        """Pending (seq, payload) pairs in the order they were spooled"""
+        with self._lock:
+            self._file.flush()
+            entries = list(self._pending.items())
+            jobs = []
+            with open(self.path, "rb") as f:
+                for seq, (offset, length) in entries:
+                    f.seek(offset)
+                    jobs.append((seq, f.read(length)))
+        return jobs
+
+    # --------------------------------------------------------------- compact
+
+    def _compact(self):
+        # Called with self._lock held: rewrite only the pending jobs
+        jobs = self.pending_jobs()
+        tmp_path = self.path + ".tmp"
+        pending = OrderedDict()
+        with open(tmp_path, "wb") as tmp:
+            offset = 0
+            for seq, payload in jobs:
+                tmp.write(_HEADER.pack(_JOB, seq, len(payload), zlib.crc32(payload)) + payload)
+                pending[seq] = (offset + _HEADER.size, len(payload))
+                offset += _HEADER.size + len(payload)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "ab")
+        if hasattr(os, "O_DIRECTORY"):
+            dir_fd = os.open(os.path.dirname(self.path) or ".", os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+        old_size = self._size
+        self._pending = pending
+        self._size = offset
+        self._live = offset
+        with self._sync_cond:
+            self._synced = self._written
+        print(f"🗜️ Print spool compacted: {old_size} → {offset} bytes ({len(pending)} pending)")
+
+    def get_stats(self):
+        with self._lock:
+            return {"pending": len(self._pending), "bytes": self._size, "rejected": self._rejected}
+
+    def close(self):
+        with self._sync_cond:
+            if self._sync_timer is not None:
+                self._sync_timer.cancel()
+                self._sync_timer = None
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
@@ -0,0 +1,665 @@
+"""
+Printer Discovery
+
+Shared printer tables and discovery helpers used by PrinterManager and the
+settings window.
+"""
+
+import errno
+import ipaddress
+import os
+import platform
+import queue
+import re
+import selectors
+import socket
+import subprocess
+import threading
+import time
+import uuid
+
+# USB interface class 7 = Printer (matches models missing from the table)
+USB_PRINTER_CLASS = 7
+
+# (VID, PID, name) — extend at runtime with register_usb_printer()
+COMMON_USB_PRINTERS = [
+    (0x20d1, 0x7009, "HPRT TP808"),
+    (0x20d1, 0x7007, "Xprinter XP-58"),
+    (0x04b8, 0x0202, "Epson TM-T20"),
+    (0x04b8, 0x0005, "Epson TMT20II"),
+    (0x1504, 0x0006, "Sewoo LK-P21"),
+    (0x0519, 0x0001, "Star TSP100"),
+    (0x0519, 0x0020, "Star mC-Print2"),
+    (0x0519, 0x0021, "Star mC-Print3"),
+    (0x0dd4, 0x0006, "Generic Thermal Printer"),
+]
+
+# Raw (JetDirect), LPD and IPP
+PRINTER_PORTS = (9100, 515, 631)
+
+# Sockets kept free for the rest of the app (HTTP workers, proxy pool, printer)
+FD_HEADROOM = 128
+MAX_SCAN_CONCURRENCY = 400  # under the 512-socket select() limit on Windows
+
+
+def default_scan_concurrency():
+    """
+    Connects in flight per scan, sized from the file descriptor limit:
+    macOS GUI apps start with a soft limit of 256
+    """
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (ImportError, ValueError, OSError):
+        return MAX_SCAN_CONCURRENCY  # Windows: no fd limit for sockets
+    if soft == resource.RLIM_INFINITY:
+        return MAX_SCAN_CONCURRENCY
+    return max(16, min(MAX_SCAN_CONCURRENCY, soft - FD_HEADROOM))
+
+
+# Networks wider than this are narrowed around the host's own address
+WIDEST_SCAN_PREFIX = 22
+
+# MAC OUI prefixes of receipt-printer vendors, used to rank ARP neighbors.
+# Printers on generic Wi-Fi/Ethernet modules (many HPRT, Xprinter and
+# Citizen units) carry the module maker's OUI: add those per site with
+# register_printer_oui() / "printer_ouis" in config.json.
+PRINTER_VENDOR_OUIS = {
+    "epson": ["00:00:48", "00:26:ab", "44:d2:44", "64:eb:8c", "9c:ae:d3", "a4:ee:57"],
+    "star": ["00:11:62"],
+    "citizen": [],
+    "hprt": [],
+    "xprinter": [],
+}
+
+_USB_ADDRESS_RE = re.compile(r'^(0x[0-9a-fA-F]+):(0x[0-9a-fA-F]+)(?::(.+))?$')
+
+
+def register_usb_printer(vid, pid, name):
+    """Add (or rename) a printer model in the shared USB table"""
+    for i, (known_vid, known_pid, _) in enumerate(COMMON_USB_PRINTERS):
+        if (known_vid, known_pid) == (vid, pid):
+            COMMON_USB_PRINTERS[i] = (vid, pid, name)
+            break
+    else:
+        COMMON_USB_PRINTERS.append((vid, pid, name))
+    USB_INDEX.invalidate()
+
+
+def parse_usb_address(address):
+    """
+    Parse a USB printer address ("0x20d1:0x7009" or "0x20d1:0x7009:<serial>").
+
+    Returns (vid, pid, serial_or_None), or None for non-USB addresses.
+    """
+    match = _USB_ADDRESS_RE.match((address or "").strip())
+    if not match:
+        return None
+    return int(match.group(1), 16), int(match.group(2), 16), match.group(3)
+
+
+class UsbPrinterIndex:
+    """
+    Single-pass USB enumeration cached as an index keyed by (VID, PID, serial).
+
+    The bus is walked once per refresh instead of once per known model. The
+    cache is refreshed when the device nodes under /dev/bus/usb change
+    (Linux) or after ``ttl`` seconds elsewhere.
+    """
+
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._refreshed_at = 0.0
+        self._signature = None
+
+    @staticmethod
+    def _bus_signature():
+        # Device nodes are created/removed on hotplug, which bumps the bus dir mtime
+        root = "/dev/bus/usb"
+        if not os.path.isdir(root):
+            return None
+        try:
+            return tuple(
+                (name, os.stat(os.path.join(root, name)).st_mtime_ns)
+                for name in sorted(os.listdir(root))
+            )
+        except OSError:
+            return None
+
+    def invalidate(self):
+        with self._lock:
+            self._refreshed_at = 0.0
+            self._signature = None
+
+    def _is_stale(self):
+        signature = self._bus_signature()
+        if signature is not None:
+            return signature != self._signature, signature
+        return time.monotonic() - self._refreshed_at > self.ttl, None
+
+    def printers(self, force=False):
+        """Known and class-7 USB printers, refreshed only when the bus changed"""
+        with self._lock:
+            stale, signature = self._is_stale()
+            if force or stale or not self._refreshed_at:
+                self._entries = self._enumerate()
+                self._refreshed_at = time.monotonic()
+                self._signature = signature
+            return list(self._entries.values())
+
+    def find(self, vid=None, pid=None, serial=None):
+        """First printer matching the given identity parts"""
+        for entry in self.printers():
+            if vid is not None and entry["vid"] != vid:
+                continue
+            if pid is not None and entry["pid"] != pid:
+                continue
+            if serial is not None and entry["serial"] != serial:
+                continue
+            return entry
+        return None
+
+    @staticmethod
+    def _read_serial(dev):
+        try:
+            import usb.util
+            if dev.iSerialNumber:
+                return usb.util.get_string(dev, dev.iSerialNumber)
+        except Exception:
+            pass  # Needs device permissions on some systems
+        return None
+
+    @staticmethod
+    def _is_printer_class(dev):
+        if dev.bDeviceClass == USB_PRINTER_CLASS:
+            return True
+        try:
+            for cfg in dev:
+                for intf in cfg:
+                    if intf.bInterfaceClass == USB_PRINTER_CLASS:
+                        return True
+        except Exception:
+            pass
+        return False
+
+    def _enumerate(self):
+        try:
+            import usb.core
+            devices = list(usb.core.find(find_all=True))
+        except Exception as e:
+            print(f"⚠️ USB enumeration failed: {e}")
+            return {}
+
+        known = {(vid, pid): name for vid, pid, name in COMMON_USB_PRINTERS}
+        entries = {}
+        for dev in devices:
+            vid, pid = dev.idVendor, dev.idProduct
+            name = known.get((vid, pid))
+            if name is None:
+                if not self._is_printer_class(dev):
+                    continue
+                name = f"USB Printer {vid:04x}:{pid:04x}"
+
+            serial = self._read_serial(dev)
+            if not serial:
+                # No readable serial: the physical port path is stable across replugs
+                ports = getattr(dev, "port_numbers", None)
+                port_path = ".".join(str(p) for p in ports) if ports else str(dev.address)
+                serial = f"bus{dev.bus}-port{port_path}"
+
+            entries[(vid, pid, serial)] = {
+                "vid": vid,
+                "pid": pid,
+                "serial": serial,
+                "name": name,
+                "known": (vid, pid) in known,
+                "address": f"{hex(vid)}:{hex(pid)}:{serial}",
+                "device": dev,
+            }
+
+        # Table models before generic class-7 matches, then by identity
+        return dict(sorted(entries.items(), key=lambda item: (not item[1]["known"], item[0])))
+
+
+USB_INDEX = UsbPrinterIndex()
+
+
+# ============================================================== LAN scanning
+
+def _interface_addresses():
+    """(ip, prefix_len) pairs for the host's IPv4 interfaces"""
+    system = platform.system()
+    found = []
+    try:
+        if system == "Linux":
+            out = subprocess.run(["ip", "-o", "-4", "addr", "show"],
+                                 capture_output=True, text=True, timeout=3).stdout
+            for ip, prefix in re.findall(r'inet (\d+\.\d+\.\d+\.\d+)/(\d+)', out):
+                found.append((ip, int(prefix)))
+        elif system == "Darwin":
+            out = subprocess.run(["ifconfig"], capture_output=True, text=True, timeout=3).stdout
+            for ip, mask in re.findall(r'inet (\d+\.\d+\.\d+\.\d+) netmask (0x[0-9a-fA-F]+)', out):
+                found.append((ip, bin(int(mask, 16)).count("1")))
+        elif system == "Windows":
+            out = subprocess.run(["ipconfig"], capture_output=True, text=True, timeout=3).stdout
+            pairs = re.findall(r'IPv4[^:]*:\s*(\d+\.\d+\.\d+\.\d+).*?Subnet Mask[^:]*:\s*(\d+\.\d+\.\d+\.\d+)',
+                               out, re.S)
+            for ip, mask in pairs:
+                found.append((ip, ipaddress.IPv4Network(f"0.0.0.0/{mask}").prefixlen))
+    except Exception as e:
+        print(f"⚠️ Could not list network interfaces: {e}")
+
+    if not found:
+        # Fallback: address of the default route, assumed /24
+        try:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.connect(("8.8.8.8", 53))  # UDP connect sends no packets
+            found.append((s.getsockname()[0], 24))
+            s.close()
+        except OSError:
+            pass
+    return found
+
+
+def local_ipv4_networks(widest_prefix=WIDEST_SCAN_PREFIX):
+    """Private IPv4 networks the host is attached to, e.g. [IPv4Network('192.168.1.0/24')]"""
+    networks = []
+    for ip, prefix in _interface_addresses():
+        addr = ipaddress.IPv4Address(ip)
+        if addr.is_loopback or addr.is_link_local or not addr.is_private:
+            continue
+        network = ipaddress.IPv4Interface(f"{ip}/{max(prefix, widest_prefix)}").network
+        if network not in networks:
+            networks.append(network)
+    return networks
+
+
+def scan_hosts(hosts, ports=PRINTER_PORTS, timeout=0.5, concurrency=None,
+               on_found=None, cancel=None, on_progress=None, rtts=None):
+    """
+    Probe every (host, port) with non-blocking connects.
+
+    Up to ``concurrency`` connects are in flight at once (default: from
+    ``default_scan_concurrency()``), so a /24 across three ports finishes
+    in about ``timeout`` × 2 instead of minutes. If the process runs out
+    of file descriptors anyway, new connects wait for in-flight ones.
+
+    Args:
+        hosts: Iterable of IP strings
+        ports: Ports to check on each host
+        timeout: Per-connect timeout in seconds
+        concurrency: Maximum sockets in flight (None = from the fd limit)
+        on_found: Optional callback(ip, port) for each open port
+        cancel: Optional threading.Event to stop early
+        on_progress: Optional callback(done, total), at most every 100 ms
+        rtts: Optional dict filled with ip -> connect round-trip in ms
+
+    Returns:
+        dict: ip -> sorted list of open ports
+    """
+    hosts = [str(host) for host in hosts]
+    total = len(hosts) * len(ports)
+    targets = ((host, port) for host in hosts for port in ports)
+    deferred = []  # targets put back after EMFILE
+    limit = {"concurrency": concurrency or default_scan_concurrency()}
+    selector = selectors.DefaultSelector()
+    in_flight = {}
+    found = {}
+    progress = {"done": 0, "reported_at": 0.0}
+    pending_codes = (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY, 10035)  # 10035 = WSAEWOULDBLOCK
+
+    def record(host, port, started):
+        found.setdefault(host, []).append(port)
+        if rtts is not None and host not in rtts:
+            rtts[host] = round((time.monotonic() - started) * 1000, 1)
+        if on_found:
+            on_found(host, port)
+
+    def launch():
+        while len(in_flight) < limit["concurrency"]:
+            try:
+                host, port = deferred.pop() if deferred else next(targets)
+            except StopIteration:
+                return
+            try:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            except OSError as e:
+                if e.errno not in (errno.EMFILE, errno.ENFILE):
+                    raise
+                if in_flight:
+                    # Out of file descriptors: wait for in-flight connects, and stay below this level
+                    deferred.append((host, port))
+                    if len(in_flight) < limit["concurrency"]:
+                        limit["concurrency"] = len(in_flight)
+                        print(f"⚠️ LAN scan hit the open-file limit - continuing with {limit['concurrency']} sockets")
+                    return
+                if not progress.get("starved"):
+                    progress["starved"] = True
+                    print("⚠️ LAN scan: no free file descriptors - skipping hosts")
+                progress["done"] += 1
+                continue
+            sock.setblocking(False)
+            started = time.monotonic()
+            try:
+                code = sock.connect_ex((host, port))
+            except OSError:
+                sock.close()
+                continue
+            if code == 0:
+                sock.close()
+                record(host, port, started)
+            elif code in pending_codes:
+                selector.register(sock, selectors.EVENT_WRITE, (host, port, started))
+                in_flight[sock] = time.monotonic() + timeout
+            else:
+                sock.close()
+
+    def finish(sock):
+        selector.unregister(sock)
+        del in_flight[sock]
+        sock.close()
+        progress["done"] += 1
+        if on_progress and time.monotonic() - progress["reported_at"] >= 0.1:
+            progress["reported_at"] = time.monotonic()
+            on_progress(progress["done"], total)
+
+    try:
+        launch()
+        while in_flight or deferred:
+            if cancel is not None and cancel.is_set():
+                break
+            for key, _ in selector.select(timeout=0.05):
+                sock = key.fileobj
+                host, port, started = key.data
+                if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                    record(host, port, started)
+                finish(sock)
+            now = time.monotonic()
+            for sock in [s for s, deadline in in_flight.items() if deadline <= now]:
+                finish(sock)
+            launch()
+    finally:
+        for sock in list(in_flight):
+            finish(sock)
+        selector.close()
+        if on_progress:
+            on_progress(total if not (cancel and cancel.is_set()) else progress["done"], total)
+
+    return {host: sorted(ports_open) for host, ports_open in found.items()}
+
+
+def _subnet_hosts(subnet):
+    if subnet is None:
+        networks = local_ipv4_networks()
+    elif subnet.endswith("."):
+        networks = [ipaddress.IPv4Network(f"{subnet}0/24")]  # legacy "192.168.1." prefix
+    else:
+        networks = [ipaddress.IPv4Network(subnet, strict=False)]
+    return networks, [str(h) for network in networks for h in network.hosts()]
+
+
+def format_lan_result(ip, ports, vendor=None):
+    details = []
+    if vendor:
+        details.append(vendor.capitalize())
+    if list(ports) != [9100]:
+        details.append(f"ports {'/'.join(str(p) for p in ports)}")
+    return f"{ip} ({', '.join(details)})" if details else ip
+
+
+def discover_lan_printers(subnet=None, ports=PRINTER_PORTS, timeout=0.5, concurrency=None):
+    """
+    Scan the local subnets for printers.
+
+    Args:
+        subnet: CIDR ("192.168.1.0/24"), legacy prefix ("192.168.1.") or
+            None to scan every attached private network
+    """
+    networks, hosts = _subnet_hosts(subnet)
+    print(f"🌐 Scanning LAN printers on {', '.join(str(n) for n in networks) or 'no networks'}...")
+    started = time.monotonic()
+    found = scan_hosts(hosts, ports, timeout=timeout, concurrency=concurrency)
+    results = [format_lan_result(ip, found[ip]) for ip in sorted(found, key=ipaddress.IPv4Address)]
+    print(f"✅ Found {len(results)} LAN printers in {time.monotonic() - started:.1f}s")
+    return results
+
+
+# ============================================================ ARP prefilter
+
+def register_printer_oui(vendor, prefix):
+    """Add a MAC prefix ("00:11:62") for a printer vendor"""
+    PRINTER_VENDOR_OUIS.setdefault(vendor.lower(), []).append(_normalize_mac(prefix)[:8])
+
+
+def _normalize_mac(mac):
+    # "0:11:62:4b:18:ff" / "00-11-62-4B-18-FF" -> "00:11:62:4b:18:ff"
+    parts = re.split(r'[:-]', mac.strip().lower())
+    return ":".join(p.zfill(2) for p in parts)
+
+
+def vendor_for_mac(mac):
+    """Printer vendor for a MAC address, or None"""
+    prefix = _normalize_mac(mac)[:8]
+    for vendor, prefixes in PRINTER_VENDOR_OUIS.items():
+        if prefix in prefixes:
+            return vendor
+    return None
+
+
+def read_neighbor_table():
+    """
+    Live IPv4 neighbors from the kernel ARP table as [(ip, mac)].
+
+    Reads /proc/net/arp on Linux and parses ``arp -a`` elsewhere; both are
+    local lookups that return in milliseconds.
+    """
+    neighbors = []
+    try:
+        if os.path.exists("/proc/net/arp"):
+            with open("/proc/net/arp") as f:
+                next(f)  # header
+                for line in f:
+                    fields = line.split()
+                    # fields: IP, HW type, Flags, HW address, Mask, Device
+                    if len(fields) >= 4 and fields[2] != "0x0" and fields[3] != "00:00:00:00:00:00":
+                        neighbors.append((fields[0], _normalize_mac(fields[3])))
+        else:
+            out = subprocess.run(["arp", "-a"], capture_output=True, text=True, timeout=3).stdout
+            mac_re = r'((?:[0-9a-fA-F]{1,2}[:-]){5}[0-9a-fA-F]{1,2})'
+            for ip, mac in re.findall(r'(\d+\.\d+\.\d+\.\d+)\)?\s+(?:at\s+)?' + mac_re, out):
+                neighbors.append((ip, _normalize_mac(mac)))
+    except Exception as e:
+        print(f"⚠️ Could not read ARP table: {e}")
+    return neighbors
+
+
+def rank_neighbors(neighbors, networks=None):
+    """
+    Neighbors inside ``networks`` ordered with known printer vendors first.
+
+    Returns [(ip, mac, vendor_or_None)].
+    """
+    ranked = []
+    for ip, mac in neighbors:
+        addr = ipaddress.IPv4Address(ip)
+        if networks and not any(addr in n for n in networks):
+            continue
+        ranked.append((ip, mac, vendor_for_mac(mac)))
+    order = list(PRINTER_VENDOR_OUIS)
+    ranked.sort(key=lambda n: (n[2] is None, order.index(n[2]) if n[2] else 0, ipaddress.IPv4Address(n[0])))
+    return ranked
+
+
+# ======================================================= streaming discovery
+
+BRAND_KEYWORDS = {
+    "epson": ["epson", "tm-t", "tm-m", "tm-p"],
+    "star": ["star", "tsp", "mc-print", "mcp", "sm-l", "sm-s"],
+    "citizen": ["citizen", "ct-s", "cl-s", "cmp"],
+    "hprt": ["hprt", "tp80", "tp808"],
+    "xprinter": ["xprinter", "xp-"],
+    "bixolon": ["bixolon", "srp-"],
+}
+
+
+def detect_brand_from_name(name):
+    """Printer brand from a device name, or None"""
+    name = (name or "").lower()
+    for brand, keywords in BRAND_KEYWORDS.items():
+        if any(keyword in name for keyword in keywords):
+            return brand
+    return None
+
+
+class DiscoverySession:
+    """
+    One discovery run over several transports at once.
+
+    Each transport runs in its own thread and pushes events into a queue
+    as printers are found, so callers can stream results (Server-Sent
+    Events) instead of waiting for the slowest transport.
+
+    Event types: printer, progress, transport_done, error, done.
+    """
+
+    TRANSPORTS = ("lan", "usb", "bluetooth")
+
+    def __init__(self, transports=TRANSPORTS, subnet=None, bluetooth_duration=6, concurrency=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.transports = [t for t in transports if t in self.TRANSPORTS]
+        self.subnet = subnet
+        self.concurrency = concurrency
+        self.bluetooth_duration = bluetooth_duration
+        self.events = queue.Queue()
+        self.cancelled = threading.Event()
+        self.started_at = time.time()
+        self._seen = set()
+        self._seen_lock = threading.Lock()
+        self._remaining = len(self.transports)
+
+    def start(self):
+        DISCOVERY_SESSIONS[self.id] = self
+        if not self.transports:
+            self._emit("done", found=0)
+        for transport in self.transports:
+            threading.Thread(
+                target=self._run_transport, args=(transport,),
+                name=f"discover-{transport}", daemon=True
+            ).start()
+        return self
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _emit(self, event_type, **data):
+        data["type"] = event_type
+        data["elapsed_ms"] = round((time.time() - self.started_at) * 1000)
+        self.events.put(data)
+
+    def _found(self, transport, address, name=None, brand=None, label=None, **extra):
+        with self._seen_lock:
+            if (transport, address) in self._seen:
+                return
+            self._seen.add((transport, address))
+        # Same "address - name" format as scan_printers, so the UI parses both
+        label = label or (f"{address} - {name}" if name else address)
+        self._emit("printer", transport=transport, address=address, name=name,
+                   brand=brand or detect_brand_from_name(name), label=label, **extra)
+
+    def _run_transport(self, transport):
+        try:
+            getattr(self, f"_discover_{transport}")()
+        except Exception as e:
+            self._emit("error", transport=transport, error=str(e))
+        finally:
+            self._emit("transport_done", transport=transport)
+            with self._seen_lock:
+                self._remaining -= 1
+                finished = self._remaining == 0
+            if finished:
+                self._emit("done", found=len(self._seen), cancelled=self.cancelled.is_set())
+                DISCOVERY_SESSIONS.pop(self.id, None)
+
+    def _discover_lan(self):
+        networks, hosts = _subnet_hosts(self.subnet)
+        neighbors = rank_neighbors(read_neighbor_table(), networks)
+        macs = {ip: mac for ip, mac, _ in neighbors}
+        rtts = {}
+
+        def on_found(ip, port):
+            mac = macs.get(ip)
+            if mac is None:
+                # The connect just populated the ARP entry
+                macs.update(read_neighbor_table())
+                mac = macs.get(ip)
+            vendor = vendor_for_mac(mac) if mac else None
+            self._found("lan", ip, brand=vendor, label=format_lan_result(ip, [port], vendor),
+                        port=port, mac=mac, rtt_ms=rtts.get(ip))
+
+        def on_progress(done, total):
+            self._emit("progress", transport="lan", done=done, total=total)
+
+        # Live neighbors first (milliseconds), then the full sweep
+        scan_hosts([ip for ip, _, _ in neighbors], PRINTER_PORTS, timeout=0.3, concurrency=self.concurrency,
+                   on_found=on_found, cancel=self.cancelled, rtts=rtts)
+        if not self.cancelled.is_set():
+            remaining = [h for h in hosts if h not in macs]
+            scan_hosts(remaining, PRINTER_PORTS, timeout=0.5, concurrency=self.concurrency,
+                       on_found=on_found, cancel=self.cancelled, on_progress=on_progress, rtts=rtts)
+
+    def _discover_usb(self):
+        for entry in USB_INDEX.printers(force=True):
+            self._found("usb", entry["address"], entry["name"])
+        self._emit("progress", transport="usb", done=1, total=1)
+
+    def _discover_bluetooth(self):
+        try:
+            import bluetooth
+        except ImportError:
+            bluetooth = None
+
+        if bluetooth is not None:
+            # PyBluez returns only at the end of the inquiry
+            for addr, name in bluetooth.discover_devices(duration=self.bluetooth_duration, lookup_names=True):
+                self._found("bluetooth", addr, name)
+            return
+
+        # bleak streams advertisements as they arrive
+        import asyncio
+        try:
+            from bleak import BleakScanner
+        except ImportError:
+            raise RuntimeError("Bluetooth discovery needs PyBluez or bleak installed")
+
+        def on_detect(device, advertisement_data):
+            if device.name:
+                self._found("bluetooth", device.address, device.name)
+
+        async def scan():
+            async with BleakScanner(detection_callback=on_detect):
+                deadline = time.monotonic() + self.bluetooth_duration
+                while time.monotonic() < deadline and not self.cancelled.is_set():
+                    await asyncio.sleep(0.2)
+                    left = max(0.0, deadline - time.monotonic())
+                    self._emit("progress", transport="bluetooth",
+                               done=round(self.bluetooth_duration - left, 1), total=self.bluetooth_duration)
+
+        asyncio.run(scan())
+
+    def iter_events(self, heartbeat=10.0):
+        """Yield events until the run is done; None is yielded as a heartbeat"""
+        while True:
+            try:
+                event = self.events.get(timeout=heartbeat)
+            except queue.Empty:
+                yield None
+                continue
+            yield event
+            if event["type"] == "done":
+                return
+
+
+# Running sessions by id, so a separate request can cancel one
+DISCOVERY_SESSIONS = {}
@@ -5,7 +5,65 @@ All printer drivers must inherit from this class.
 """
 
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable
+
+from escpos_encoder import SUPPORTED_CODEPAGES, EscPosEncoder, get_encoder
+from receipt_layout import get_layout, is_structured
+
+
+class CommandBuffer:
+    """
+    A complete ESC/POS job assembled in memory.
+
+    Text is truncated to the paper's columns and encoded in one pass;
+    the driver sends ``getvalue()`` to the printer in a single write.
+    """
+
+    def __init__(self, columns: int, encoder: EscPosEncoder):
+        self.columns = columns
+        self.encoder = encoder
+        self.data = bytearray(encoder.preamble)
+        self.lines = 0
+        self.truncated = 0
+
+    def text(self, text: str) -> "CommandBuffer":
+        """Append text; every line ends with a newline"""
+        lines = []
+        for line in text.split("\n"):
+            if not line.strip():
+                line = ""
+            elif len(line) > self.columns:
+                line = line[:self.columns]
+                self.truncated += 1
+            lines.append(line)
+        lines.append("")
+        self.data += self.encoder.encode_body("\n".join(lines))
+        self.lines += len(lines) - 1
+        return self
+
+    def receipt(self, receipt_data: Dict[str, Any]) -> "CommandBuffer":
+        """Append a structured receipt laid out for this job's width and brand"""
+        layout = get_layout(receipt_data.get("template", "receipt"), self.encoder.width, self.encoder.brand)
+        body = layout.encode(receipt_data)
+        self.data += body
+        self.lines += body.count(b"\n")
+        return self
+
+    def feed(self, lines: int = 1) -> "CommandBuffer":
+        self.data += b"\n" * lines
+        return self
+
+    def raw(self, data: bytes) -> "CommandBuffer":
+        self.data += data
+        return self
+
+    def cut(self) -> "CommandBuffer":
+        """Feed past the cutter and cut"""
+        self.data += self.encoder.trailer
+        return self
+
+    def getvalue(self) -> bytes:
+        return bytes(self.data)
 
 
 class BasePrinterDriver(ABC):
@@ -24,6 +82,52 @@ class BasePrinterDriver(ABC):
         self.paper_width = paper_width
         self.options = kwargs
         self.connected = False
+        self.last_job = None
+        self.job_stats = {"jobs": 0, "writes": 0, "bytes": 0}
+
+    @property
+    def columns(self) -> int:
+        """Characters per line at Font A"""
+        return 32 if self.paper_width == 58 else 48
+
+    def new_job(self) -> CommandBuffer:
+        """Empty command buffer using this brand's codepage"""
+        brand = self.get_brand_name().lower()
+        codepage = SUPPORTED_CODEPAGES.get(brand, SUPPORTED_CODEPAGES["default"])
+        return CommandBuffer(self.columns, get_encoder(brand, codepage, self.paper_width))
+
+    def render_receipt(self, receipt_data: Dict[str, Any]) -> CommandBuffer:
+        """
+        Complete job for a receipt: structured receipts go through the
+        layout engine, legacy ``{"text": ...}`` ones print as text
+        """
+        job = self.new_job()
+        if is_structured(receipt_data):
+            job.receipt(receipt_data)
+        else:
+            job.text(receipt_data.get("text", ""))
+        return job.feed().cut()
+
+    def flush_job(self, job: CommandBuffer, write: Callable[[bytes], Any]) -> None:
+        """
+        Send a finished job with one write and record its size
+
+        Args:
+            job: Command buffer built with new_job()
+            write: Transport write, e.g. python-escpos ``printer._raw``
+        """
+        data = job.getvalue()
+        write(data)
+        self.last_job = {"writes": 1, "bytes": len(data), "lines": job.lines, "truncated": job.truncated}
+        self.job_stats["jobs"] += 1
+        self.job_stats["writes"] += 1
+        self.job_stats["bytes"] += len(data)
+        print(f"🧾 {self.get_brand_name()} job: {job.lines} lines, {len(data)} bytes in 1 write"
+              + (f" ({job.truncated} lines truncated to {job.columns} columns)" if job.truncated else ""))
+
+    def get_job_stats(self) -> Dict[str, Any]:
+        """Totals since connect plus the last job's writes and bytes"""
+        return dict(self.job_stats, last_job=self.last_job)
         
     @abstractmethod
     def connect(self) -> bool:
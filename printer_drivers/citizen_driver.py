@@ -6,6 +6,7 @@ Uses ESC/POS with Citizen-specific commands for Citizen printers (CT-S, CL-S, CM
 
 from typing import Dict, Any
 from .base_driver import BasePrinterDriver
+from receipt_layout import receipt_text
 import subprocess
 
 
@@ -76,25 +77,9 @@ class CitizenDriver(BasePrinterDriver):
         try:
             # Try direct printing
             if self.printer:
-                max_chars = 32 if self.paper_width == 58 else 48
-                lines = text.split("\n")
-                
-                for line in lines:
-                    if line.strip():
-                        self.printer.text(line[:max_chars] + "\n")
-                    else:
-                        self.printer.text("\n")
-                
-                self.printer.text("\n")
-                
-                try:
-                    self.printer.cut()
-                except:
-                    try:
-                        self.printer.cut(mode='PART')
-                    except:
-                        pass
-                
+                # Whole job in memory, one write (one TCP send on Network printers)
+                job = self.new_job().text(text).feed().cut()
+                self.flush_job(job, self.printer._raw)
                 return True
             
             # Fallback to CUPS
@@ -135,8 +120,15 @@ class CitizenDriver(BasePrinterDriver):
     
     def print_receipt(self, receipt_data: Dict[str, Any]) -> bool:
         """Print formatted receipt"""
-        text = receipt_data.get('text', '')
-        return self.print_text(text)
+        if self.connected and self.printer:
+            try:
+                self.flush_job(self.render_receipt(receipt_data), self.printer._raw)
+                return True
+            except Exception as e:
+                print(f"❌ Citizen receipt error: {e}")
+                return False
+        # CUPS / IPP: same layout as plain text
+        return self.print_text(receipt_text(receipt_data, self.paper_width))
     
     @staticmethod
     def detect(device_name: str, device_address: str) -> bool:
@@ -6,6 +6,7 @@ Uses ePOS SDK for Epson printers (TM-T, TM-m, TM-P series)
 
 from typing import Dict, Any
 from .base_driver import BasePrinterDriver
+from receipt_layout import receipt_text
 import subprocess
 
 
@@ -93,25 +94,9 @@ class EpsonDriver(BasePrinterDriver):
             
             # Try direct ESC/POS printing only for POS printers
             if self.printer and is_pos:
-                max_chars = 32 if self.paper_width == 58 else 48
-                lines = text.split("\n")
-                
-                for line in lines:
-                    if line.strip():
-                        self.printer.text(line[:max_chars] + "\n")
-                    else:
-                        self.printer.text("\n")
-                
-                self.printer.text("\n")
-                
-                try:
-                    self.printer.cut()
-                except:
-                    try:
-                        self.printer.cut(mode='PART')
-                    except:
-                        pass
-                
+                # Whole job in memory, one write (one TCP send on Network printers)
+                job = self.new_job().text(text).feed().cut()
+                self.flush_job(job, self.printer._raw)
                 return True
             
             # Use CUPS for office printers
@@ -173,8 +158,15 @@ class EpsonDriver(BasePrinterDriver):
     
     def print_receipt(self, receipt_data: Dict[str, Any]) -> bool:
         """Print formatted receipt"""
-        text = receipt_data.get('text', '')
-        return self.print_text(text)
+        if self.connected and self.printer and self.is_pos_printer(self.options.get('device_name', '')):
+            try:
+                self.flush_job(self.render_receipt(receipt_data), self.printer._raw)
+                return True
+            except Exception as e:
+                print(f"❌ Epson receipt error: {e}")
+                return False
+        # CUPS / IPP: same layout as plain text
+        return self.print_text(receipt_text(receipt_data, self.paper_width))
     
     @staticmethod
     def detect(device_name: str, device_address: str) -> bool:
@@ -6,6 +6,7 @@ Uses StarXpand SDK for Star printers (TSP, mC-Print, SM-L, SM-S series)
 
 from typing import Dict, Any, Optional
 from .base_driver import BasePrinterDriver
+from receipt_layout import receipt_text
 import subprocess
 import platform
 
@@ -124,11 +125,16 @@ class StarDriver(BasePrinterDriver):
             return False
     
     def print_receipt(self, receipt_data: Dict[str, Any]) -> bool:
-        """Print formatted receipt"""
-        # For now, convert to text and use print_text
-        # TODO: Implement proper formatting with Star SDK commands
-        text = receipt_data.get('text', '')
-        return self.print_text(text)
+        """
+        Print formatted receipt.
+
+        Structured receipts are laid out as plain text: the SDK and CUPS
+        paths take text, not ESC/POS, so bold and double-height lines print
+        at normal weight and size. For full styling, connect a Star printer
+        over LAN/USB through PrinterManager, which sends ReceiptLayout's
+        ESC/POS output.
+        """
+        return self.print_text(receipt_text(receipt_data, self.paper_width))
     
     @staticmethod
     def detect(device_name: str, device_address: str) -> bool:
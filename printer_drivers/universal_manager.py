@@ -188,6 +188,12 @@ class UniversalPrinterManager:
         
         return self.current_driver.print_receipt(receipt_data)
     
+    def get_job_stats(self) -> Dict[str, Any]:
+        """Write and byte counts of the current driver's print jobs"""
+        if self.current_driver:
+            return self.current_driver.get_job_stats()
+        return {}
+
     def get_current_brand(self) -> str:
         """Get current printer brand"""
         if self.current_driver:
@@ -1,34 +1,256 @@
 import os
 import glob
+import time
+import select
 import socket
+import threading
 import usb.core
 import usb.util
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from escpos import printer
+from escpos_encoder import SUPPORTED_CODEPAGES, get_encoder
+from receipt_layout import get_layout, is_structured
+from printer_discovery import USB_INDEX, parse_usb_address
+from print_spool import SpoolFullError
 
-SUPPORTED_CODEPAGES = {
-    "default": b'\x12',   # CP858
-    "epson": b'\x02',     # CP850
-    "star": b'\x12',      # CP858
-    "hprt": b'\x12',      # CP858 (tested OK)
-    "xprinter": b'\x12',  # CP858
-    "bixolon": b'\x02',   # CP850
-}
-
-COMMON_USB_PRINTERS = [
-    (0x20d1, 0x7009, "HPRT TP808"),
-    (0x20d1, 0x7007, "Xprinter XP-58"),
-    (0x04b8, 0x0202, "Epson TM-T20"),
-    (0x04b8, 0x0005, "Epson TMT20II"),
-    (0x1504, 0x0006, "Sewoo LK-P21"),
-    (0x0519, 0x0001, "Star TSP100"),
-    (0x0519, 0x0020, "Star mC-Print2"),
-    (0x0519, 0x0021, "Star mC-Print3"),
-    (0x0dd4, 0x0006, "Generic Thermal Printer"),
-]
+RAW_PRINT_PORT = 9100
+
+# GS I 66: نام سازنده پرینتر (پاسخ: "_EPSON\0")
+BRAND_QUERY = b'\x1dI\x42'
+
+# auto_connect: ترتیب ترجیح و مهلت هر transport (ثانیه)
+DEFAULT_TRANSPORT_ORDER = ["usb", "serial", "lan"]
+TRANSPORT_DEADLINES = {"usb": 4.0, "serial": 2.0, "lan": 3.0}
+
+
+class _PooledConnection:
+    """One warm socket to a single printer, guarded by its own lock"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.lock = threading.Lock()
+        self.sock = None
+        self.last_used = 0.0
+        self.stats = {
+            "sends": 0,
+            "connects": 0,
+            "reuses": 0,
+            "reconnects": 0,
+            "health_check_failures": 0,
+            "idle_closes": 0,
+        }
+
+
+class LanConnectionPool:
+    """
+    Per-printer pool of persistent port-9100 sockets.
+
+    Most thermal printers only accept one raw connection at a time, so the
+    pool keeps exactly one warm socket per (host, port) and serializes jobs
+    on it. Idle sockets are health-checked before reuse and closed by a
+    reaper after ``idle_timeout`` so other terminals can reach the printer.
+    """
+
+    def __init__(self, connect_timeout=5.0, send_timeout=10.0, idle_timeout=30.0,
+                 health_check_after=2.0):
+        self.connect_timeout = connect_timeout
+        self.send_timeout = send_timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self._conns = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def _get(self, host, port):
+        key = (host, port)
+        with self._lock:
+            conn = self._conns.get(key)
+            if conn is None:
+                conn = self._conns[key] = _PooledConnection(host, port)
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_idle, daemon=True)
+                self._reaper.start()
+            return conn
+
+    def _open_socket(self, host, port):
+        sock = socket.create_connection((host, port), timeout=self.connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # Detect dead printers within ~30 s instead of the OS default of hours
+        try:
+            if hasattr(socket, "SIO_KEEPALIVE_VALS"):  # Windows
+                sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, 15000, 5000))
+            else:
+                if hasattr(socket, "TCP_KEEPIDLE"):
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 15)
+                elif hasattr(socket, "TCP_KEEPALIVE"):  # macOS
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, 15)
+                if hasattr(socket, "TCP_KEEPINTVL"):
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 5)
+                if hasattr(socket, "TCP_KEEPCNT"):
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+        except OSError as e:
+            print(f"⚠️ Could not tune TCP keepalive: {e}")
+        sock.settimeout(self.send_timeout)
+        return sock
+
+    @staticmethod
+    def _close_socket(conn):
+        if conn.sock:
+            try:
+                conn.sock.close()
+            except OSError:
+                pass
+        conn.sock = None
+
+    @staticmethod
+    def _is_alive(sock):
+        """Non-blocking check that the peer has not closed an idle socket"""
+        try:
+            readable, _, errored = select.select([sock], [], [sock], 0)
+            if errored:
+                return False
+            if readable:
+                # Printers may push status bytes; an empty read means FIN
+                return sock.recv(1024) != b''
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def send(self, host, data, port=RAW_PRINT_PORT):
+        """Send raw bytes to the printer, reusing a warm socket if possible"""
+        conn = self._get(host, port)
+        with conn.lock:
+            conn.stats["sends"] += 1
+            reused = False
+            if conn.sock is not None:
+                idle_for = time.monotonic() - conn.last_used
+                if idle_for >= self.health_check_after and not self._is_alive(conn.sock):
+                    conn.stats["health_check_failures"] += 1
+                    self._close_socket(conn)
+                else:
+                    reused = True
+
+            if conn.sock is None:
+                conn.sock = self._open_socket(host, port)
+                conn.stats["connects"] += 1
+            else:
+                conn.stats["reuses"] += 1
+
+            try:
+                conn.sock.sendall(data)
+            except OSError as e:
+                self._close_socket(conn)
+                if not reused:
+                    raise
+                # Broken pipe on a reused socket: reconnect once and resend
+                print(f"🔁 Pooled connection to {host}:{port} broken ({e}), reconnecting...")
+                conn.stats["reconnects"] += 1
+                conn.sock = self._open_socket(host, port)
+                conn.stats["connects"] += 1
+                try:
+                    conn.sock.sendall(data)
+                except OSError:
+                    self._close_socket(conn)
+                    raise
+            conn.last_used = time.monotonic()
+
+    def query(self, host, data, port=RAW_PRINT_PORT, timeout=2.0, max_bytes=128):
+        """
+        Send a status/ID request on the pooled socket and read the reply.
+
+        Returns the bytes received (up to a NUL terminator), or b'' if the
+        printer does not answer within ``timeout``.
+        """
+        conn = self._get(host, port)
+        reply = b""
+        with conn.lock:
+            if conn.sock is None or not self._is_alive(conn.sock):
+                self._close_socket(conn)
+                conn.sock = self._open_socket(host, port)
+                conn.stats["connects"] += 1
+            try:
+                conn.sock.sendall(data)
+                conn.sock.settimeout(timeout)
+                while len(reply) < max_bytes and not reply.endswith(b"\x00"):
+                    chunk = conn.sock.recv(max_bytes - len(reply))
+                    if not chunk:
+                        self._close_socket(conn)
+                        break
+                    reply += chunk
+            except socket.timeout:
+                pass
+            except OSError:
+                self._close_socket(conn)
+                raise
+            finally:
+                if conn.sock is not None:
+                    conn.sock.settimeout(self.send_timeout)
+            conn.last_used = time.monotonic()
+        return reply
+
+    def warm(self, host, port=RAW_PRINT_PORT):
+        """Open (or health-check) the pooled socket without sending a job"""
+        conn = self._get(host, port)
+        with conn.lock:
+            if conn.sock is not None and self._is_alive(conn.sock):
+                return True
+            self._close_socket(conn)
+            conn.sock = self._open_socket(host, port)
+            conn.stats["connects"] += 1
+            conn.last_used = time.monotonic()
+        return True
+
+    def close(self, host=None, port=RAW_PRINT_PORT):
+        """Close the pooled socket for one printer, or all of them"""
+        with self._lock:
+            conns = list(self._conns.values())
+        for conn in conns:
+            if host is not None and (conn.host, conn.port) != (host, port):
+                continue
+            with conn.lock:
+                self._close_socket(conn)
+
+    def _reap_idle(self):
+        while True:
+            time.sleep(max(1.0, self.idle_timeout / 3))
+            now = time.monotonic()
+            with self._lock:
+                conns = list(self._conns.values())
+            for conn in conns:
+                if conn.sock is None or not conn.lock.acquire(blocking=False):
+                    continue
+                try:
+                    if conn.sock is not None and now - conn.last_used >= self.idle_timeout:
+                        self._close_socket(conn)
+                        conn.stats["idle_closes"] += 1
+                finally:
+                    conn.lock.release()
+
+    def get_stats(self):
+        """Pool statistics per printer plus totals, for /api/status"""
+        with self._lock:
+            conns = list(self._conns.values())
+        printers = {}
+        totals = {"sends": 0, "connects": 0, "reuses": 0, "reconnects": 0}
+        for conn in conns:
+            stats = dict(conn.stats)
+            stats["connected"] = conn.sock is not None
+            stats["reuse_ratio"] = round(stats["reuses"] / stats["sends"], 3) if stats["sends"] else 0.0
+            printers[f"{conn.host}:{conn.port}"] = stats
+            for key in totals:
+                totals[key] += stats[key]
+        totals["reuse_ratio"] = round(totals["reuses"] / totals["sends"], 3) if totals["sends"] else 0.0
+        return {"printers": printers, "totals": totals}
+
+
+# Shared by every PrinterManager so test prints and settings reloads keep the socket warm
+LAN_POOL = LanConnectionPool()
 
 
 class PrinterManager:
-    def __init__(self, mode="auto", address=None, width=80, brand="auto"):
+    def __init__(self, mode="auto", address=None, width=80, brand="auto", lan_pool=None, spool=None):
         self.mode = mode
         self.address = address
         self.width = width
@@ -38,125 +260,264 @@ class PrinterManager:
         self.usb_raw_device = None  # برای USB direct access
         self.usb_endpoint_out = None
         self.file_path = None
+        self.lan_pool = lan_pool or LAN_POOL
+        self.spool = spool  # PrintSpool برای نگه‌داشتن چاپ‌ها تا تایید پرینتر
+        self._spooled = threading.local()  # seq آخرین چاپ spool شده در همین thread
+        self._send_lock = threading.RLock()
+        self.supervisor = None  # ConnectionSupervisor، در صورت وجود اتصال مجدد را در پس‌زمینه انجام می‌دهد
 
     def auto_connect(self, preferred_type="auto", address=None, width=80):
-        """Auto-detect and connect to printer"""
+        """
+        Auto-detect and connect to printer.
+
+        All candidate transports are probed concurrently, each with its own
+        deadline. The preferred transport (configured type first, then USB,
+        serial, LAN) wins when several succeed; losers are closed.
+        """
+        winner = self.probe(preferred_type, address)
+        return self.apply_connection(winner, preferred_type, address, width)
+
+    def probe(self, preferred_type="auto", address=None):
+        """
+        Race the transports and return the winning probe result, or None.
+
+        Does not touch this manager's handles, so it can run without
+        holding the send lock; ``apply_connection`` installs the result.
+        """
+        print("🖨️ Auto-connecting to printer...")
+        started = time.monotonic()
+
+        probes = {"usb": lambda cancel: self._probe_usb(cancel, address), "serial": self._probe_serial}
+        if address and not parse_usb_address(address):
+            probes["lan"] = lambda cancel: self._probe_lan(address, cancel)
+        order = [t for t in self._transport_order(preferred_type) if t in probes]
+
+        cancel = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=len(order), thread_name_prefix="printer-probe")
+        futures = {t: executor.submit(probes[t], cancel) for t in order}
+
+        winner = None
+        for transport in order:
+            remaining = TRANSPORT_DEADLINES[transport] - (time.monotonic() - started)
+            try:
+                result = futures[transport].result(timeout=max(0.0, remaining))
+            except FutureTimeoutError:
+                print(f"⏱️ {transport} probe timed out after {TRANSPORT_DEADLINES[transport]}s")
+                continue
+            except Exception as e:
+                print(f"⚠️ {transport} probe failed: {e}")
+                continue
+            if result:
+                winner = result
+                break
+
+        # بقیه probeها را لغو و منابعشان را آزاد کن
+        cancel.set()
+        for transport, future in futures.items():
+            if winner is None or transport != winner["transport"]:
+                future.add_done_callback(self._discard_probe)
+        executor.shutdown(wait=False)
+
+        if winner is not None:
+            print(f"🏁 Connected via {winner['transport']} in {(time.monotonic() - started) * 1000:.0f} ms")
+        return winner
+
+    def apply_connection(self, winner, preferred_type="auto", address=None, width=80):
+        """Install a probe result from ``probe()``; False if there is none"""
         self.width = width
         self.address = address
         self.mode = preferred_type or "auto"
+        if winner is None:
+            print("❌ No printer found")
+            return False
+        self._apply_probe(winner)
+        return True
 
-        print("🖨️ Auto-connecting to printer...")
+    @staticmethod
+    def _transport_order(preferred_type):
+        order = list(DEFAULT_TRANSPORT_ORDER)
+        preferred = {"file": "serial"}.get(preferred_type, preferred_type)
+        if preferred in order:
+            order.remove(preferred)
+            order.insert(0, preferred)
+        return order
 
-        usb_printer = self._find_usb_printer()
-        if usb_printer:
-            vid, pid, name = usb_printer
-            print(f"🔌 Found USB printer: {name} ({hex(vid)}:{hex(pid)})")
+    def _probe_usb(self, cancel, address=None):
+        entry = self._find_usb_entry(address)
+        if not entry or cancel.is_set():
+            return None
+        vid, pid, name = usb_printer = (entry["vid"], entry["pid"], entry["name"])
+        print(f"🔌 Found USB printer: {name} ({entry['address']})")
+        
+        # راه حل اول: استفاده مستقیم از PyUSB
+        try:
+            dev = entry["device"]
             
-            # راه حل اول: استفاده مستقیم از PyUSB
+            # Detach kernel driver if needed
             try:
-                dev = usb.core.find(idVendor=vid, idProduct=pid)
-                if dev is None:
-                    raise ValueError("Device not found")
-                
-                # Detach kernel driver if needed
-                try:
-                    if dev.is_kernel_driver_active(0):
-                        print("🔧 Detaching kernel driver...")
-                        dev.detach_kernel_driver(0)
-                except:
-                    pass
-                
-                # Set configuration
-                try:
-                    dev.set_configuration()
-                except:
-                    pass
-                
-                # پیدا کردن bulk OUT endpoint
-                cfg = dev.get_active_configuration()
-                intf = cfg[(0, 0)]
-                
-                ep_out = None
-                for ep in intf:
-                    if usb.util.endpoint_direction(ep.bEndpointAddress) == usb.util.ENDPOINT_OUT:
-                        ep_out = ep
-                        break
-                
-                if ep_out:
-                    self.usb_raw_device = dev
-                    self.usb_endpoint_out = ep_out.bEndpointAddress
-                    self.usb_device = usb_printer
-                    self.mode = "usb"
-                    self.brand = self._detect_brand_from_name(name)
-                    print(f"✅ USB printer connected via PyUSB: {name} (endpoint: {hex(self.usb_endpoint_out)})")
-                    return True
-                else:
-                    print("⚠️ No OUT endpoint found")
-            except Exception as e:
-                print(f"⚠️ PyUSB direct connection failed: {e}")
+                if dev.is_kernel_driver_active(0):
+                    print("🔧 Detaching kernel driver...")
+                    dev.detach_kernel_driver(0)
+            except:
+                pass
             
-            # راه حل دوم: استفاده از python-escpos
-            print("🔄 Trying python-escpos fallback...")
-            endpoint_configs = [
-                (0x81, 0x02),
-                (0x82, 0x02),
-                (0x81, 0x03),
-                (None, None),
-            ]
+            # Set configuration
+            try:
+                dev.set_configuration()
+            except:
+                pass
             
-            for in_ep, out_ep in endpoint_configs:
-                try:
-                    if in_ep and out_ep:
-                        self.prn = printer.Usb(vid, pid, in_ep=in_ep, out_ep=out_ep)
-                        print(f"✅ USB printer connected via escpos: {name} (in={hex(in_ep)}, out={hex(out_ep)})")
-                    else:
-                        self.prn = printer.Usb(vid, pid)
-                        print(f"✅ USB printer connected via escpos: {name} (auto-detect)")
-                    
-                    self.usb_device = usb_printer
-                    self.mode = "usb"
-                    self.brand = self._detect_brand_from_name(name)
-                    return True
-                except Exception as e:
-                    if in_ep and out_ep:
-                        print(f"⚠️ escpos failed with in={hex(in_ep)}, out={hex(out_ep)}: {e}")
-                    else:
-                        print(f"⚠️ escpos failed with auto-detect: {e}")
-                    continue
+            # پیدا کردن bulk OUT endpoint
+            cfg = dev.get_active_configuration()
+            intf = cfg[(0, 0)]
             
-            print("❌ All USB connection methods failed")
-
-        serial_path = self._find_serial_printer()
-        if serial_path:
+            ep_out = None
+            for ep in intf:
+                if usb.util.endpoint_direction(ep.bEndpointAddress) == usb.util.ENDPOINT_OUT:
+                    ep_out = ep
+                    break
+            
+            if ep_out:
+                print(f"✅ USB printer connected via PyUSB: {name} (endpoint: {hex(ep_out.bEndpointAddress)})")
+                return self._commit_probe(cancel, {
+                    "transport": "usb",
+                    "usb_raw_device": dev,
+                    "usb_endpoint_out": ep_out.bEndpointAddress,
+                    "usb_device": usb_printer,
+                    "brand": self._detect_brand_from_name(name),
+                })
+            else:
+                print("⚠️ No OUT endpoint found")
+        except Exception as e:
+            print(f"⚠️ PyUSB direct connection failed: {e}")
+            USB_INDEX.invalidate()
+        
+        # راه حل دوم: استفاده از python-escpos
+        print("🔄 Trying python-escpos fallback...")
+        endpoint_configs = [
+            (0x81, 0x02),
+            (0x82, 0x02),
+            (0x81, 0x03),
+            (None, None),
+        ]
+        
+        for in_ep, out_ep in endpoint_configs:
+            if cancel.is_set():
+                return None
             try:
-                self.prn = printer.File(serial_path)
-                self.mode = "file"
-                self.file_path = serial_path
-                self.brand = self._detect_brand_from_name(serial_path)
-                print(f"✅ Connected via serial port: {serial_path}")
-                return True
+                if in_ep and out_ep:
+                    prn = printer.Usb(vid, pid, in_ep=in_ep, out_ep=out_ep)
+                    print(f"✅ USB printer connected via escpos: {name} (in={hex(in_ep)}, out={hex(out_ep)})")
+                else:
+                    prn = printer.Usb(vid, pid)
+                    print(f"✅ USB printer connected via escpos: {name} (auto-detect)")
+                
+                return self._commit_probe(cancel, {
+                    "transport": "usb",
+                    "prn": prn,
+                    "usb_device": usb_printer,
+                    "brand": self._detect_brand_from_name(name),
+                })
             except Exception as e:
-                print("❌ Serial printer connect failed:", e)
+                if in_ep and out_ep:
+                    print(f"⚠️ escpos failed with in={hex(in_ep)}, out={hex(out_ep)}: {e}")
+                else:
+                    print(f"⚠️ escpos failed with auto-detect: {e}")
+                continue
+        
+        print("❌ All USB connection methods failed")
+        return None
 
-        if address:
-            try:
-                self.prn = printer.Network(address)
-                self.mode = "lan"
-                self.brand = self.detect_brand()
-                print(f"✅ Connected to LAN printer ({address})")
-                return True
-            except Exception as e:
-                print("❌ LAN connect failed:", e)
+    def _probe_serial(self, cancel):
+        serial_path = self._find_serial_printer()
+        if not serial_path or cancel.is_set():
+            return None
+        try:
+            prn = printer.File(serial_path)
+            print(f"✅ Connected via serial port: {serial_path}")
+            return self._commit_probe(cancel, {
+                "transport": "serial",
+                "prn": prn,
+                "file_path": serial_path,
+                "brand": self._detect_brand_from_name(serial_path),
+            })
+        except Exception as e:
+            print("❌ Serial printer connect failed:", e)
+            return None
+
+    def _probe_lan(self, address, cancel):
+        if cancel.is_set():
+            return None
+        try:
+            # سوکت گرم در pool هم سلامت پرینتر را چک می‌کند و هم برای اولین چاپ آماده است
+            self.lan_pool.warm(address)
+            print(f"✅ Connected to LAN printer ({address})")
+            return self._commit_probe(cancel, {"transport": "lan", "prn": printer.Network(address),
+                                               "lan_address": address})
+        except Exception as e:
+            print("❌ LAN connect failed:", e)
+            return None
+
+    def _apply_probe(self, result):
+        transport = result["transport"]
+        self.prn = result.get("prn")
+        if transport == "usb":
+            self.usb_raw_device = result.get("usb_raw_device")
+            self.usb_endpoint_out = result.get("usb_endpoint_out")
+            self.usb_device = result["usb_device"]
+            self.mode = "usb"
+            self.brand = result["brand"]
+        elif transport == "serial":
+            self.mode = "file"
+            self.file_path = result["file_path"]
+            self.brand = result["brand"]
+        else:
+            self.mode = "lan"
+            self.brand = self.detect_brand()
+
+    def _discard_probe(self, future):
+        """Release a losing probe's handles once it finishes"""
+        try:
+            result = future.result()
+        except Exception:
+            return
+        if result:
+            self._release_probe(result)
+
+    def _release_probe(self, result):
+        try:
+            if result.get("prn"):
+                result["prn"].close()
+            if result.get("usb_raw_device"):
+                usb.util.dispose_resources(result["usb_raw_device"])
+            # The warm pool socket holds the printer's only connection
+            lan = result.get("lan_address")
+            if lan and not (self.mode == "lan" and self.address == lan):
+                self.lan_pool.close(lan)
+        except Exception as e:
+            print(f"⚠️ Could not release {result['transport']} probe: {e}")
 
-        print("❌ No printer found")
-        return False
+    def _commit_probe(self, cancel, result):
+        """Hand a probe's handles to the race, or release them if it was already decided"""
+        if cancel.is_set():
+            print(f"🗑️ {result['transport']} probe finished after the race - releasing it")
+            self._release_probe(result)
+            return None
+        return result
 
     def _find_usb_printer(self):
-        for vid, pid, name in COMMON_USB_PRINTERS:
-            dev = usb.core.find(idVendor=vid, idProduct=pid)
-            if dev:
-                return (vid, pid, name)
-        return None
+        entry = self._find_usb_entry()
+        return (entry["vid"], entry["pid"], entry["name"]) if entry else None
+
+    def _find_usb_entry(self, address=None):
+        """Configured USB printer (by VID:PID[:serial] address) or the first one found"""
+        wanted = parse_usb_address(address if address is not None else self.address)
+        if wanted:
+            entry = USB_INDEX.find(*wanted)
+            if entry:
+                return entry
+        printers = USB_INDEX.printers()
+        return printers[0] if printers else None
 
     def _find_serial_printer(self):
         serial_ports = glob.glob("/dev/tty.usb*") + glob.glob("/dev/ttyUSB*")
@@ -175,13 +536,9 @@ class PrinterManager:
             return self.brand
         try:
             if self.mode == "lan" and self.address:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(2)
-                sock.connect((self.address, 9100))
-                sock.send(b'\x1b@')
-                sock.send(b'\x1d(I\x02\x00')
-                data = sock.recv(128).decode(errors='ignore').lower()
-                sock.close()
+                # از همان سوکت pool: این پرینترها فقط یک اتصال را قبول می‌کنند
+                reply = self.lan_pool.query(self.address, b'\x1b@' + BRAND_QUERY)
+                data = reply.decode(errors='ignore').lower()
                 for brand in ["epson", "star", "hprt", "xprinter", "bixolon"]:
                     if brand in data:
                         self.brand = brand
@@ -192,43 +549,105 @@ class PrinterManager:
         self.brand = "default"
         return self.brand
 
-    def print_text(self, text):
+    def encode_text(self, text):
+        """Encode text into a complete ESC/POS job for the active brand"""
+        brand = self.detect_brand()
+        codepage = SUPPORTED_CODEPAGES.get(brand, b'\x12')
+        return get_encoder(brand, codepage, self.width).encode(text)
+
+    def encode_receipt(self, receipt):
+        """Encode a structured receipt (or legacy {"text": ...}) into a complete job"""
+        if not is_structured(receipt):
+            return self.encode_text(receipt.get("text", ""))
+        brand = self.detect_brand()
+        return get_layout(receipt.get("template", "receipt"), self.width, brand).encode_job(receipt)
+
+    def print_text(self, text, spool=True):
         if not text:
             return "EMPTY"
-        
+        return self._print_job(self.encode_text(text), spool)
+
+    def print_receipt(self, receipt, spool=True):
+        """Lay out and print a structured receipt"""
+        if not receipt:
+            return "EMPTY"
+        return self._print_job(self.encode_receipt(receipt), spool)
+
+    def _print_job(self, raw_data, spool=True):
+        # ثبت در spool قبل از ارسال، تا با قطع پرینتر یا ری‌استارت از دست نرود
+        # با supervisor و بدون اتصال: قبل از گرفتن قفل ارسال سریع برگرد، نه پشت اتصال مجدد
+        offline = self.supervisor is not None and not self.supervisor.connected
+        if spool and self.spool:
+            try:
+                seq = self._spooled.seq = self.spool.append(raw_data)
+            except SpoolFullError as e:
+                # بدون جا در spool: فقط اگر پرینتر وصل است مستقیم چاپ کن، وگرنه failed
+                print(f"⚠️ {e} - sending without the spool")
+                return self._print_job(raw_data, spool=False)
+            if offline:
+                return "ERROR: No printer connected (spooled for retry)"
+            with self._send_lock:
+                if not self._ensure_connected():
+                    return "ERROR: No printer connected (spooled for retry)"
+                sent, error = self.replay_spool()
+                if error and self.supervisor:
+                    self.supervisor.report_failure(error)
+                if self.spool.is_pending(seq):
+                    return f"{error or 'ERROR: Printer busy'} (spooled for retry)"
+                return "OK"
+
+        if offline:
+            return "ERROR: No printer connected"
+        with self._send_lock:
+            if not self._ensure_connected():
+                return "ERROR: No printer connected"
+            result = self.send_raw(raw_data)
+            if result != "OK" and self.supervisor:
+                self.supervisor.report_failure(result)
+            return result
+
+    def last_spooled_seq(self):
+        """Spool seq of the last job this thread spooled, to match it up when it is replayed"""
+        return getattr(self._spooled, "seq", None)
+
+    def _ensure_connected(self):
+        # با supervisor: بدون اسکن دوباره، سریع شکست بخور (اتصال مجدد در پس‌زمینه)
+        if self.supervisor:
+            return self.supervisor.connected
+
         # چک کردن اتصال (هم PyUSB هم escpos)
         if not self.prn and not self.usb_raw_device:
             print("⚠️ Printer not connected — retrying auto-connect...")
             self.auto_connect(self.mode, self.address, self.width)
-            if not self.prn and not self.usb_raw_device:
-                return "ERROR: No printer connected"
+        return bool(self.prn or self.usb_raw_device)
 
-        brand = self.detect_brand()
-        codepage = SUPPORTED_CODEPAGES.get(brand, b'\x12')
-
-        ESC = b'\x1b'
-        GS = b'\x1d'
-        init = ESC + b'@'
-        charset_sweden = ESC + b'R' + b'\x06'
-        select_codepage = ESC + b't' + codepage
+    def replay_spool(self):
+        """
+        Send pending spooled jobs in order, stopping at the first failure.
 
-        emoji_map = {'🚚': '', '✔️': 'OK', '🍕': '*', '🎊': '', '🧾': '', '━': '-', '¨': '~', '…': '...'}
-        text_clean = text
-        for e, r in emoji_map.items():
-            text_clean = text_clean.replace(e, r)
+        Returns (number of jobs sent, last error or None).
+        """
+        if not self.spool:
+            return 0, None
 
-        text_bytes = text_clean.encode("cp858", errors="replace")
-        feed = b'\n\n\n\n'
-        cut = GS + b'V' + b'\x00'
-        raw_data = init + charset_sweden + select_codepage + text_bytes + feed + cut
+        sent = 0
+        with self._send_lock:
+            for seq, raw_data in self.spool.pending_jobs():
+                result = self.send_raw(raw_data)
+                if result != "OK":
+                    return sent, result
+                self.spool.mark_done(seq)
+                sent += 1
+        if sent > 1:
+            print(f"📤 Replayed {sent} spooled print job(s)")
+        return sent, None
 
+    def send_raw(self, raw_data):
+        """Write an already-encoded job to the connected printer"""
+        brand = self.brand
         try:
             if self.mode == "lan" and self.address:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(5)
-                sock.connect((self.address, 9100))
-                sock.sendall(raw_data)
-                sock.close()
+                self.lan_pool.send(self.address, raw_data)
                 print(f"✅ LAN print OK ({brand})")
                 return "OK"
             
@@ -287,6 +706,10 @@ class PrinterManager:
                     usb.util.dispose_resources(self.usb_raw_device)
                 except:
                     pass
+
+            # بستن سوکت LAN نگه‌داشته‌شده در pool
+            if self.mode == "lan" and self.address:
+                self.lan_pool.close(self.address)
             
             print("🔌 Printer disconnected")
             self.prn = None
@@ -294,35 +717,3 @@ class PrinterManager:
             self.usb_endpoint_out = None
         except Exception as e:
             print(f"⚠️ Disconnect error: {e}")
-
-
-# LAN discovery
-def discover_lan_printers(subnet="192.168.1.", port=9100, timeout=0.3):
-    found = []
-    print("🌐 Scanning LAN printers...")
-    for i in range(1, 255):
-        ip = f"{subnet}{i}"
-        try:
-            s = socket.socket()
-            s.settimeout(timeout)
-            s.connect((ip, port))
-            found.append(ip)
-            s.close()
-        except:
-            pass
-    print(f"✅ Found {len(found)} LAN printers")
-    return found
-
-
-# Bluetooth discovery
-def discover_bluetooth_printers():
-    try:
-        import bluetooth
-        print("🔵 Scanning Bluetooth printers...")
-        nearby_devices = bluetooth.discover_devices(duration=6, lookup_names=True)
-        found = [f"{addr} - {name}" for addr, name in nearby_devices]
-        print(f"✅ Found {len(found)} Bluetooth devices")
-        return found
-    except Exception as e:
-        print("⚠️ Bluetooth scan error:", e)
-        return []
@@ -0,0 +1,180 @@
+"""
+Printer Connection Supervisor
+
+Background thread that owns the printer's connection state. Print calls
+never run auto_connect themselves when a supervisor is attached: they
+spool the job and fail fast, and the supervisor reconnects with
+exponential backoff and jitter, then replays the spool.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+
+DISCONNECTED = "disconnected"
+CONNECTING = "connecting"
+CONNECTED = "connected"
+BACKOFF = "backoff"
+
+
+class ConnectionSupervisor:
+    """Reconnects a PrinterManager in the background"""
+
+    def __init__(self, printer, get_settings, base_delay=1.0, max_delay=60.0,
+                 check_interval=30.0, max_transitions=20):
+        """
+        Args:
+            printer: PrinterManager to supervise
+            get_settings: Callable returning the printer config dict
+                (type, address, paper_width)
+            base_delay: First backoff delay in seconds
+            max_delay: Backoff ceiling in seconds
+            check_interval: How often a connected printer's spool is re-checked
+        """
+        self.printer = printer
+        self.get_settings = get_settings
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.check_interval = check_interval
+
+        self.state = DISCONNECTED
+        self.since = time.time()
+        self.attempts = 0
+        self.last_error = None
+        self.next_retry_at = None
+        self.transitions = deque(maxlen=max_transitions)
+
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._retry_after_attempt = False
+        self._thread = None
+        # Called (no arguments) when the printer is lost or a reconnect fails,
+        # e.g. to check whether a LAN printer moved to a new IP
+        self.on_failure = None
+        printer.supervisor = self
+
+    def start(self, connected=False):
+        """Start supervising; ``connected`` is the result of the startup connect"""
+        self._set_state(CONNECTED if connected else DISCONNECTED, "startup")
+        self._thread = threading.Thread(target=self._run, name="printer-supervisor", daemon=True)
+        self._thread.start()
+
+    @property
+    def connected(self):
+        return self.state == CONNECTED
+
+    def request_reconnect(self, reason="requested"):
+        """Drop the current connection and reconnect in the background"""
+        with self._lock:
+            self.attempts = 0
+            if self.state == CONNECTING:
+                # Settings changed mid-attempt: connect again afterwards
+                self._retry_after_attempt = True
+            else:
+                self._set_state(DISCONNECTED, reason)
+        self._wake.set()
+
+    def report_failure(self, error):
+        """Called from the print path when a write to the printer failed"""
+        with self._lock:
+            self.last_error = str(error)
+            lost = self.state == CONNECTED
+            if lost:
+                self._set_state(DISCONNECTED, f"print failed: {error}")
+        self._wake.set()
+        if lost:
+            self._notify_failure()
+
+    def _notify_failure(self):
+        if self.on_failure is not None:
+            try:
+                self.on_failure()
+            except Exception as e:
+                print(f"⚠️ Printer failure callback failed: {e}")
+
+    def _set_state(self, state, reason):
+        if state == self.state and self.transitions:
+            return
+        now = time.time()
+        self.transitions.append({"from": self.state, "to": state, "reason": reason, "at": now})
+        print(f"🔀 Printer connection: {self.state} → {state} ({reason})")
+        self.state = state
+        self.since = now
+
+    def _backoff_delay(self):
+        # Exponential backoff with "equal jitter": half fixed, half random
+        delay = min(self.max_delay, self.base_delay * (2 ** min(self.attempts, 16)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _connect_once(self):
+        settings = self.get_settings() or {}
+        printer = self.printer
+        preferred_type = settings.get("type", "auto")
+        address = settings.get("address", None)
+        # The send lock is held only to drop and to install handles: the
+        # probes can take seconds, and prints must not wait behind them
+        with printer._send_lock:
+            printer.disconnect()
+        winner = printer.probe(preferred_type, address)
+        with printer._send_lock:
+            return printer.apply_connection(winner, preferred_type, address, settings.get("paper_width", 80))
+
+    def _run(self):
+        while True:
+            if self.state == CONNECTED:
+                self._wake.wait(self.check_interval)
+                self._wake.clear()
+                if self.state == CONNECTED and self.printer.spool and self.printer.spool.pending_count():
+                    sent, error = self.printer.replay_spool()
+                    if error:
+                        self.report_failure(error)
+                continue
+
+            with self._lock:
+                self._set_state(CONNECTING, f"attempt {self.attempts + 1}")
+                self.next_retry_at = None
+                self._retry_after_attempt = False
+            try:
+                ok = self._connect_once()
+            except Exception as e:
+                ok = False
+                self.last_error = str(e)
+
+            if self._retry_after_attempt:
+                with self._lock:
+                    self._set_state(DISCONNECTED, "settings changed while connecting")
+                continue
+
+            if ok:
+                with self._lock:
+                    self.attempts = 0
+                    self.last_error = None
+                    self._set_state(CONNECTED, f"{self.printer.mode} connected")
+                self._wake.clear()
+                sent, error = self.printer.replay_spool()
+                if error:
+                    self.report_failure(error)
+                continue
+
+            with self._lock:
+                delay = self._backoff_delay()
+                self.attempts += 1
+                self.next_retry_at = time.time() + delay
+                if self.state == CONNECTING:
+                    self._set_state(BACKOFF, f"retry in {delay:.1f}s")
+            self._notify_failure()
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def get_status(self):
+        """Connection state for /api/status"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "since": self.since,
+                "attempts": self.attempts,
+                "last_error": self.last_error,
+                "next_retry_in": round(max(0.0, self.next_retry_at - time.time()), 1) if self.next_retry_at else None,
+                "transitions": list(self.transitions),
+            }
@@ -0,0 +1,401 @@
+"""
+Disk Cache for Proxied Responses
+
+HTTP cache (RFC 7234) for GET responses that ``reverse_proxy`` fetches
+from the remote server. Entries live in an LRU directory with a size cap
+(``proxy_cache/`` next to config.json). Stale entries are revalidated
+with ETag / Last-Modified, may be served while a background revalidation
+runs (stale-while-revalidate), and are served when the server cannot be
+reached (stale-if-error). Stale copies are served only when the response
+carries those directives; defaults for static assets are opt-in.
+"""
+
+import email.utils
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CACHEABLE_STATUS = {200, 203, 300, 301, 308, 404, 410}
+
+# Bodies are stored as received (still compressed); older entries are ignored
+CACHE_FORMAT = 2
+
+# Content types the stale_* defaults may apply to (never HTML or API responses)
+STATIC_TYPES = ("text/css", "application/javascript", "text/javascript", "font/", "image/",
+                "application/font", "application/x-font")
+
+# Hop-by-hop and per-response headers that are not stored
+_UNSTORED_HEADERS = {
+    "connection", "keep-alive", "transfer-encoding", "content-length",
+    "set-cookie", "age", "te", "trailer", "upgrade",
+}
+
+
+def parse_cache_control(value):
+    """'max-age=60, no-cache' -> {'max-age': '60', 'no-cache': None}"""
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') if arg else None
+    return directives
+
+
+def is_static_type(content_type):
+    """CSS, JavaScript, fonts and images - never HTML or API responses"""
+    return (content_type or "").lower().startswith(STATIC_TYPES)
+
+
+def is_shareable(response_headers):
+    """False for responses tied to one user: Set-Cookie, private, no-store or Vary: *"""
+    response_cc = parse_cache_control(response_headers.get("Cache-Control"))
+    if {"no-store", "private"} & set(response_cc):
+        return False
+    return response_headers.get("Vary", "").strip() != "*" and "Set-Cookie" not in response_headers
+
+
+def _seconds(directives, name):
+    try:
+        return max(0, int(directives[name]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _http_date(value):
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp() if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+class CacheEntry:
+    """Stored response metadata; the body lives in a separate file"""
+
+    def __init__(self, meta, body_path):
+        self.meta = meta
+        self.body_path = body_path
+
+    @property
+    def headers(self):
+        return [tuple(h) for h in self.meta["headers"]]
+
+    def header(self, name):
+        name = name.lower()
+        for key, value in self.meta["headers"]:
+            if key.lower() == name:
+                return value
+        return None
+
+    @property
+    def status(self):
+        return self.meta["status"]
+
+    @property
+    def directives(self):
+        return parse_cache_control(self.header("Cache-Control"))
+
+    def age(self, now=None):
+        """current_age (RFC 7234 §4.2.3)"""
+        now = now or time.time()
+        response_time = self.meta["response_time"]
+        date = _http_date(self.header("Date")) or response_time
+        apparent_age = max(0.0, response_time - date)
+        initial_age = max(apparent_age, float(self.meta.get("age_header") or 0))
+        return initial_age + (now - response_time)
+
+    def freshness_lifetime(self):
+        """freshness_lifetime (RFC 7234 §4.2.1), with the §4.2.2 heuristic"""
+        directives = self.directives
+        max_age = _seconds(directives, "max-age")
+        if max_age is not None:
+            return max_age
+        expires = _http_date(self.header("Expires"))
+        if self.header("Expires") is not None:
+            date = _http_date(self.header("Date")) or self.meta["response_time"]
+            return max(0.0, expires - date) if expires else 0.0
+        last_modified = _http_date(self.header("Last-Modified"))
+        if last_modified:
+            date = _http_date(self.header("Date")) or self.meta["response_time"]
+            return min(24 * 3600, max(0.0, (date - last_modified) * 0.1))
+        return 0.0
+
+    def is_fresh(self, now=None):
+        return "no-cache" not in self.directives and self.age(now) < self.freshness_lifetime()
+
+    def staleness(self, now=None):
+        return max(0.0, self.age(now) - self.freshness_lifetime())
+
+    def may_serve_stale(self):
+        directives = self.directives
+        return not ({"no-cache", "must-revalidate", "proxy-revalidate", "s-maxage"} & set(directives))
+
+    def is_static_asset(self):
+        return is_static_type(self.header("Content-Type"))
+
+    @property
+    def validators(self):
+        """Conditional request headers for revalidation"""
+        headers = {}
+        if self.header("ETag"):
+            headers["If-None-Match"] = self.header("ETag")
+        if self.header("Last-Modified"):
+            headers["If-Modified-Since"] = self.header("Last-Modified")
+        return headers
+
+    def matches_vary(self, request_headers):
+        return all(request_headers.get(name, "") == value for name, value in self.meta["vary"].items())
+
+
+class ProxyCache:
+    """LRU directory of cached upstream responses"""
+
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024, max_entry_bytes=20 * 1024 * 1024,
+                 stale_while_revalidate=0, stale_if_error=0):
+        """
+        Args:
+            directory: Cache directory
+            max_bytes: Total size cap; least recently used entries go first
+            max_entry_bytes: Larger responses are passed through uncached
+            stale_while_revalidate: Seconds a stale static asset without a
+                stale-while-revalidate directive may be served while it is
+                revalidated in the background (0 = only with the directive)
+            stale_if_error: Seconds a stale static asset without a
+                stale-if-error directive may be served when the server is
+                unreachable (0 = only with the directive)
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_if_error = stale_if_error
+
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()  # key -> bytes on disk, least recently used first
+        self._size = 0
+        self._revalidating = set()
+        self._stats = {"hits": 0, "revalidated": 0, "stale_served": 0, "stale_on_error": 0,
+                       "misses": 0, "stored": 0, "evicted": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                os.remove(path)  # left over from an interrupted download
+            elif name.endswith(".json"):
+                key = name[:-5]
+                body = os.path.join(self.directory, key + ".body")
+                try:
+                    size = os.path.getsize(path) + os.path.getsize(body)
+                except OSError:
+                    os.remove(path)
+                    continue
+                entries.append((os.path.getmtime(path), key, size))
+        for _, key, size in sorted(entries):
+            self._lru[key] = size
+            self._size += size
+        if entries:
+            print(f"📂 Proxy cache: {len(entries)} entries, {self._size // 1024} KB")
+
+    @staticmethod
+    def key_for(url):
+        return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".json", base + ".body"
+
+    # ----------------------------------------------------------------- lookup
+
+    def lookup(self, url, request_headers):
+        """Cached entry for a GET, or None"""
+        key = self.key_for(url)
+        meta_path, body_path = self._paths(key)
+        with self._lock:
+            if key not in self._lru:
+                return None
+            self._lru.move_to_end(key)
+        try:
+            with open(meta_path, "r") as f:
+                entry = CacheEntry(json.load(f), body_path)
+            os.utime(meta_path)  # persist LRU order across restarts
+        except (OSError, ValueError):
+            self._remove(key)
+            return None
+        if entry.meta.get("format") != CACHE_FORMAT:
+            self._remove(key)
+            return None
+        return entry if entry.matches_vary(request_headers) else None
+
+    def count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def start_revalidation(self, url):
+        """Returns False if a revalidation for this URL is already running"""
+        with self._lock:
+            if url in self._revalidating:
+                return False
+            self._revalidating.add(url)
+            return True
+
+    def end_revalidation(self, url):
+        with self._lock:
+            self._revalidating.discard(url)
+
+    def _stale_limit(self, entry, directive, default):
+        limit = _seconds(entry.directives, directive)
+        if limit is None:
+            # No directive from the server: pages and API responses are never served stale
+            limit = default if default and entry.is_static_asset() else None
+        return limit
+
+    def serve_stale_while_revalidate(self, entry):
+        limit = self._stale_limit(entry, "stale-while-revalidate", self.stale_while_revalidate)
+        return limit is not None and entry.may_serve_stale() and entry.staleness() <= limit
+
+    def serve_stale_on_error(self, entry):
+        limit = self._stale_limit(entry, "stale-if-error", self.stale_if_error)
+        return limit is not None and entry.may_serve_stale() and entry.staleness() <= limit
+
+    # ------------------------------------------------------------------ store
+
+    def is_storable(self, method, request_headers, status, response_headers):
+        """RFC 7234 §3: may this response be stored?"""
+        if method != "GET" or status not in CACHEABLE_STATUS:
+            return False
+        request_cc = parse_cache_control(request_headers.get("Cache-Control"))
+        response_cc = parse_cache_control(response_headers.get("Cache-Control"))
+        if "no-store" in request_cc or "no-store" in response_cc:
+            return False
+        if response_headers.get("Vary", "").strip() == "*" or "Set-Cookie" in response_headers:
+            return False
+        if "Authorization" in request_headers and "public" not in response_cc:
+            return False
+        length = response_headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > self.max_entry_bytes:
+            return False
+        # Needs explicit freshness or a validator to be of any use
+        return bool(
+            {"max-age", "public"} & set(response_cc) or response_headers.get("Expires")
+            or response_headers.get("ETag") or response_headers.get("Last-Modified")
+        )
+
+    def _meta(self, url, request_headers, status, response_headers):
+        vary = [v.strip() for v in response_headers.get("Vary", "").split(",") if v.strip()]
+        return {
+            "format": CACHE_FORMAT,
+            "url": url,
+            "status": status,
+            "headers": [[k, v] for k, v in response_headers.items() if k.lower() not in _UNSTORED_HEADERS],
+            "vary": {name: request_headers.get(name, "") for name in vary},
+            "response_time": time.time(),
+            "age_header": response_headers.get("Age"),
+        }
+
+    def store(self, url, request_headers, status, response_headers, chunks):
+        """
+        Yield ``chunks`` unchanged while copying them into the cache.
+
+        The entry is committed only when the whole body went through, so
+        an aborted download never leaves a truncated entry behind.
+        """
+        key = self.key_for(url)
+        meta_path, body_path = self._paths(key)
+        tmp_path = f"{body_path}.{threading.get_ident()}.tmp"
+        meta = self._meta(url, request_headers, status, response_headers)
+        size = 0
+        complete = False
+        tmp = open(tmp_path, "wb")
+        try:
+            for chunk in chunks:
+                if tmp is not None:
+                    size += len(chunk)
+                    if size > self.max_entry_bytes:
+                        tmp.close()
+                        tmp = None
+                        os.remove(tmp_path)
+                    else:
+                        tmp.write(chunk)
+                yield chunk
+            complete = True
+        finally:
+            if tmp is not None:
+                tmp.close()
+                if complete:
+                    self._commit(key, meta, tmp_path, meta_path, body_path, size)
+                else:
+                    os.remove(tmp_path)
+
+    def _commit(self, key, meta, tmp_path, meta_path, body_path, size):
+        try:
+            os.replace(tmp_path, body_path)
+            with open(meta_path + ".tmp", "w") as f:
+                json.dump(meta, f)
+            os.replace(meta_path + ".tmp", meta_path)
+            size += os.path.getsize(meta_path)
+        except OSError as e:
+            print(f"⚠️ Proxy cache write failed: {e}")
+            return
+        with self._lock:
+            self._size += size - self._lru.pop(key, 0)
+            self._lru[key] = size
+            self._stats["stored"] += 1
+        self._evict()
+
+    def refresh(self, entry, response_headers):
+        """Merge a 304's headers into an entry (RFC 7234 §4.3.4)"""
+        headers = OrderedDict((k.lower(), [k, v]) for k, v in entry.meta["headers"])
+        for k, v in response_headers.items():
+            if k.lower() not in _UNSTORED_HEADERS and k.lower() != "content-encoding":
+                headers[k.lower()] = [k, v]
+        entry.meta["headers"] = list(headers.values())
+        entry.meta["response_time"] = time.time()
+        entry.meta["age_header"] = response_headers.get("Age")
+        meta_path = entry.body_path[:-5] + ".json"
+        try:
+            with open(meta_path + ".tmp", "w") as f:
+                json.dump(entry.meta, f)
+            os.replace(meta_path + ".tmp", meta_path)
+        except OSError as e:
+            print(f"⚠️ Proxy cache update failed: {e}")
+
+    def read_body(self, entry, chunk_size=64 * 1024):
+        with open(entry.body_path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    # ------------------------------------------------------------------ evict
+
+    def _remove(self, key):
+        with self._lock:
+            self._size -= self._lru.pop(key, 0)
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _evict(self):
+        while True:
+            with self._lock:
+                if self._size <= self.max_bytes or not self._lru:
+                    return
+                key = next(iter(self._lru))
+                self._stats["evicted"] += 1
+            self._remove(key)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._lru)
+            stats["bytes"] = self._size
+        return stats
@@ -0,0 +1,187 @@
+"""
+Startup Warm-up for the Order-Reception Page
+
+While the printer connects and pygame starts, the app shell and the
+static assets it references are fetched concurrently through
+``ReverseProxy.warm``. The responses are kept in a ``PrefetchBuffer``
+in memory, so the WebView's first load is served locally instead of
+one cold round trip per file. Cacheable responses also land in the disk
+``ProxyCache`` on the way.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+from proxy_cache import is_shareable, is_static_type
+from upstream_proxy import decode_chunks
+
+# <link rel=...> values worth fetching before first paint
+ASSET_LINK_RELS = {"stylesheet", "preload", "modulepreload", "icon", "shortcut", "manifest"}
+
+
+class _AssetParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.refs = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "script" and attrs.get("src"):
+            self.refs.append(attrs["src"])
+        elif tag == "link" and attrs.get("href"):
+            if ASSET_LINK_RELS & set((attrs.get("rel") or "").lower().split()):
+                self.refs.append(attrs["href"])
+        elif tag == "img" and attrs.get("src"):
+            self.refs.append(attrs["src"])
+
+
+def find_assets(html, page_url, base_url):
+    """Same-origin asset paths (with query) referenced by an HTML page"""
+    parser = _AssetParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception as e:
+        print(f"⚠️ Warm-up: cannot parse app shell: {e}")
+    paths = []
+    for ref in parser.refs:
+        url = urljoin(page_url, ref.strip())
+        if not url.startswith(base_url + "/") or url.startswith(("data:", "blob:")):
+            continue  # other origins are not proxied
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        if path not in paths:
+            paths.append(path)
+    return paths
+
+
+class PrefetchBuffer:
+    """
+    Warm-up responses held in memory for the WebView's first load.
+
+    Each entry is served once and only within ``ttl`` seconds, so it
+    never replaces the HTTP cache's own freshness rules. The warm-up runs
+    without the WebView's cookies, so responses that set or depend on a
+    session are not kept, and only static assets go to requests with cookies.
+    """
+
+    def __init__(self, ttl=120, max_bytes=32 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = {}  # url -> (stored_at, status, headers, body)
+        self._size = 0
+        self._stats = {"stored": 0, "served": 0, "expired": 0}
+
+    def put(self, url, status, headers, body):
+        if status != 200 or not is_shareable(headers):
+            return False  # an anonymous session cookie must not reach the WebView
+        with self._lock:
+            old = self._entries.pop(url, None)
+            if old:
+                self._size -= len(old[3])
+            if self._size + len(body) > self.max_bytes:
+                return False
+            self._entries[url] = (time.time(), status, list(headers.items()), body)
+            self._size += len(body)
+            self._stats["stored"] += 1
+        return True
+
+    def take(self, url, request_headers):
+        """(status, headers, body) once for a matching request, else None"""
+        if "Authorization" in request_headers:
+            return None
+        with self._lock:
+            entry = self._entries.pop(url, None)
+            if entry is None:
+                return None
+            self._size -= len(entry[3])
+            stored_at, status, headers, body = entry
+            if time.time() - stored_at > self.ttl:
+                self._stats["expired"] += 1
+                return None
+            response_headers = {k.lower(): v for k, v in headers}
+            if "Cookie" in request_headers and not is_static_type(response_headers.get("content-type")):
+                return None  # the app shell for a logged-in WebView may differ from the anonymous one
+            encoding = response_headers.get("content-encoding", "identity").strip().lower()
+            accepted = [e.split(";")[0].strip().lower()
+                        for e in request_headers.get("Accept-Encoding", "").split(",")]
+            if encoding != "identity" and encoding not in accepted:
+                return None
+            self._stats["served"] += 1
+        return status, headers, body
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+        return stats
+
+
+class WarmUp:
+    """Fetches the app shell, then its assets concurrently, in the background"""
+
+    def __init__(self, proxy, page_path, concurrency=6):
+        self.proxy = proxy
+        self.page_path = page_path
+        self.concurrency = concurrency
+        self.done = threading.Event()
+        self.status = {"state": "idle", "assets": 0, "fetched": 0, "failed": 0,
+                       "bytes": 0, "elapsed_ms": None, "shell_ms": None}
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.status["state"] = "running"
+        threading.Thread(target=self._run, name="proxy-warmup", daemon=True).start()
+        return self
+
+    def _fetch(self, path):
+        started = time.time()
+        try:
+            status, headers, body, source = self.proxy.warm(path)
+        except Exception as e:
+            with self._lock:
+                self.status["failed"] += 1
+            print(f"⚠️ Warm-up: {path} failed: {e}")
+            return None
+        with self._lock:
+            self.status["fetched"] += 1
+            self.status["bytes"] += len(body)
+        print(f"🔥 Warm-up: {path} {status} from {source} ({len(body) / 1024:.1f} KB, "
+              f"{(time.time() - started) * 1000:.0f} ms)")
+        return body if path != self.page_path else b"".join(
+            decode_chunks([body], headers.get("Content-Encoding")))
+
+    def _run(self):
+        started = time.time()
+        print(f"🔥 Warm-up started: {self.page_path}")
+        try:
+            shell = self._fetch(self.page_path)
+            self.status["shell_ms"] = round((time.time() - started) * 1000, 1)
+            if shell is None:
+                self.status["state"] = "failed"
+                return
+            base_url = self.proxy.base_url
+            assets = find_assets(shell.decode("utf-8", "replace"), base_url + self.page_path, base_url)
+            self.status["assets"] = len(assets)
+            if assets:
+                with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="warmup") as executor:
+                    list(executor.map(self._fetch, assets))
+            self.status["state"] = "done"
+        except Exception as e:
+            self.status["state"] = "failed"
+            print(f"⚠️ Warm-up error: {e}")
+        finally:
+            self.status["elapsed_ms"] = round((time.time() - started) * 1000, 1)
+            print(f"🔥 Warm-up {self.status['state']}: {self.status['fetched']} of "
+                  f"{self.status['assets'] + 1} files, {self.status['bytes'] // 1024} KB "
+                  f"in {self.status['elapsed_ms']:.0f} ms")
+            self.done.set()
+
+    def get_status(self):
+        with self._lock:
+            return dict(self.status)
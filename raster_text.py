@@ -0,0 +1,260 @@
+"""
+Raster Fallback for Text the Printer Codepage Cannot Show
+
+Persian, Arabic, Greek, CJK and other characters outside the printer's
+codepage used to come out as "?". Lines containing them are now printed
+as images instead:
+
+- the line is shaped for display (Arabic/Persian letter forms via
+  ``arabic_reshaper``, right-to-left and mixed text via ``python-bidi``)
+  and right-aligned when it is right-to-left
+- glyphs are rendered once per (font, size) into a ``GlyphAtlas`` of
+  1-bit NumPy arrays and blitted into the line bitmap
+- lines are packed with ``np.packbits`` and sent as ``GS v 0`` raster
+  strips; lines the codepage can show stay on the text path
+
+Needs Pillow and NumPy; python-bidi and arabic_reshaper are needed for
+right-to-left scripts. Without Pillow or NumPy the encoder keeps its
+text-only behaviour.
+"""
+
+import os
+import threading
+import time
+import unicodedata
+
+try:
+    import numpy as np
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    np = None
+    Image = ImageDraw = ImageFont = None
+
+try:
+    import arabic_reshaper
+    from bidi.algorithm import get_display
+except ImportError:
+    arabic_reshaper = None
+    get_display = None
+
+GS = b'\x1d'
+
+# Printable dots per line (203 dpi heads)
+DOTS = {58: 384, 80: 576}
+
+# Tried in order when no font is configured; they must cover Arabic script
+FONT_CANDIDATES = (
+    "C:/Windows/Fonts/tahoma.ttf",
+    "C:/Windows/Fonts/arial.ttf",
+    "C:/Windows/Fonts/segoeui.ttf",
+    "/System/Library/Fonts/Supplemental/Arial Unicode.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "/System/Library/Fonts/Supplemental/Tahoma.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+)
+
+# Pixel size close to the 12x24 dot Font A
+DEFAULT_SIZE = 22
+
+# Rows per GS v 0 command; some printers drop larger images
+MAX_STRIP_ROWS = 240
+
+THRESHOLD = 128
+
+RASTER_CONFIG = {"enabled": True, "font": "", "size": DEFAULT_SIZE}
+
+
+def available():
+    return np is not None and Image is not None
+
+
+def configure(enabled=True, font="", size=DEFAULT_SIZE):
+    """Settings from config.json ("raster_text"); call before the first print"""
+    RASTER_CONFIG.update(enabled=bool(enabled), font=font or "", size=int(size or DEFAULT_SIZE))
+
+
+def find_font(font=""):
+    if font and os.path.exists(font):
+        return font
+    for candidate in FONT_CANDIDATES:
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def is_rtl(text):
+    """Base direction from the first strong character"""
+    for char in text:
+        direction = unicodedata.bidirectional(char)
+        if direction in ("R", "AL"):
+            return True
+        if direction == "L":
+            return False
+    return False
+
+
+def shape(text):
+    """Logical order -> visual order with joined Arabic letter forms"""
+    if arabic_reshaper is None:
+        return text
+    return get_display(arabic_reshaper.reshape(text))
+
+
+class GlyphAtlas:
+    """1-bit glyph bitmaps and advances for one (font, size), rendered on first use"""
+
+    def __init__(self, font_path, size):
+        self.font_path = font_path
+        self.size = size
+        self.font = ImageFont.truetype(font_path, size)
+        self.ascent, self.descent = self.font.getmetrics()
+        self.height = self.ascent + self.descent
+        self._glyphs = {}
+        self._lock = threading.Lock()
+
+    def glyph(self, char):
+        """(bitmap, x offset, advance) for one character"""
+        glyph = self._glyphs.get(char)
+        if glyph is None:
+            with self._lock:
+                glyph = self._glyphs.get(char)
+                if glyph is None:
+                    glyph = self._glyphs[char] = self._render(char)
+        return glyph
+
+    def _render(self, char):
+        advance = max(0, round(self.font.getlength(char)))
+        left, _, right, _ = self.font.getbbox(char, anchor="ls")
+        if right <= left:
+            return None, 0, advance  # space and other blank glyphs
+        image = Image.new("L", (right - left, self.height))
+        ImageDraw.Draw(image).text((-left, self.ascent), char, font=self.font, fill=255, anchor="ls")
+        return np.asarray(image) >= THRESHOLD, left, advance
+
+    def __len__(self):
+        return len(self._glyphs)
+
+
+class Rasterizer:
+    """Renders text lines into ESC/POS ``GS v 0`` raster strips"""
+
+    def __init__(self, atlas, dots):
+        self.atlas = atlas
+        self.dots = dots
+        self._lock = threading.Lock()
+        self._stats = {"lines": 0, "strips": 0, "bytes": 0, "clipped": 0, "render_ms": 0.0}
+
+    def render_line(self, text):
+        """One line -> bool array (atlas height x dots)"""
+        atlas = self.atlas
+        rtl = is_rtl(text)
+        visual = shape(text)
+        row = np.zeros((atlas.height, self.dots), dtype=bool)
+
+        glyphs = [atlas.glyph(c) for c in visual]
+        width = sum(g[2] for g in glyphs)
+        x = max(0, self.dots - width) if rtl else 0
+        clipped = False
+        for bitmap, offset, advance in glyphs:
+            if bitmap is not None:
+                start = x + offset
+                stop = start + bitmap.shape[1]
+                if start < 0 or stop > self.dots:
+                    clipped = True
+                    lo, hi = max(start, 0), min(stop, self.dots)
+                    if lo < hi:
+                        row[:, lo:hi] |= bitmap[:, lo - start:hi - start]
+                else:
+                    row[:, start:stop] |= bitmap
+            x += advance
+        if clipped:
+            with self._lock:
+                self._stats["clipped"] += 1
+        return row
+
+    def raster(self, lines):
+        """Lines -> GS v 0 commands, at most MAX_STRIP_ROWS rows each"""
+        started = time.perf_counter()
+        bitmap = np.vstack([self.render_line(line) for line in lines])
+        packed = np.packbits(bitmap, axis=1)
+        width_bytes = packed.shape[1]
+        parts = []
+        for top in range(0, packed.shape[0], MAX_STRIP_ROWS):
+            strip = packed[top:top + MAX_STRIP_ROWS]
+            rows = strip.shape[0]
+            parts.append(GS + b'v0\x00' + width_bytes.to_bytes(2, "little") + rows.to_bytes(2, "little"))
+            parts.append(strip.tobytes())
+        data = b"".join(parts)
+        with self._lock:
+            self._stats["lines"] += len(lines)
+            self._stats["strips"] += len(parts) // 2
+            self._stats["bytes"] += len(data)
+            self._stats["render_ms"] += (time.perf_counter() - started) * 1000
+        return data
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["render_ms"] = round(stats["render_ms"], 1)
+        stats["glyphs"] = len(self.atlas)
+        return stats
+
+
+_ATLASES = {}
+_RASTERIZERS = {}
+_REGISTRY_LOCK = threading.Lock()
+_WARNED = set()
+
+
+def _warn_once(message):
+    if message not in _WARNED:
+        _WARNED.add(message)
+        print(message)
+
+
+def get_rasterizer(width=80):
+    """Shared rasterizer for the paper width, or None if raster text is unavailable"""
+    if not RASTER_CONFIG["enabled"]:
+        return None
+    if not available():
+        _warn_once("⚠️ Raster text needs Pillow and numpy - unsupported characters print as '?'")
+        return None
+    font = find_font(RASTER_CONFIG["font"])
+    if font is None:
+        _warn_once("⚠️ Raster text: no font found - set raster_text.font in config.json")
+        return None
+    if arabic_reshaper is None:
+        _warn_once("⚠️ Raster text: python-bidi / arabic_reshaper not installed - right-to-left text is not shaped")
+
+    size = RASTER_CONFIG["size"]
+    dots = DOTS.get(width, 576)
+    key = (font, size, dots)
+    rasterizer = _RASTERIZERS.get(key)
+    if rasterizer is None:
+        with _REGISTRY_LOCK:
+            rasterizer = _RASTERIZERS.get(key)
+            if rasterizer is None:
+                atlas = _ATLASES.get((font, size))
+                if atlas is None:
+                    atlas = _ATLASES[(font, size)] = GlyphAtlas(font, size)
+                rasterizer = _RASTERIZERS[key] = Rasterizer(atlas, dots)
+                print(f"🖼️ Raster text: {os.path.basename(font)} {size}px, {dots} dots")
+    return rasterizer
+
+
+def get_stats():
+    """Raster fallback state for /api/status"""
+    with _REGISTRY_LOCK:
+        rasterizers = dict(_RASTERIZERS)
+    totals = {"lines": 0, "strips": 0, "bytes": 0, "clipped": 0, "render_ms": 0.0}
+    for rasterizer in rasterizers.values():
+        for key, value in rasterizer.get_stats().items():
+            if key in totals:
+                totals[key] += value
+    totals["render_ms"] = round(totals["render_ms"], 1)
+    return dict(totals, enabled=RASTER_CONFIG["enabled"], available=available(),
+                shaping=arabic_reshaper is not None,
+                glyphs=sum(len(a) for a in _ATLASES.values()),
+                fonts=sorted({f"{os.path.basename(f)} {s}px" for f, s in _ATLASES}))
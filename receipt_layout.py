@@ -0,0 +1,277 @@
+"""
+Structured Receipt Layout
+
+Renders a receipt sent as data (header, items with qty/price columns,
+modifiers, totals, footer) instead of a pre-padded string from the page:
+
+- lines are wrapped on word boundaries and aligned to the paper's
+  columns (32 on 58 mm, 48 on 80 mm)
+- titles are printed double size, totals and kitchen items bold /
+  double height, using one ``ESC !`` print-mode command per change
+- a ``ReceiptLayout`` is compiled once per (template, width, brand):
+  column widths, separators and mode commands are precomputed and
+  wrapped lines are memoized, so a typical order renders in microseconds
+
+Receipt format::
+
+    {
+        "template": "receipt",            # or "kitchen" (no prices, large items)
+        "header": ["Pizzeria Roma", "Storgatan 1"],
+        "title": "Order #123",
+        "meta": [["Table", "5"], ["Time", "12:30"]],
+        "items": [{"qty": 2, "name": "Margherita", "price": 190,
+                   "modifiers": ["Extra cheese"], "note": "No onion"}],
+        "totals": [{"label": "Total", "amount": 190, "bold": true}],
+        "footer": ["Thank you!"],
+        "currency": "kr"
+    }
+"""
+
+import threading
+
+from escpos_encoder import COLUMNS, ESC, SUPPORTED_CODEPAGES, get_encoder
+
+TEMPLATES = ("receipt", "kitchen")
+
+# ESC ! n bits: 0x08 emphasized, 0x10 double height, 0x20 double width
+PRINT_MODES = {
+    "normal": 0x00,
+    "bold": 0x08,
+    "tall": 0x18,    # bold + double height: columns unchanged
+    "title": 0x38,   # bold + double height + double width: half the columns
+}
+
+MAX_CACHED_WRAPS = 2048
+
+
+def is_structured(receipt_data):
+    """True for a structured receipt, False for the legacy {"text": ...} form"""
+    return isinstance(receipt_data, dict) and any(
+        key in receipt_data for key in ("items", "header", "title", "totals", "footer"))
+
+
+def validate_receipt(receipt):
+    """Error message for a malformed structured receipt, or None if it can be laid out"""
+    if not isinstance(receipt, dict):
+        return "receipt must be an object"
+    template = receipt.get("template", "receipt")
+    if template not in TEMPLATES:
+        return f"template must be one of {', '.join(TEMPLATES)}"
+    for key in ("items", "totals"):
+        value = receipt.get(key)
+        if value is None:
+            continue
+        if not isinstance(value, list) or not all(isinstance(v, dict) for v in value):
+            return f"{key} must be a list of objects"
+    meta = receipt.get("meta")
+    if meta is not None:
+        if not isinstance(meta, list) or not all(
+                isinstance(p, dict) or (isinstance(p, (list, tuple)) and len(p) == 2) for p in meta):
+            return "meta must be a list of [label, value] pairs or {label, value} objects"
+    for key in ("decimal", "currency"):
+        if receipt.get(key) is not None and not isinstance(receipt[key], str):
+            return f"{key} must be a string"
+    for key in ("header", "footer"):
+        if isinstance(receipt.get(key), dict):
+            return f"{key} must be a string or a list of strings"
+    for item in receipt.get("items") or []:
+        if isinstance(item.get("modifiers"), dict):
+            return "item modifiers must be a string or a list of strings"
+    return None
+
+
+def _as_lines(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return str(value).split("\n")
+
+
+class ReceiptLayout:
+    """A receipt template compiled for one paper width and printer brand"""
+
+    def __init__(self, template="receipt", width=80, brand="default"):
+        if template not in TEMPLATES:
+            raise ValueError(f"Unknown receipt template: {template}")
+        self.template = template
+        self.width = width
+        self.brand = brand
+        self.columns = COLUMNS.get(width, 48)
+        self.encoder = get_encoder(brand, SUPPORTED_CODEPAGES.get(brand, SUPPORTED_CODEPAGES["default"]), width)
+        self.modes = {name: ESC + b'!' + bytes([n]) for name, n in PRINT_MODES.items()}
+
+        self.qty_width = 4                                   # "12x "
+        self.price_width = 0 if template == "kitchen" else (9 if self.columns < 40 else 11)
+        self.name_width = self.columns - self.qty_width - self.price_width
+        self.modifier_indent = " " * (self.qty_width + 2)
+        self.modifier_width = self.columns - len(self.modifier_indent)
+        self.item_mode = "tall" if template == "kitchen" else "normal"
+        self.separator = "-" * self.columns
+        self.double_separator = "=" * self.columns
+        self._wraps = {}
+
+    def wrap(self, text, width):
+        """Greedy word wrap; words longer than the line are split"""
+        key = (text, width)
+        lines = self._wraps.get(key)
+        if lines is not None:
+            return lines
+        lines = []
+        for paragraph in text.split("\n"):
+            line = ""
+            for word in paragraph.split():
+                while len(word) > width:
+                    if line:
+                        lines.append(line)
+                        line = ""
+                    lines.append(word[:width])
+                    word = word[width:]
+                if not line:
+                    line = word
+                elif len(line) + 1 + len(word) <= width:
+                    line += " " + word
+                else:
+                    lines.append(line)
+                    line = word
+            lines.append(line)
+        if len(self._wraps) >= MAX_CACHED_WRAPS:
+            self._wraps.clear()
+        self._wraps[key] = lines
+        return lines
+
+    @staticmethod
+    def format_amount(amount, decimal=","):
+        if isinstance(amount, (int, float)) and not isinstance(amount, bool):
+            return f"{amount:.2f}".replace(".", decimal)
+        return str(amount)
+
+    def _pair(self, left, right, width):
+        """Label on the left, value right-aligned; the label wraps if needed"""
+        room = width - len(right) - 1
+        if room < 1:
+            return self.wrap(left, width) + [right.rjust(width)]
+        lines = list(self.wrap(left, room))  # the wrap cache must not change
+        lines[-1] = lines[-1].ljust(room) + " " + right
+        return lines
+
+    def _bullet(self, mark, text, mode):
+        """Modifier / note under an item, continuation lines aligned with the text"""
+        lines = self.wrap(text, self.modifier_width - 2)
+        first = self.modifier_indent + mark + " "
+        rest = self.modifier_indent + "  "
+        return [(mode, (first if i == 0 else rest) + line) for i, line in enumerate(lines)]
+
+    def render(self, receipt, plain=False):
+        """Receipt dict -> list of (mode, line); ``plain`` lays the title out at normal width"""
+        columns = self.columns
+        decimal = receipt.get("decimal") or ","
+        currency = receipt.get("currency") or ""
+        out = []
+
+        for line in _as_lines(receipt.get("header")):
+            for wrapped in self.wrap(line, columns):
+                out.append(("normal", wrapped.center(columns).rstrip()))
+        if receipt.get("title"):
+            half = columns if plain else columns // 2
+            for wrapped in self.wrap(str(receipt["title"]), half):
+                out.append(("title", wrapped.center(half).rstrip()))
+        for pair in receipt.get("meta") or []:
+            label, value = (pair.get("label", ""), pair.get("value", "")) if isinstance(pair, dict) else pair
+            for line in self._pair(f"{label}:", str(value), columns):
+                out.append(("normal", line))
+        if out:
+            out.append(("normal", self.separator))
+
+        for item in receipt.get("items") or []:
+            qty = item.get("qty", 1)
+            qty = f"{qty}x".ljust(self.qty_width)
+            price = item.get("price")
+            if self.price_width and price is not None:
+                price = self.format_amount(price, decimal)
+                # A price wider than its column narrows the name, keeping one space between them
+                name_width = min(self.name_width, self.columns - self.qty_width - len(price) - 1)
+                name_width = max(1, name_width)
+                name_lines = self.wrap(str(item.get("name", "")), name_width)
+                first = qty + name_lines[0].ljust(name_width) + " " + price.rjust(
+                    self.columns - self.qty_width - name_width - 1)
+            else:
+                name_lines = self.wrap(str(item.get("name", "")), self.name_width)
+                first = qty + name_lines[0]
+            out.append((self.item_mode, first.rstrip()))
+            for rest in name_lines[1:]:
+                out.append((self.item_mode, " " * self.qty_width + rest))
+            for modifier in _as_lines(item.get("modifiers")):
+                out.extend(self._bullet("+", modifier, "normal"))
+            if item.get("note"):
+                out.extend(self._bullet("!", str(item["note"]), "bold"))
+
+        totals = receipt.get("totals") or []
+        if totals and self.price_width:
+            out.append(("normal", self.separator))
+            for total in totals:
+                amount = self.format_amount(total.get("amount", ""), decimal)
+                if currency:
+                    amount += f" {currency}"
+                mode = "bold" if total.get("bold") else "normal"
+                for line in self._pair(str(total.get("label", "")), amount, columns):
+                    out.append((mode, line))
+            out.append(("normal", self.double_separator))
+
+        footer = _as_lines(receipt.get("footer"))
+        if footer:
+            out.append(("normal", ""))
+            for line in footer:
+                for wrapped in self.wrap(line, columns):
+                    out.append(("normal", wrapped.center(columns).rstrip()))
+        return out
+
+    def encode(self, receipt):
+        """Receipt dict -> ESC/POS body (no init, feed or cut); one encode per print mode run"""
+        parts = []
+        run = []
+        mode = "normal"
+        for line_mode, line in self.render(receipt):
+            if line_mode != mode:
+                if run:
+                    parts.append(self.encoder.encode_body("\n".join(run) + "\n"))
+                    run = []
+                parts.append(self.modes[line_mode])
+                mode = line_mode
+            run.append(line)
+        if run:
+            parts.append(self.encoder.encode_body("\n".join(run) + "\n"))
+        if mode != "normal":
+            parts.append(self.modes["normal"])
+        return b"".join(parts)
+
+    def encode_job(self, receipt):
+        """Complete job: preamble + receipt + feed + cut"""
+        return b"".join((self.encoder.preamble, self.encode(receipt), self.encoder.trailer))
+
+    def text(self, receipt):
+        """Plain-text rendering for CUPS and SDK paths without ESC/POS"""
+        return "\n".join(line for _, line in self.render(receipt, plain=True))
+
+
+_LAYOUTS = {}
+_LAYOUTS_LOCK = threading.Lock()
+
+
+def get_layout(template="receipt", width=80, brand="default"):
+    """Shared compiled layout for (template, width, brand)"""
+    key = (template, width, brand)
+    layout = _LAYOUTS.get(key)
+    if layout is None:
+        with _LAYOUTS_LOCK:
+            layout = _LAYOUTS.get(key)
+            if layout is None:
+                layout = _LAYOUTS[key] = ReceiptLayout(template, width, brand)
+    return layout
+
+
+def receipt_text(receipt_data, width=80, brand="default"):
+    """Plain text for any receipt: structured ones are laid out, legacy ones return "text" """
+    if is_structured(receipt_data):
+        return get_layout(receipt_data.get("template", "receipt"), width, brand).text(receipt_data)
+    return (receipt_data or {}).get("text", "")
@@ -0,0 +1,727 @@
+"""
+Upstream Client for the Reverse Proxy
+
+One shared, thread-safe ``requests`` session for every call the
+``reverse_proxy`` route makes to BASE_URL, so the WebView's asset and API
+requests reuse keep-alive connections instead of paying TCP (and TLS)
+setup on each hit. ``ReverseProxy`` streams bodies through it and puts
+cacheable GETs through the disk cache.
+"""
+
+import http.cookiejar
+import threading
+import time
+import zlib
+
+import requests
+from flask import Response
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from proxy_cache import parse_cache_control
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised without contacting the server while the circuit is open"""
+
+
+def _timed_pool(pool_cls, breaker):
+    """Pool class whose connections report their connect time to ``breaker``"""
+
+    class TimedConnection(pool_cls.ConnectionCls):
+        def connect(self):
+            started = time.monotonic()
+            super().connect()
+            breaker.record_connect((time.monotonic() - started) * 1000)
+
+    return type(f"Timed{pool_cls.__name__}", (pool_cls,), {"ConnectionCls": TimedConnection})
+
+
+class UpstreamClient:
+    """Keep-alive connection pool to the remote server"""
+
+    def __init__(self, pool_size=32, max_hosts=4, retries=1, breaker=None):
+        """
+        Args:
+            pool_size: Keep-alive connections per host; should match the
+                number of Flask worker threads
+            max_hosts: Number of distinct hosts with a cached pool
+            retries: Retries for connections that fail before the request
+                was sent, or that turn out stale (idempotent methods
+                without a body only: a streamed body cannot be re-read)
+            breaker: Optional CircuitBreaker guarding every request
+        """
+        self.pool_size = pool_size
+        self.breaker = breaker
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            # A keep-alive socket the server already closed fails as a read
+            # error; only idempotent methods are replayed
+            read=retries,
+            status=0,
+            redirect=0,
+            backoff_factor=0,
+            raise_on_status=False,
+        )
+        # pool_block: callers wait for a free connection instead of opening
+        # unbounded extra sockets that are thrown away afterwards
+        self.adapter = HTTPAdapter(
+            pool_connections=max_hosts, pool_maxsize=pool_size,
+            max_retries=retry, pool_block=True
+        )
+        if breaker is not None:
+            self.adapter.poolmanager.pool_classes_by_scheme = {
+                "http": _timed_pool(HTTPConnectionPool, breaker),
+                "https": _timed_pool(HTTPSConnectionPool, breaker),
+            }
+        # Requests with a body (PUT, DELETE, ...) are never replayed after a read
+        # error: the body stream is already drained, so the replay would send
+        # the old Content-Length and no data. Same connection pool.
+        self.body_adapter = HTTPAdapter(max_retries=Retry(
+            total=retries, connect=retries, read=0, other=0, status=0, redirect=0,
+            backoff_factor=0, raise_on_status=False,
+        ))
+        self.body_adapter.poolmanager = self.adapter.poolmanager
+        self.session = self._session(self.adapter)
+        self.body_session = self._session(self.body_adapter)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+
+    @staticmethod
+    def _session(adapter):
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        # Cookies belong to the WebView: forward its headers, never keep a jar
+        session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        return session
+
+    def request(self, method, url, **kwargs):
+        breaker = self.breaker
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(f"Upstream circuit open: {breaker.last_error}")
+        with self._lock:
+            self._requests += 1
+        session = self.session if kwargs.get("data") is None else self.body_session
+        try:
+            resp = session.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            with self._lock:
+                self._errors += 1
+            if breaker is not None:
+                breaker.record_failure(e)
+            raise
+        if breaker is not None:
+            if resp.status_code in (502, 503, 504):
+                breaker.record_failure(f"HTTP {resp.status_code}")
+            else:
+                breaker.record_success()
+        return resp
+
+    def get_stats(self):
+        """
+        Connection reuse per upstream host.
+
+        ``hits`` are requests served on an already-open connection,
+        ``misses`` the requests that had to open a new one.
+        """
+        hosts = {}
+        pools = self.adapter.poolmanager.pools
+        with pools.lock:
+            entries = list(pools._container.items())
+        for key, pool in entries:
+            opened = pool.num_connections
+            sent = pool.num_requests
+            name = f"{key.key_scheme}://{key.key_host}:{key.key_port}"
+            hosts[name] = {
+                "requests": sent,
+                "connections_opened": opened,
+                "hits": max(0, sent - opened),
+                "misses": min(opened, sent),
+                # The pool queue is pre-filled with None placeholders
+                "idle": sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0,
+            }
+        hits = sum(h["hits"] for h in hosts.values())
+        misses = sum(h["misses"] for h in hosts.values())
+        with self._lock:
+            return {
+                "pool_size": self.pool_size,
+                "requests": self._requests,
+                "errors": self._errors,
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else None,
+                "hosts": hosts,
+            }
+
+
+# ================================================================ streaming
+
+CHUNK_SIZE = 64 * 1024
+
+
+class SizedStream:
+    """
+    File-like view of the incoming request body with a known length.
+
+    ``requests`` takes ``len()`` for the Content-Length header and reads
+    the body in blocks while sending, so it is never held in memory.
+    """
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+
+def request_body(flask_request):
+    """Upstream body for a Flask request: sized stream, chunk generator or None"""
+    length = flask_request.content_length
+    if length:
+        return SizedStream(flask_request.stream, length)
+    if "chunked" in flask_request.headers.get("Transfer-Encoding", "").lower():
+        # Unknown length: forward with chunked transfer encoding
+        def chunks():
+            while True:
+                chunk = flask_request.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+        return chunks()
+    return None
+
+
+def rewrite_chunks(chunks, old, new):
+    """
+    Replace ``old`` with ``new`` in a byte stream.
+
+    A match split across two chunks is still found: the longest suffix of
+    each chunk that could start a match is held back and joined with the
+    next one.
+    """
+    tail = b""
+    for chunk in chunks:
+        data = (tail + chunk).replace(old, new)
+        hold = 0
+        for n in range(min(len(old) - 1, len(data)), 0, -1):
+            if old.startswith(data[-n:]):
+                hold = n
+                break
+        tail = data[len(data) - hold:] if hold else b""
+        if len(data) > hold:
+            yield data[:len(data) - hold]
+    if tail:
+        yield tail
+
+
+def stream_response(resp, chunk_size=CHUNK_SIZE):
+    """
+    Yield an upstream body chunk by chunk, then release the connection.
+
+    The bytes are passed on as received, still compressed if the server
+    sent a Content-Encoding; see ``decode_chunks``.
+    """
+    try:
+        for chunk in resp.raw.stream(chunk_size, decode_content=False):
+            yield chunk
+    except Exception as e:
+        print(f"❌ Proxy stream aborted for {resp.url}: {e}")
+    finally:
+        resp.close()
+
+
+def decode_chunks(chunks, encoding):
+    """Decompress a gzip / deflate / br byte stream chunk by chunk"""
+    encoding = (encoding or "").strip().lower()
+    if encoding in ("", "identity"):
+        yield from chunks
+        return
+    if encoding == "br":
+        decoder = brotli.Decompressor()
+        for chunk in chunks:
+            yield decoder.process(chunk)
+        return
+
+    # gzip, or zlib-wrapped deflate (raw deflate is detected on the first chunk)
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding in ("gzip", "x-gzip") else zlib.MAX_WBITS)
+    first = True
+    for chunk in chunks:
+        try:
+            data = decoder.decompress(chunk)
+        except zlib.error:
+            if not (first and encoding == "deflate"):
+                raise
+            decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+            data = decoder.decompress(chunk)
+        first = False
+        if data:
+            yield data
+    tail = decoder.flush()
+    if tail:
+        yield tail
+
+
+# Encodings the proxy can undo when a rewrite needs the plain body
+DECODABLE_ENCODINGS = ("gzip", "deflate", "br") if brotli else ("gzip", "deflate")
+
+
+# ============================================================ single-flight
+
+# Request headers that can change the upstream response
+COALESCE_KEY_HEADERS = (
+    'Accept', 'Accept-Encoding', 'Accept-Language', 'Authorization', 'Cookie',
+    'If-None-Match', 'If-Modified-Since', 'Range',
+)
+
+
+class _Flight:
+    """One upstream GET shared by every concurrent identical request"""
+
+    def __init__(self, key):
+        self.key = key
+        self.cond = threading.Condition()
+        self.ready = False      # upstream headers arrived (or failed)
+        self.error = None
+        self.upstream = None
+        self.source = None
+        self.chunks = []        # chunks not yet read by every consumer
+        self.base = 0           # position of chunks[0] in the body
+        self.positions = {}     # consumer id -> next chunk position
+        self.pulling = False
+        self.done = False
+        self.consumers = 0
+        self.joined = 0
+
+    def join(self):
+        with self.cond:
+            consumer = self.joined
+            self.joined += 1
+            self.consumers += 1
+            self.positions[consumer] = 0
+        return consumer
+
+    def advance(self, consumer, position=None):
+        """Record a consumer's progress (None = gone) and drop chunks everyone has read"""
+        if position is None:
+            self.positions.pop(consumer, None)
+        else:
+            self.positions[consumer] = position
+        end = self.base + len(self.chunks)
+        drop = min(self.positions.values(), default=end) - self.base
+        if drop > 0:
+            del self.chunks[:drop]
+            self.base += drop
+
+
+class FlightHandle:
+    """A consumer's view of a shared upstream response"""
+
+    def __init__(self, group, flight, consumer):
+        self._group = group
+        self._flight = flight
+        self._consumer = consumer
+        self._closed = False
+
+    @property
+    def status_code(self):
+        return self._flight.upstream.status_code
+
+    @property
+    def headers(self):
+        return self._flight.upstream.headers
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._group._release(self._flight, self._consumer)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical GETs into one upstream request.
+
+    There is no extra thread: whichever consumer runs out of buffered
+    chunks pulls the next one from upstream and appends it to the shared
+    list, so the slowest reader never holds the others back. Chunks are
+    dropped once every consumer has read them, and requests arriving after
+    the first chunk start their own flight instead of replaying the body.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {"upstream": 0, "coalesced": 0}
+
+    @staticmethod
+    def key_for(url, headers):
+        return (url,) + tuple(headers.get(name, '') for name in COALESCE_KEY_HEADERS)
+
+    def fetch(self, key, start):
+        """
+        Join the flight for ``key`` or start it with ``start()``, which
+        returns ``(upstream_response, chunk_iterator)``.
+
+        Returns ``(handle, chunks)``; ``handle.close()`` must be called.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                flight = self._flights[key] = _Flight(key)
+                self._stats["upstream"] += 1
+                leader = True
+            consumer = flight.join()
+
+        if leader:
+            try:
+                flight.upstream, flight.source = start()
+            except Exception as e:
+                flight.error = e
+                self._forget(flight)
+            with flight.cond:
+                flight.ready = True
+                flight.cond.notify_all()
+        else:
+            with flight.cond:
+                while not flight.ready:
+                    flight.cond.wait()
+
+        if flight.error is not None:
+            self._release(flight, consumer)
+            raise flight.error
+        return FlightHandle(self, flight, consumer), self._iterate(flight, consumer)
+
+    def _iterate(self, flight, consumer):
+        index = 0
+        while True:
+            with flight.cond:
+                while index >= flight.base + len(flight.chunks) and not flight.done and flight.pulling:
+                    flight.cond.wait()
+                if index < flight.base + len(flight.chunks):
+                    chunk = flight.chunks[index - flight.base]
+                    index += 1
+                    flight.advance(consumer, index)
+                elif flight.done:
+                    return
+                else:
+                    flight.pulling = True
+                    chunk = None
+
+            if chunk is None:
+                # This consumer is at the head: fetch the next chunk for everyone
+                try:
+                    chunk = next(flight.source)
+                    finished = False
+                except StopIteration:
+                    finished = True
+                except Exception as e:
+                    print(f"❌ Coalesced proxy stream aborted: {e}")
+                    finished = True
+                if index == 0:
+                    # Body started: later requests would need it all replayed, so they start afresh
+                    self._forget(flight)
+                with flight.cond:
+                    if finished:
+                        flight.done = True
+                    else:
+                        flight.chunks.append(chunk)
+                    flight.pulling = False
+                    flight.cond.notify_all()
+                if finished:
+                    self._forget(flight)
+                continue
+
+            yield chunk
+
+    def _forget(self, flight):
+        # New requests start a new flight from here on
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def _release(self, flight, consumer):
+        with flight.cond:
+            flight.advance(consumer)
+        with self._lock:
+            flight.consumers -= 1
+            if flight.consumers > 0:
+                return
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        # Last consumer gone: stop the upstream read if it is unfinished
+        if flight.source is not None and not flight.done:
+            flight.source.close()
+        if flight.upstream is not None:
+            flight.upstream.close()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._flights)
+        return stats
+
+
+# ============================================================ reverse proxy
+
+# Headers not passed back to the WebView
+SKIP_RESPONSE_HEADERS = {
+    'transfer-encoding', 'connection', 'strict-transport-security', 'content-security-policy'
+}
+# Dropped as well when the body is rewritten
+BODY_HEADERS = {'content-encoding', 'content-length'}
+# The cache sends its own validators upstream
+CONDITIONAL_HEADERS = ('If-None-Match', 'If-Modified-Since')
+
+
+class ReverseProxy:
+    """
+    Forwards WebView requests to the remote server.
+
+    GETs go through the optional ``ProxyCache`` and concurrent identical
+    GETs share one upstream request; everything else is streamed straight
+    through.
+    """
+
+    def __init__(self, client, base_url, cache=None, timeout=(5, 60), no_coalesce=("/socket.io/",),
+                 rewrite_socketio=True, socketio_monitor=None, prefetch=None):
+        """
+        Args:
+            timeout: (connect, read) timeouts in seconds for upstream calls
+            no_coalesce: Path prefixes whose GETs always get their own
+                upstream request (long-polling, one-shot tokens, ...)
+            rewrite_socketio: Point ``io(window.location.origin`` in HTML at
+                the remote server; not needed when WebSockets are tunnelled
+            socketio_monitor: Optional ``SocketIOMonitor`` fed with
+                long-polling responses
+            prefetch: Optional ``PrefetchBuffer`` filled by ``warm`` and
+                served once to the WebView's first matching GET
+        """
+        self.client = client
+        self.base_url = base_url
+        self.cache = cache
+        self.timeout = timeout
+        self.no_coalesce = tuple(no_coalesce)
+        self.flights = SingleFlight()
+        self.socketio_rewrite = (b'io(window.location.origin', f'io("{base_url}"'.encode()) if rewrite_socketio else None
+        self.socketio_monitor = socketio_monitor
+        self.prefetch = prefetch
+
+    def handle(self, flask_request, path):
+        """Proxy one Flask request; returns a Flask Response"""
+        url = f"{self.base_url}/{path}"
+        qs = flask_request.query_string.decode()
+        if qs:
+            url += f"?{qs}"
+
+        headers = CaseInsensitiveDict()
+        for key, value in flask_request.headers:
+            if key.lower() not in ('host', 'content-length'):
+                headers[key] = value
+        # Only ask for encodings we can undo if an HTML rewrite is needed
+        accepted = [e.strip() for e in headers.get('Accept-Encoding', '').split(',')]
+        headers['Accept-Encoding'] = ', '.join(
+            e for e in accepted if e.split(';')[0].strip().lower() in DECODABLE_ENCODINGS
+        ) or 'identity'
+
+        body = request_body(flask_request)
+        try:
+            if flask_request.method == 'GET' and body is None:
+                warmed = self.prefetch.take(url, headers) if self.prefetch is not None else None
+                if warmed is not None:
+                    status, warmed_headers, warmed_body = warmed
+                    return self._build(status, CaseInsensitiveDict(warmed_headers), [warmed_body],
+                                       extra_headers=[('X-Cache', 'PREFETCH')])
+                coalesce = not ('/' + path).startswith(self.no_coalesce)
+                if self.cache is not None:
+                    response = self._cached_get(url, headers, coalesce)
+                else:
+                    response = self._response(*self._fetch(url, headers, coalesce=coalesce))
+                if self.socketio_monitor is not None and path.startswith('socket.io/'):
+                    response.response = self.socketio_monitor.observe_polling(
+                        response.response, response.headers.get('Content-Encoding'), decode_chunks
+                    )
+                return response
+
+            resp = self._send(flask_request.method, url, headers, body)
+            return self._response(resp, stream_response(resp))
+        except CircuitOpenError as e:
+            # Server known to be down (and nothing cached): answer at once
+            retry_after = (self.client.breaker.get_status()["next_probe_in"] or 1) if self.client.breaker else 1
+            return Response(str(e), 503, [('Retry-After', str(int(retry_after) + 1)), ('X-Cache', 'MISS')],
+                            mimetype='text/plain')
+
+    def warm(self, path):
+        """
+        GET ``path`` ahead of the WebView and keep the body in ``prefetch``.
+
+        Returns ``(status, headers, body, source)``; the body is as received
+        (still compressed). A fresh cache entry is read from disk instead.
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        headers = CaseInsensitiveDict({'Accept': '*/*', 'Accept-Encoding': ', '.join(DECODABLE_ENCODINGS)})
+        entry = self.cache.lookup(url, headers) if self.cache is not None else None
+        if entry is not None and entry.is_fresh():
+            status, resp_headers, source = entry.status, CaseInsensitiveDict(entry.headers), 'cache'
+            body = b''.join(self.cache.read_body(entry))
+        else:
+            upstream, chunks = self._fetch(url, headers, coalesce=True)
+            try:
+                body = b''.join(chunks)  # also completes the cache store
+            finally:
+                upstream.close()
+            status, resp_headers, source = upstream.status_code, upstream.headers, 'upstream'
+        if self.prefetch is not None:
+            self.prefetch.put(url, status, resp_headers, body)
+        return status, resp_headers, body, source
+
+    def _send(self, method, url, headers, body=None):
+        return self.client.request(
+            method=method,
+            url=url,
+            headers=headers,
+            data=body,
+            allow_redirects=False,
+            timeout=self.timeout,
+            stream=True
+        )
+
+    def _response(self, upstream, chunks, extra_headers=()):
+        """Flask Response streaming ``chunks`` for an upstream response"""
+        response = self._build(upstream.status_code, upstream.headers, chunks, extra_headers)
+        # Also runs when the client goes away before the body was read,
+        # so the connection always returns to the pool
+        response.call_on_close(upstream.close)
+        return response
+
+    def _build(self, status, upstream_headers, chunks, extra_headers=()):
+        resp_headers = [(k, v) for k, v in upstream_headers.items() if k.lower() not in SKIP_RESPONSE_HEADERS]
+        if self.socketio_rewrite and 'text/html' in upstream_headers.get('Content-Type', ''):
+            # Only HTML is rewritten, so only HTML is decompressed; everything
+            # else goes to the WebView with its original Content-Encoding
+            chunks = decode_chunks(chunks, upstream_headers.get('Content-Encoding'))
+            chunks = rewrite_chunks(chunks, *self.socketio_rewrite)
+            resp_headers = [(k, v) for k, v in resp_headers if k.lower() not in BODY_HEADERS]
+        resp_headers.extend(extra_headers)
+        # Not direct_passthrough: that bypasses the close callbacks
+        return Response(chunks, status, resp_headers)
+
+    # ------------------------------------------------------------------ cache
+
+    def _cached_get(self, url, headers, coalesce=True):
+        cache = self.cache
+        request_cc = parse_cache_control(headers.get('Cache-Control'))
+        if 'no-store' in request_cc:
+            return self._response(*self._fetch(url, headers, coalesce=coalesce))
+
+        entry = cache.lookup(url, headers)
+        if entry is None:
+            cache.count("misses")
+            return self._response(*self._fetch(url, headers, coalesce=coalesce),
+                                  extra_headers=[('X-Cache', 'MISS')])
+
+        client_revalidates = 'no-cache' in request_cc or request_cc.get('max-age') == '0' \
+            or 'no-cache' in headers.get('Pragma', '')
+        if entry.is_fresh() and not client_revalidates:
+            cache.count("hits")
+            return self._serve_entry(entry, headers, 'HIT')
+
+        if not client_revalidates and cache.serve_stale_while_revalidate(entry):
+            cache.count("stale_served")
+            if cache.start_revalidation(url):
+                threading.Thread(target=self._revalidate_in_background, args=(url, headers, entry, coalesce),
+                                 name="proxy-revalidate", daemon=True).start()
+            return self._serve_entry(entry, headers, 'STALE', stale=True)
+
+        try:
+            return self._revalidate(url, headers, entry, coalesce)
+        except requests.RequestException as e:
+            if cache.serve_stale_on_error(entry):
+                print(f"⚠️ Proxy: serving stale /{url.split('/', 3)[-1]} ({e})")
+                cache.count("stale_on_error")
+                return self._serve_entry(entry, headers, 'STALE', stale=True)
+            raise
+
+    def _fetch(self, url, headers, validators=None, coalesce=True):
+        """
+        GET from upstream, storing the body in the cache while it streams.
+
+        Returns ``(upstream, chunks)``; ``upstream`` has ``status_code``,
+        ``headers`` and ``close()``.
+        """
+        upstream_headers = CaseInsensitiveDict(headers)
+        if self.cache is not None:
+            # The cache sends its own validators upstream
+            for name in CONDITIONAL_HEADERS:
+                upstream_headers.pop(name, None)
+            upstream_headers.update(validators or {})
+
+        def start():
+            resp = self._send('GET', url, upstream_headers)
+            chunks = stream_response(resp)
+            if self.cache is not None and self.cache.is_storable('GET', headers, resp.status_code, resp.headers):
+                chunks = self.cache.store(url, headers, resp.status_code, resp.headers, chunks)
+            return resp, chunks
+
+        if not coalesce:
+            return start()
+        return self.flights.fetch(SingleFlight.key_for(url, upstream_headers), start)
+
+    def _revalidate(self, url, headers, entry, coalesce=True):
+        resp, chunks = self._fetch(url, headers, entry.validators, coalesce)
+        if resp.status_code == 304:
+            resp.close()
+            self.cache.refresh(entry, resp.headers)
+            self.cache.count("revalidated")
+            return self._serve_entry(entry, headers, 'REVALIDATED')
+        if resp.status_code >= 500 and self.cache.serve_stale_on_error(entry):
+            resp.close()
+            self.cache.count("stale_on_error")
+            return self._serve_entry(entry, headers, 'STALE', stale=True)
+        return self._response(resp, chunks, extra_headers=[('X-Cache', 'MISS')])
+
+    def _revalidate_in_background(self, url, headers, entry, coalesce=True):
+        try:
+            resp, chunks = self._fetch(url, headers, entry.validators, coalesce)
+            try:
+                if resp.status_code == 304:
+                    self.cache.refresh(entry, resp.headers)
+                    self.cache.count("revalidated")
+                else:
+                    for _ in chunks:  # drain so the new body is stored
+                        pass
+            finally:
+                resp.close()
+        except Exception as e:
+            print(f"⚠️ Proxy background revalidation failed for {url}: {e}")
+        finally:
+            self.cache.end_revalidation(url)
+
+    def _serve_entry(self, entry, headers, state, stale=False):
+        extra = [('Age', str(int(entry.age()))), ('X-Cache', state)]
+        if stale:
+            extra.append(('Warning', '110 - "Response is Stale"'))
+        etag = entry.header('ETag')
+        if etag and etag in [t.strip() for t in headers.get('If-None-Match', '').split(',')]:
+            not_modified = [(k, v) for k, v in entry.headers if k.lower() not in SKIP_RESPONSE_HEADERS]
+            return Response(status=304, headers=not_modified + extra)
+        return self._build(entry.status, CaseInsensitiveDict(entry.headers),
+                           self.cache.read_body(entry), extra_headers=extra)
@@ -0,0 +1,328 @@
+"""
+WebSocket Tunnel and Socket.IO Monitor
+
+Lets the order-reception page keep its Socket.IO connection on the local
+server (``io(window.location.origin)``) instead of being rewritten to
+talk to BASE_URL directly:
+
+- WebSocket upgrades are relayed byte-for-byte to the remote server over
+  one upstream socket per connection (needs a werkzeug-based backend,
+  which exposes the raw client socket)
+- Long-polling requests already go through ``reverse_proxy``
+
+Socket.IO events seen on either transport are recorded with local
+receive timestamps, so the order feed's latency can be measured.
+"""
+
+import json
+import selectors
+import socket
+import ssl
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from urllib.parse import urlsplit
+
+# Timestamp fields looked up in event payloads for latency measurement
+TIMESTAMP_FIELDS = ("timestamp", "created_at", "createdAt", "sent_at", "sentAt", "time")
+MAX_MONITORED_FRAME = 1024 * 1024
+
+
+def _event_time(data):
+    """Epoch seconds from a payload timestamp field, or None"""
+    if not isinstance(data, dict):
+        return None
+    for field in TIMESTAMP_FIELDS:
+        value = data.get(field)
+        if isinstance(value, (int, float)) and value > 0:
+            return value / 1000 if value > 1e12 else float(value)
+        if isinstance(value, str):
+            try:
+                return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+            except ValueError:
+                continue
+    return None
+
+
+class SocketIOMonitor:
+    """Counts Socket.IO events and their delivery latency"""
+
+    def __init__(self, recent=20, samples=200):
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.total_connections = 0
+        self.events = 0
+        self.by_event = {}
+        self.recent = deque(maxlen=recent)
+        self.latencies = deque(maxlen=samples)
+
+    def connection_opened(self):
+        with self._lock:
+            self.connections += 1
+            self.total_connections += 1
+
+    def connection_closed(self):
+        with self._lock:
+            self.connections -= 1
+
+    def record_packet(self, text, transport):
+        """Record one Engine.IO packet if it is a Socket.IO EVENT ("42...")"""
+        if not text.startswith("42"):
+            return
+        body = text[2:]
+        if body.startswith("/"):
+            body = body.partition(",")[2]  # namespace
+        body = body.lstrip("0123456789")  # ack id
+        try:
+            packet = json.loads(body)
+        except ValueError:
+            return
+        if not isinstance(packet, list) or not packet:
+            return
+
+        received_at = time.time()
+        sent_at = _event_time(packet[1]) if len(packet) > 1 else None
+        latency_ms = round((received_at - sent_at) * 1000, 1) if sent_at else None
+        if latency_ms is not None and not 0 <= latency_ms < 24 * 3600 * 1000:
+            latency_ms = None  # clock skew or an unrelated field
+
+        event = str(packet[0])
+        with self._lock:
+            self.events += 1
+            self.by_event[event] = self.by_event.get(event, 0) + 1
+            self.recent.append({"event": event, "transport": transport,
+                                "received_at": received_at, "latency_ms": latency_ms})
+            if latency_ms is not None:
+                self.latencies.append(latency_ms)
+
+    def observe_polling(self, chunks, content_encoding=None, decode=None):
+        """Pass a long-polling response body through, recording its packets"""
+        body = bytearray()
+        try:
+            for chunk in chunks:
+                if len(body) < MAX_MONITORED_FRAME:
+                    body += chunk
+                yield chunk
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+        if len(body) >= MAX_MONITORED_FRAME:
+            return
+        try:
+            raw = b"".join(decode([bytes(body)], content_encoding)) if decode and content_encoding else bytes(body)
+            # Engine.IO v4 separates packets with a record separator
+            for packet in raw.decode("utf-8").split("\x1e"):
+                self.record_packet(packet, "polling")
+        except Exception as e:
+            # Monitoring must never break the order feed
+            print(f"⚠️ Socket.IO monitor: cannot parse polling body: {e}")
+
+    def get_stats(self):
+        with self._lock:
+            ordered = sorted(self.latencies)
+            latency = None
+            if ordered:
+                latency = {
+                    "samples": len(ordered),
+                    "avg": round(sum(ordered) / len(ordered), 1),
+                    "p50": ordered[len(ordered) // 2],
+                    "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                }
+            return {
+                "connections": self.connections,
+                "total_connections": self.total_connections,
+                "events": self.events,
+                "by_event": dict(self.by_event),
+                "latency_ms": latency,
+                "recent": list(self.recent),
+            }
+
+
+class _FrameReader:
+    """Incremental WebSocket frame parser for the server -> client direction"""
+
+    def __init__(self, on_text):
+        self.on_text = on_text
+        self.buffer = bytearray()
+        self.message = None
+        self.disabled = False
+
+    def feed(self, data):
+        if self.disabled:
+            return
+        self.buffer += data
+        buf = self.buffer
+        while len(buf) >= 2:
+            fin = buf[0] & 0x80
+            opcode = buf[0] & 0x0F
+            masked = buf[1] & 0x80
+            length = buf[1] & 0x7F
+            pos = 2
+            if length == 126:
+                if len(buf) < 4:
+                    return
+                length = int.from_bytes(buf[2:4], "big")
+                pos = 4
+            elif length == 127:
+                if len(buf) < 10:
+                    return
+                length = int.from_bytes(buf[2:10], "big")
+                pos = 10
+            if length > MAX_MONITORED_FRAME:
+                # Too big to be an order event: stop watching this connection
+                self.disabled = True
+                buf.clear()
+                return
+            mask = None
+            if masked:
+                if len(buf) < pos + 4:
+                    return
+                mask = buf[pos:pos + 4]
+                pos += 4
+            if len(buf) < pos + length:
+                return
+            payload = bytes(buf[pos:pos + length])
+            del buf[:pos + length]
+            if mask:
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+            if opcode == 1:
+                self.message = payload
+            elif opcode == 0 and self.message is not None:
+                self.message += payload
+            else:
+                continue  # binary and control frames
+            if fin:
+                message, self.message = self.message, None
+                try:
+                    self.on_text(message.decode("utf-8"))
+                except UnicodeDecodeError:
+                    pass
+
+
+class WebSocketTunnel:
+    """WSGI middleware that relays WebSocket upgrades to the remote server"""
+
+    # Frames must stay uncompressed to be observed
+    DROPPED_HEADERS = {"host", "sec-websocket-extensions", "content-length"}
+
+    def __init__(self, app, base_url, monitor=None, connect_timeout=5):
+        self.app = app
+        self.base_url = base_url
+        self.monitor = monitor
+        self.connect_timeout = connect_timeout
+        parts = urlsplit(base_url)
+        self.secure = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.secure else 80)
+        self.host_header = parts.netloc
+
+    def __call__(self, environ, start_response):
+        if environ.get("HTTP_UPGRADE", "").lower() != "websocket":
+            return self.app(environ, start_response)
+        client = environ.get("werkzeug.socket")
+        if client is None:
+            start_response("501 Not Implemented", [("Content-Type", "text/plain")])
+            return [b"WebSocket tunnelling needs the threadpool or development server\n"]
+
+        try:
+            upstream = self._open_upstream(environ)
+        except OSError as e:
+            print(f"❌ WebSocket tunnel: cannot reach {self.host_header}: {e}")
+            start_response("502 Bad Gateway", [("Content-Type", "text/plain")])
+            return [f"WebSocket upstream error: {e}\n".encode()]
+
+        if self.monitor:
+            self.monitor.connection_opened()
+        print(f"🔗 WebSocket tunnel opened: {environ.get('PATH_INFO')}")
+        try:
+            # Frames the page sent right after the handshake may already
+            # sit in the server's read buffer rather than in the socket
+            pending = self._buffered_input(environ, client)
+            if pending:
+                upstream.sendall(pending)
+            self._relay(client, upstream)
+        except OSError:
+            pass
+        finally:
+            upstream.close()
+            if self.monitor:
+                self.monitor.connection_closed()
+            print("🔗 WebSocket tunnel closed")
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        # The connection now belongs to the tunnel: werkzeug treats this as
+        # a dropped client and writes no HTTP response of its own
+        raise ConnectionError("WebSocket tunnel finished")
+
+    def _open_upstream(self, environ):
+        sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.secure:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+
+        path = environ.get("RAW_URI") or environ.get("PATH_INFO", "/")
+        if "?" not in path and environ.get("QUERY_STRING"):
+            path += "?" + environ["QUERY_STRING"]
+        lines = [f"GET {path} HTTP/1.1", f"Host: {self.host_header}"]
+        for key, value in environ.items():
+            if key.startswith("HTTP_"):
+                name = key[5:].replace("_", "-").title()
+                if name.lower() not in self.DROPPED_HEADERS:
+                    lines.append(f"{name}: {value}")
+        sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        sock.settimeout(None)
+        return sock
+
+    @staticmethod
+    def _buffered_input(environ, client):
+        rfile = environ.get("wsgi.input")
+        if rfile is None or not hasattr(rfile, "read1"):
+            return b""
+        client.setblocking(False)
+        try:
+            return rfile.read1(65536) or b""
+        except (BlockingIOError, OSError):
+            return b""
+        finally:
+            client.setblocking(True)
+
+    def _relay(self, client, upstream):
+        client.settimeout(None)
+        reader = _FrameReader(lambda text: self.monitor.record_packet(text, "websocket")) if self.monitor else None
+        handshake = bytearray()  # upstream bytes until the end of the 101 headers
+        selector = selectors.DefaultSelector()
+        selector.register(client, selectors.EVENT_READ, upstream)
+        selector.register(upstream, selectors.EVENT_READ, client)
+        try:
+            while True:
+                for key, _ in selector.select():
+                    source, target = key.fileobj, key.data
+                    while True:
+                        try:
+                            data = source.recv(65536)
+                        except (ssl.SSLWantReadError, BlockingIOError):
+                            break
+                        if not data:
+                            return
+                        target.sendall(data)
+                        if reader is not None and source is upstream:
+                            if handshake is not None:
+                                handshake += data
+                                end = handshake.find(b"\r\n\r\n")
+                                if end >= 0:
+                                    reader.feed(bytes(handshake[end + 4:]))
+                                    handshake = None
+                            else:
+                                reader.feed(data)
+                        # TLS: records already decrypted into the SSL buffer do not
+                        # make the socket readable again, so read them now
+                        if not isinstance(source, ssl.SSLSocket) or not source.pending():
+                            break
+        except OSError:
+            return
+        finally:
+            selector.close()